@@ -1,16 +1,43 @@
 import eventlet
 eventlet.monkey_patch()
+from eventlet import tpool
 import os
+import sys
 import threading
 import socket
 import json
+import csv
+import hashlib
+import hmac
+import io
+from collections import deque, namedtuple
+from itertools import islice
 from datetime import datetime
+from urllib.parse import urlencode
 import time
 import sqlite3
-from flask import Flask, send_from_directory, request, jsonify
-from flask_socketio import SocketIO, emit
+import logging
+import signal
+from flask import Flask, send_from_directory, request, jsonify, Response
+from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_cors import CORS
 
+from framing import NegotiatingFramer
+import heartbeat
+from liveness import LivenessTracker
+import cluster
+import journal
+import logpipe
+import metrics
+from outbound import OutboundQueue
+import profiling
+import recording
+from ratelimit import DenyList, PressLimiter
+import snapshot
+from static_assets import StaticAssets
+import stats
+import wire
+
 
 # -----------------------------------------------------------------------------
 # Configuration
@@ -19,14 +46,191 @@ from flask_cors import CORS
 # TCP Server configuration
 TCP_HOST = '0.0.0.0'
 TCP_PORT = 8080
+TCP_LISTEN_BACKLOG = 1024  # Pending connections the kernel queues for accept()
+TCP_ACCEPT_BATCH = 64  # Connections accepted per wakeup by the selector engine
+# Unregistered addresses: after DENY_AFTER_REJECTIONS refused connections within
+# DENY_WINDOW_S seconds an address is denied for DENY_SECONDS. Its connections
+# are then closed right after accept() and reported once per summary interval
+# instead of logged one by one. Set DENY_AFTER_REJECTIONS = None to disable.
+DENY_AFTER_REJECTIONS = 5
+DENY_WINDOW_S = 10
+DENY_SECONDS = 60
+TCP_RECV_SIZE = 16384  # Bytes read per recv() from a device socket
+MAX_FRAME_LENGTH = 4096  # Longer device messages are dropped instead of buffered
+
+# Outbound messages: each device connection has a queue of at most this many
+# messages, drained by its own writer. When it is full, 'drop_oldest' discards
+# the oldest queued message and 'disconnect' drops the slow device instead.
+OUTBOUND_QUEUE_SIZE = 64
+OUTBOUND_FULL_POLICY = 'drop_oldest'
+
+# Device ingest engine: 'greenlet' runs one eventlet greenlet per device
+# connection, 'selector' multiplexes all device sockets on a single epoll loop
+# (Linux only; other platforms fall back to 'greenlet').
+INGEST_ENGINE = 'greenlet'
 
 DATABASE = 'devices.db'
 
+# Warm restart: alarms, sound choices, counters and the log buffer are written
+# to SNAPSHOT_FILE every SNAPSHOT_INTERVAL_S seconds and on shutdown, and restored
+# at startup unless the snapshot is older than SNAPSHOT_MAX_AGE_S. Single-process
+# mode only; set SNAPSHOT_FILE = None to disable. On SIGTERM/SIGINT connected
+# devices get up to SHUTDOWN_DRAIN_S seconds to receive their queued messages.
+SNAPSHOT_FILE = 'runtime_snapshot.json'
+SNAPSHOT_INTERVAL_S = 5
+SNAPSHOT_MAX_AGE_S = 24 * 3600
+SHUTDOWN_DRAIN_S = 2
+
+# Device API: GET /api/devices returns at most DEVICE_PAGE_MAX devices per page
+# (all of them when no limit is given); one bulk import takes at most
+# BULK_MAX_ROWS rows.
+DEVICE_PAGE_MAX = 1000
+BULK_MAX_ROWS = 50000
+
+# Liveness watchdog: a device that sends no message for this many seconds is
+# disconnected. Per-device overrides live in the devices.liveness_timeout column.
+DEVICE_TIMEOUT_SECONDS = 30
+
+# Heartbeat: the server pings each device with {"type": "ping", "seq": n} and
+# measures the round trip to its {"type": "pong", "seq": n}. The interval adapts
+# between HEARTBEAT_MIN_INTERVAL_S (new, missing or degraded links) and
+# HEARTBEAT_MAX_INTERVAL_S (healthy links). A link is flagged degraded when its
+# recent RTT rises above DEGRADED_RTT_FACTOR times its baseline (and by at least
+# DEGRADED_RTT_MIN_MS), and unresponsive after HEARTBEAT_MISSED_LIMIT missed pongs
+# in a row. The clients table gets fresh RTT figures every HEARTBEAT_REPORT_S.
+# Keep HEARTBEAT_MAX_INTERVAL_S below DEVICE_TIMEOUT_SECONDS so pongs keep idle
+# devices alive.
+HEARTBEAT_ENABLED = True
+HEARTBEAT_MIN_INTERVAL_S = 2
+HEARTBEAT_MAX_INTERVAL_S = 16
+HEARTBEAT_MISSED_LIMIT = 2
+HEARTBEAT_REPORT_S = 30
+DEGRADED_RTT_FACTOR = 3.0
+DEGRADED_RTT_MIN_MS = 50
+
+# TCP keep-alive only backs up the heartbeat for peers that vanished without a
+# FIN (power loss, unplugged access point): first probe after this many idle
+# seconds, then every TCP_KEEPALIVE_INTERVAL_S, given up after TCP_KEEPALIVE_COUNT.
+TCP_KEEPALIVE_IDLE_S = 30
+TCP_KEEPALIVE_INTERVAL_S = 10
+TCP_KEEPALIVE_COUNT = 3
+
+# Button press limiting: each device may trigger PRESS_BURST alarms in a row,
+# then PRESS_RATE_PER_SECOND on average, and never two within PRESS_DEBOUNCE_MS.
+# The first press is never delayed. Presses beyond that are dropped and logged
+# as one summary per device every PRESS_SUMMARY_INTERVAL_S seconds. Set
+# PRESS_RATE_PER_SECOND = None to act on every press.
+PRESS_RATE_PER_SECOND = 0.5
+PRESS_BURST = 5
+PRESS_DEBOUNCE_MS = 250
+PRESS_SUMMARY_INTERVAL_S = 10
+
+# UI update coalescing: device changes that arrive within this window (in
+# milliseconds) are merged and pushed to the web clients as a single batch.
+UI_UPDATE_COALESCE_MS = 50
+
+# Dashboard: the status and the windowed statistics (messages per second over
+# MESSAGE_RATE_WINDOW_S, presses, connects and disconnects per minute over
+# ACTIVITY_WINDOW_S, and the DASHBOARD_TOP_DEVICES noisiest devices) are pushed
+# to the web clients every DASHBOARD_TICK_MS if they changed, however many
+# events arrive in between.
+DASHBOARD_TICK_MS = 1000
+MESSAGE_RATE_WINDOW_S = 10
+ACTIVITY_WINDOW_S = 60
+DASHBOARD_TOP_DEVICES = 5
+
+# Log ring buffer: the most recent LOG_BUFFER_SIZE entries are kept in memory.
+# A web client gets at most LOG_PAGE_SIZE entries per request.
+LOG_BUFFER_SIZE = 5000
+LOG_PAGE_SIZE = 200
+
+# Event journal: structured events (presses, alarms, connects, ...) are queued in
+# memory and written to the events table in one transaction per interval.
+EVENT_FLUSH_INTERVAL_MS = 250
+EVENT_QUEUE_LIMIT = 100000  # Events beyond this many unwritten ones are dropped
+EVENT_PAGE_SIZE = 100  # Default page size of /api/events
+EVENT_PAGE_MAX = 1000
+
+# Metrics: hot-path timings and counters exposed at /metrics in the Prometheus
+# text format. With False the instrumentation is not installed and /metrics is 404.
+METRICS_ENABLED = True
+
+# Diagnostics (see profiling.py): /api/admin/profile samples the event loop for a
+# few seconds, and device messages taking SLOW_EVENT_THRESHOLD_MS or longer are
+# kept with a breakdown of where the time went (None turns this off; adjustable
+# via /api/admin/slow-events). The /api/admin endpoints need the ADMIN_TOKEN as
+# a bearer token, or come from localhost if it is None.
+ADMIN_TOKEN = None
+PROFILE_MAX_SECONDS = 60
+PROFILE_INTERVAL_MS = 5
+SLOW_EVENT_THRESHOLD_MS = 100
+SLOW_EVENT_BUFFER = 200  # Slow events kept in memory
+
+# Traffic recording: with TRAFFIC_RECORDING on, the bytes received from every
+# device and its connects and disconnects are written to TRAFFIC_RECORD_FILE,
+# which benchmarks/replay.py replays offline (see recording.py). It can also be
+# switched on and off at runtime through /api/admin/recording.
+TRAFFIC_RECORDING = False
+TRAFFIC_RECORD_FILE = 'traffic.ndjson'
+
+# Logging: each subsystem logs at its own level. Records are queued and written
+# to stdout (and LOG_FILE if set) every LOG_FLUSH_INTERVAL_MS by a background
+# writer, as 'text' lines or 'json' objects. Records at UI_LOG_LEVEL or above
+# also appear in the web UI's log view. Raw frames are traced at DEBUG only for
+# the device ids in LOG_TRACE_DEVICES (adjustable at runtime via /api/logging).
+LOG_LEVELS = {
+    'server': 'INFO',  # Startup and the TCP server lifecycle
+    'db': 'INFO',  # Database and device registry
+    'tcp': 'INFO',  # Device connections
+    'ingest': 'INFO',  # Device messages
+    'frames': 'DEBUG',  # Raw frame tracing
+    'alarm': 'INFO',  # Alarms and sounds
+    'web': 'INFO',  # Web UI and REST API actions
+    'journal': 'INFO',
+    'metrics': 'INFO',
+    'cluster': 'INFO',  # Multi-process supervisor and message bus
+}
+UI_LOG_LEVEL = 'INFO'
+LOG_TRACE_DEVICES = set()
+LOG_FORMAT = 'text'
+LOG_FILE = None
+LOG_FLUSH_INTERVAL_MS = 100
+LOG_QUEUE_LIMIT = 10000  # Records beyond this many unwritten ones are dropped
+
+# Web server (Flask + Socket.IO) address
+HTTP_HOST = '0.0.0.0'
+HTTP_PORT = 5000
+
+# Multi-process mode: with WORKERS > 1, running app.py starts a supervisor that
+# runs WORKERS backend processes. They share the device and HTTP ports through
+# SO_REUSEPORT (Linux) and exchange state changes and Socket.IO events over a
+# local message bus on BUS_HOST:BUS_PORT. The ports are not sticky, so web
+# clients must use the WebSocket transport (the frontend does).
+WORKERS = 1
+BUS_HOST = '127.0.0.1'
+BUS_PORT = 5055
+
+# Static files: the built frontend (frontend/dist) is indexed at startup and
+# served from memory, with gzip/brotli variants and cache headers (see
+# static_assets.py). Files larger than STATIC_CACHE_MAX_BYTES are read from disk
+# per request. Rebuilding the frontend requires a backend restart.
+STATIC_CACHE_MAX_BYTES = 1 << 20
+
 # Flask & WebSocket configuration
-app = Flask(__name__, static_folder='../frontend/dist', static_url_path='/')
+# Flask's own static route is disabled; serve_static_files() serves the build
+app = Flask(__name__, static_folder=None)
 CORS(app)  # Allow cross-origin requests for React dev server
-
-socketio = SocketIO(app, cors_allowed_origins="*")
+FRONTEND_DIST = os.path.join(app.root_path, '..', 'frontend', 'dist')
+static_assets = StaticAssets(FRONTEND_DIST, STATIC_CACHE_MAX_BYTES)
+
+# Set only in a worker process started by the cluster supervisor
+CLUSTER_WORKER, _bus_address = cluster.worker_from_environ()
+cluster_bus = None
+if CLUSTER_WORKER is not None:
+    cluster_bus = cluster.Bus(_bus_address, on_lost=lambda: _on_bus_lost())
+    socketio = SocketIO(app, cors_allowed_origins="*", client_manager=cluster.BusManager(cluster_bus))
+else:
+    socketio = SocketIO(app, cors_allowed_origins="*")
 
 # -----------------------------------------------------------------------------
 # Database Management
@@ -34,7 +238,12 @@ socketio = SocketIO(app, cors_allowed_origins="*")
 
 def get_db_connection():
     """Establishes a connection to the SQLite database."""
-    conn = sqlite3.connect(DATABASE)
+    if _timed_connection is not None:
+        started = time.perf_counter()
+        conn = sqlite3.connect(DATABASE, factory=_timed_connection)
+        DB_CONNECT_SECONDS.observe(time.perf_counter() - started)
+    else:
+        conn = sqlite3.connect(DATABASE)
     conn.row_factory = sqlite3.Row
     return conn
 
@@ -48,197 +257,1205 @@ def init_db():
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 name TEXT NOT NULL,
                 ip TEXT NOT NULL UNIQUE,
-                mac TEXT
+                mac TEXT,
+                liveness_timeout REAL,
+                zone TEXT,
+                tags TEXT
             )
         ''')
+        # Databases created before a column existed are migrated in place
+        columns = {row['name'] for row in cursor.execute('PRAGMA table_info(devices)')}
+        for column, column_type in (('liveness_timeout', 'REAL'), ('zone', 'TEXT'), ('tags', 'TEXT')):
+            if column not in columns:
+                cursor.execute(f'ALTER TABLE devices ADD COLUMN {column} {column_type}')
+        cursor.execute('CREATE INDEX IF NOT EXISTS devices_name ON devices (name)')  # Bulk upserts look up by name
+        journal.init_schema(conn)  # Also switches the database to WAL mode
         conn.commit()
         conn.close()
-        print("[DB] Database initialized.")
+        db_log.info("Database initialized.")
 
 
 # -----------------------------------------------------------------------------
 # State Management (Replaces Tkinter class variables)
 # -----------------------------------------------------------------------------
 
-# A thread-safe way to store application state
+class DeviceView(namedtuple('DeviceView', (
+    'socket', 'outbox', 'ip', 'mac', 'led_state', 'alarming', 'last_seen', 'sound', 'messages', 'presses', 'token',
+))):
+    """
+    An immutable snapshot of one device's runtime state. Writers publish a new
+    view for every change, so a reader that grabbed one sees a consistent version
+    of all fields without taking any lock.
+    """
+    __slots__ = ()
+
+    @property
+    def connected(self):
+        return self.socket is not None
+
+    @property
+    def effective_led_state(self):
+        """
+        The LED state the UI should show. A disconnected device shows 'off', unless
+        its alarm is still active: that stays visible until someone resets it.
+        """
+        if self.socket is not None:
+            return self.led_state
+        return 'alarm' if self.alarming else 'off'
+
+
+_NEW_DEVICE_VIEW = DeviceView(
+    socket=None,  # Active connection, None while disconnected
+    outbox=None,  # OutboundQueue of the active connection
+    ip=None,
+    mac=None,
+    led_state='off',  # 'connected' / 'alarm' while connected
+    alarming=False,
+    last_seen=None,  # time.time() of the last application message
+    sound=None,  # Alarm sound for this device, None uses the global sound
+    messages=0,  # Application messages received
+    presses=0,  # Button presses received
+    token=None,  # Cluster-wide id of the active connection (multi-process mode)
+)
+
+
+class DeviceState:
+    """
+    Runtime state of one registered device, stored in state['device_states'].
+    Records outlive connections so alarm flags, sound preferences and counters
+    survive a reconnect. The state is copy-on-write: readers use view as is,
+    writers hold the device's own lock for the read-modify-write and publish a
+    new view. No other lock is taken while a device lock is held.
+    """
+    __slots__ = ('device_id', 'lock', 'view')
+
+    def __init__(self, device_id):
+        self.device_id = device_id
+        self.lock = threading.Lock()
+        self.view = _NEW_DEVICE_VIEW
+
+    def update(self, **fields):
+        """Publishes a view with fields changed. Caller must hold the device's lock."""
+        self.view = self.view._replace(**fields)
+
+
+# A thread-safe way to store application state. Each lock guards only the keys
+# listed with it and is never held across I/O (emits, socket calls, prints, DB).
 state = {
     'tcp_server_running': False,
     'tcp_server_socket': None,
-    'clients': {},  # {client_id: {'socket': socket, 'ip': ip, 'mac': 'N/A', ...}}
-    'led_states': {},  # {client_id: 'on'/'off'}
-    'alarming_clients': {}, # {client_id: True/False}
-    'logs': [],
-    'client_counter': 0,
+    'device_states': {},  # {client_id: DeviceState}, copy-on-write; replaced under 'lock'
+    'log_lock': threading.Lock(),  # Guards 'logs' and 'log_seq'
+    'logs': deque(maxlen=LOG_BUFFER_SIZE),  # Ring buffer of log entries, oldest first
+    'log_seq': 0,  # Sequence number of the newest log entry
+    'log_pipeline': logpipe.LogPipeline(  # Queue behind every subsystem logger, see log_writer
+        LOG_QUEUE_LIMIT,
+        [sys.stdout] + ([open(LOG_FILE, 'a', encoding='utf-8')] if LOG_FILE else []),
+        logpipe.StructuredFormatter(LOG_FORMAT),
+    ),
+    'ui_log_level': logpipe.level_number(UI_LOG_LEVEL),
+    'trace_devices': set(LOG_TRACE_DEVICES),  # Device ids whose raw frames are logged
     'message_count': 0,
+    'stats': stats.StatsEngine(MESSAGE_RATE_WINDOW_S, ACTIVITY_WINDOW_S, ACTIVITY_WINDOW_S),  # See dashboard_ticker
     'last_activity_time': None,
-    'lock': threading.RLock(),
-    'last_seen': {},
+    'lock': threading.RLock(),  # Guards writes to 'device_states', the server, counter and sound keys
+    'liveness': LivenessTracker(DEVICE_TIMEOUT_SECONDS),  # Per-device deadlines for the watchdog
+    'heartbeat': heartbeat.HeartbeatMonitor(  # Ping schedule and RTT statistics, see heartbeat_sender
+        HEARTBEAT_MIN_INTERVAL_S, HEARTBEAT_MAX_INTERVAL_S, HEARTBEAT_MISSED_LIMIT,
+        DEGRADED_RTT_FACTOR, DEGRADED_RTT_MIN_MS / 1000.0,
+    ),
+    'press_limiter': PressLimiter(PRESS_RATE_PER_SECOND, PRESS_BURST, PRESS_DEBOUNCE_MS / 1000.0),
+    'deny_list': DenyList(DENY_AFTER_REJECTIONS, DENY_WINDOW_S, DENY_SECONDS),  # Unregistered IPs that keep retrying
+    'journal': journal.EventJournal(DATABASE, EVENT_QUEUE_LIMIT),  # Audit trail, see event_journal_writer
+    'slow_events': profiling.SlowEventTracer(  # Device messages that took too long, see process_esp_frames
+        SLOW_EVENT_THRESHOLD_MS / 1000.0 if SLOW_EVENT_THRESHOLD_MS is not None else None, SLOW_EVENT_BUFFER,
+    ),
+    'profiler': None,  # The running profiling.SamplingProfiler, if any
+    'recorder': None,  # The active recording.TrafficRecorder, if any; see traffic_record_writer
     'global_selected_sound': 'beep.mp3',
+    'ui_lock': threading.Lock(),  # Guards the change-tracking keys below
+    'ui_version': 0,  # Monotonic counter stamped on every device change
+    'device_versions': {},  # {client_id: version of its last change}
+    'pending_changes': {},  # {client_id: {'id': ..., 'fields': {...}, 'version': n}}
+    'pending_rooms': {},  # {client_id: rooms its pending change goes to}
+    'ui_flush_scheduled': False,
+    'registry_lock': threading.Lock(),  # Serializes registry writers; readers never lock
+    # Copy-on-write registry: {'by_id': {...}, 'by_ip': {...}, 'by_name': {...}} mapping
+    # to device dicts, plus {'rooms': {id: Socket.IO rooms}} and the snapshot's
+    # 'etag', a hash of its contents. Writers build a new
+    # snapshot and swap it in, so a reader that grabbed state['registry'] always
+    # sees one consistent, unchanging version.
+    'registry': {'by_id': {}, 'by_ip': {}, 'by_name': {}, 'rooms': {}, 'etag': hashlib.sha1(b'[]').hexdigest()},
+    'subscriptions': {},  # {Socket.IO sid: Subscription} of this process's web clients
+    # Multi-process mode only; guarded by 'lock'
+    'ownership': cluster.DeviceOwnership(CLUSTER_WORKER),  # Which worker holds each device
+    'remote_leds': {},  # {client_id: LED state} of devices connected to other workers
+    'peer_stats': {},  # {worker: {'message_count': n, 'last_activity': timestamp}}
+    'connection_seq': 0,  # Numbers this worker's connection tokens
 }
 
 # -----------------------------------------------------------------------------
-# TCP Server for ESP32 Devices (Runs in a background thread)
+# Logging
 # -----------------------------------------------------------------------------
 
-def log_and_emit(message, message_type="SERVER"):
-    """Logs a message and emits it to all connected web clients."""
-    timestamp = datetime.now().strftime("%H:%M:%S")
-    log_entry = {
-        'timestamp': timestamp,
-        'message': message,
-        'type': message_type
-    }
-    
-    with state['lock']:
-        state['logs'].append(log_entry)
-        # To avoid growing the log list indefinitely, you might want to cap its size
-        # state['logs'] = state['logs'][-200:]
-    
-    socketio.emit('new_log', log_entry)
+logpipe.configure(state['log_pipeline'], LOG_LEVELS)
+server_log = logpipe.get_logger('server')
+db_log = logpipe.get_logger('db')
+tcp_log = logpipe.get_logger('tcp')
+ingest_log = logpipe.get_logger('ingest')
+frame_log = logpipe.get_logger('frames')
+alarm_log = logpipe.get_logger('alarm')
+web_log = logpipe.get_logger('web')
+journal_log = logpipe.get_logger('journal')
+metrics_log = logpipe.get_logger('metrics')
 
+# -----------------------------------------------------------------------------
+# Metrics
+# -----------------------------------------------------------------------------
 
-def _get_current_client_and_led_states():
-    """Helper function to get the current client list and LED states."""
-    with state['lock']:
-        conn = get_db_connection()
-        devices = conn.execute('SELECT * FROM devices').fetchall()
+metrics_registry = metrics.Registry()
+MESSAGE_SECONDS = metrics_registry.histogram(
+    'esp_message_processing_seconds', 'Time spent decoding and processing one device message.')
+EMITS_PER_MESSAGE = metrics_registry.histogram(
+    'esp_message_socketio_emits', 'Socket.IO emits made while processing one device message.',
+    buckets=(0, 1, 2, 3, 4, 6, 8, 12, 16, 32))
+EMITS_TOTAL = metrics_registry.counter(
+    'socketio_emits_total', 'Socket.IO emits by event name.', ['event'])
+LOCK_WAIT_SECONDS = metrics_registry.histogram(
+    'state_lock_wait_seconds', 'Time spent waiting to acquire a state lock.', labelnames=['lock'])
+LOCK_HOLD_SECONDS = metrics_registry.histogram(
+    'state_lock_hold_seconds', 'Time a state lock was held per acquisition.', labelnames=['lock'])
+DB_CONNECT_SECONDS = metrics_registry.histogram(
+    'db_connect_seconds', 'Time spent opening a SQLite connection in get_db_connection.')
+DB_QUERY_SECONDS = metrics_registry.histogram(
+    'db_query_seconds', 'SQLite statement execution time by SQL verb.', labelnames=['verb'])
+JOURNAL_WRITE_SECONDS = metrics_registry.histogram(
+    'event_journal_write_seconds', 'Time to write one batch of journal events.')
+ACCEPT_SECONDS = metrics_registry.histogram(
+    'tcp_admit_seconds', 'Time from accept() returning to the connection being admitted or rejected.',
+    labelnames=['outcome'])
+DEVICE_RTT_SECONDS = metrics_registry.histogram(
+    'esp_heartbeat_rtt_seconds', 'Round-trip time from a heartbeat ping to its pong.',
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+
+_emit_tracker = metrics.EmitTracker(EMITS_TOTAL)
+_timed_connection = None  # sqlite3.Connection subclass used once metrics are installed
+
+
+def install_metrics():
+    """Wraps the state locks, socketio.emit and the DB connection factory with instrumentation."""
+    global _timed_connection
+    if not METRICS_ENABLED:
+        return
+    for key in list(state):
+        if key.endswith('lock') and not isinstance(state[key], metrics.InstrumentedLock):
+            state[key] = metrics.InstrumentedLock(state[key], key, LOCK_WAIT_SECONDS, LOCK_HOLD_SECONDS)
+    socketio.emit = _emit_tracker.wrap(socketio.emit)
+    _timed_connection = metrics.timed_connection_class(DB_QUERY_SECONDS)
+    metrics_log.info("Instrumentation installed.")
+
+
+def _collect_state_metrics():
+    """Reads the gauges and per-device counters that already live in the state."""
+    devices = [(client_id, view.connected, view.messages, view.presses, view.outbox) for client_id, view in device_views()]
+    events = state['journal']
+    log_pipeline = state['log_pipeline']
+    connected = [device for device in devices if device[1]]
+    links = state['heartbeat'].all_stats()
+    rtt_samples = []
+    for client_id, link in links.items():
+        if link['p50'] is not None:
+            rtt_samples.extend(
+                ({'device': client_id, 'quantile': quantile}, link[key] / 1000.0)
+                for quantile, key in (('0.5', 'p50'), ('0.95', 'p95'), ('0.99', 'p99'))
+            )
+    return [
+        ('esp_devices_connected', 'gauge', 'Devices with an active TCP connection.',
+         [({}, len(connected))]),
+        ('esp_devices_registered', 'gauge', 'Devices in the registry.',
+         [({}, len(state['registry']['by_id']))]),
+        ('esp_device_messages_total', 'counter', 'Application messages received per device.',
+         [({'device': client_id}, messages) for client_id, _, messages, _, _ in devices]),
+        ('esp_device_button_presses_total', 'counter', 'Button presses received per device.',
+         [({'device': client_id}, presses) for client_id, _, _, presses, _ in devices]),
+        ('esp_outbound_queue_depth', 'gauge', 'Messages waiting in a device outbound queue.',
+         [({'device': client_id}, len(outbox)) for client_id, _, _, _, outbox in connected]),
+        ('esp_outbound_dropped_total', 'counter', 'Outbound messages dropped on the current connection.',
+         [({'device': client_id}, outbox.dropped) for client_id, _, _, _, outbox in connected]),
+        ('event_journal_pending', 'gauge', 'Journal events waiting to be written.',
+         [({}, len(events))]),
+        ('event_journal_written_total', 'counter', 'Journal events written to the database.',
+         [({}, events.written)]),
+        ('event_journal_dropped_total', 'counter', 'Journal events dropped because the queue was full.',
+         [({}, events.dropped)]),
+        ('ui_log_buffer_entries', 'gauge', 'Entries in the in-memory log ring buffer.',
+         [({}, len(state['logs']))]),
+        ('log_records_pending', 'gauge', 'Log records waiting to be written.',
+         [({}, len(log_pipeline))]),
+        ('log_records_written_total', 'counter', 'Log records written to the log outputs.',
+         [({}, log_pipeline.written)]),
+        ('log_records_dropped_total', 'counter', 'Log records dropped because the queue was full.',
+         [({}, log_pipeline.dropped)]),
+        ('button_presses_suppressed_total', 'counter', 'Button presses dropped by the per-device rate limit.',
+         [({}, state['press_limiter'].suppressed_total)]),
+        ('esp_slow_events_total', 'counter', 'Device messages that took longer than the slow event threshold.',
+         [({}, state['slow_events'].slow_total)]),
+        ('tcp_connections_denied_total', 'counter', 'Connections closed because the IP is on the deny list.',
+         [({}, state['deny_list'].denied_total)]),
+        ('esp_device_rtt_seconds', 'gauge', 'Heartbeat round-trip time quantiles over the last pongs per device.',
+         rtt_samples),
+        ('esp_device_link_degraded', 'gauge', 'Whether the heartbeat flags the device link as degraded or unresponsive.',
+         [({'device': client_id}, int(link['status'] in (heartbeat.DEGRADED, heartbeat.UNRESPONSIVE)))
+          for client_id, link in links.items() if link['status'] is not None]),
+        ('esp_heartbeat_missed_total', 'counter', 'Heartbeat pings without a pong on the current connection.',
+         [({'device': client_id}, link['missed']) for client_id, link in links.items()]),
+    ]
+
+
+metrics_registry.add_collector(_collect_state_metrics)
+
+# -----------------------------------------------------------------------------
+# Device Registry (In-memory, write-through copy of the devices table)
+# -----------------------------------------------------------------------------
+
+def load_device_registry():
+    """Loads every row of the devices table into the in-memory registry."""
+    conn = get_db_connection()
+    try:
+        rows = conn.execute('SELECT * FROM devices ORDER BY id').fetchall()
+    finally:
         conn.close()
 
-        client_list = []
-        led_states = {}
-        
-        for device in devices:
-            device_id = device['id']
-            is_connected = device_id in state['clients']
-            
-            if is_connected:
-                current_led_state = state['led_states'].get(device_id, 'connected')
-            else:
-                current_led_state = 'off'
-            print("device_id:",device_id," current_led_state:",current_led_state)
-            client_list.append({
-                'id': device_id,
-                'name': device['name'],
-                'ip': device['ip'],
-                'mac': device['mac'],
-                'led_state': current_led_state
-            })
-            led_states[device_id] = current_led_state
+    devices = [_device_from_row(row) for row in rows]
+    with state['registry_lock']:
+        state['registry'] = _build_registry(devices)
+    for device in devices:
+        state['liveness'].set_timeout(device['id'], device.get('liveness_timeout'))
+    db_log.info("Loaded %d devices into the registry.", len(rows))
+
+def _device_from_row(row):
+    """Converts a devices table row to a registry record. Tags are stored comma-separated."""
+    device = dict(row)
+    device['tags'] = device['tags'].split(',') if device.get('tags') else []
+    return device
+
+def _build_registry(devices):
+    """Builds a registry snapshot with its indexes from an iterable of device dicts."""
+    by_id = {device['id']: device for device in sorted(devices, key=lambda device: device['id'])}
+    # Hashing the contents instead of counting versions gives every worker the same ETag
+    content = json.dumps(list(by_id.values()), sort_keys=True, separators=(',', ':'))
+    return {
+        'by_id': by_id,
+        'by_ip': {device['ip']: device for device in by_id.values()},
+        'by_name': {device['name']: device for device in by_id.values()},
+        'rooms': {device_id: device_rooms(device) for device_id, device in by_id.items()},
+        'etag': hashlib.sha1(content.encode()).hexdigest(),
+    }
+
+def registry_put(device):
+    """Inserts or replaces a device in the registry and keeps the indexes in sync."""
+    device = dict(device)
+    with state['registry_lock']:
+        devices = dict(state['registry']['by_id'])
+        devices[device['id']] = device
+        state['registry'] = _build_registry(devices.values())
+    state['liveness'].set_timeout(device['id'], device.get('liveness_timeout'))
+
+def registry_remove(device_id):
+    """Removes a device from the registry. Returns the removed record or None."""
+    with state['registry_lock']:
+        devices = dict(state['registry']['by_id'])
+        device = devices.pop(device_id, None)
+        if device is not None:
+            state['registry'] = _build_registry(devices.values())
+    state['liveness'].set_timeout(device_id, None)
+    return device
+
+def get_registered_devices():
+    """Returns all registered devices (ordered by id) from the current registry snapshot."""
+    return list(state['registry']['by_id'].values())
+
+def get_device(device_id):
+    """Returns the registered device with this id, or None."""
+    return state['registry']['by_id'].get(device_id)
+
+def get_device_by_ip(ip):
+    """Returns the registered device for this IP address, or None."""
+    return state['registry']['by_ip'].get(ip)
+
+def get_device_by_name(name):
+    """Returns the registered device with this name, or None."""
+    return state['registry']['by_name'].get(name)
+
+def get_device_rooms(device_id):
+    """Returns the Socket.IO rooms that receive the events of a registered device."""
+    return state['registry']['rooms'].get(device_id, _ALL_ROOMS)
+
+def _device_state(client_id):
+    """Returns the runtime record for a device, creating it if needed."""
+    device_state = state['device_states'].get(client_id)
+    if device_state is None:
+        with state['lock']:
+            device_states = state['device_states']
+            device_state = device_states.get(client_id)
+            if device_state is None:
+                device_state = DeviceState(client_id)
+                state['device_states'] = {**device_states, client_id: device_state}
+    return device_state
+
+def get_device_view(client_id):
+    """Returns the current DeviceView of a device, or None if it has no runtime record."""
+    device_state = state['device_states'].get(client_id)
+    return device_state.view if device_state is not None else None
+
+def get_connected_device(client_id):
+    """Returns the DeviceView of a connected device, or None."""
+    view = get_device_view(client_id)
+    if view is None or view.socket is None:
+        return None
+    return view
+
+def device_views():
+    """Returns [(client_id, DeviceView)] of every device with a runtime record, without locking."""
+    return [(client_id, device_state.view) for client_id, device_state in state['device_states'].items()]
+
+# -----------------------------------------------------------------------------
+# Zones, Tags and Web Client Subscriptions
+# -----------------------------------------------------------------------------
+
+# Every web client is in exactly one of these: ROOM_ALL if it watches every
+# device, otherwise the zone and tag rooms it subscribed to. Device events are
+# emitted to ROOM_ALL plus the device's own rooms, so a control-room screen
+# only receives the devices of its zones. Events that are not about a single
+# device (dashboard status, general log entries) still go to every client.
+ROOM_ALL = 'all'
+_ALL_ROOMS = (ROOM_ALL,)
+
+
+def zone_room(zone):
+    return f'zone:{zone}'
+
+def tag_room(tag):
+    return f'tag:{tag}'
+
+def device_rooms(device):
+    """Returns the rooms of a device record: ROOM_ALL, its zone's room and one room per tag."""
+    rooms = [ROOM_ALL]
+    if device.get('zone'):
+        rooms.append(zone_room(device['zone']))
+    rooms.extend(tag_room(tag) for tag in device.get('tags') or ())
+    return tuple(rooms)
+
+
+class Subscription:
+    """The zones and tags a web client watches. An empty subscription watches every device."""
+    __slots__ = ('zones', 'tags')
+
+    def __init__(self, zones=(), tags=()):
+        self.zones = frozenset(zones)
+        self.tags = frozenset(tags)
+
+    @property
+    def everything(self):
+        return not self.zones and not self.tags
+
+    def rooms(self):
+        if self.everything:
+            return list(_ALL_ROOMS)
+        return [zone_room(zone) for zone in self.zones] + [tag_room(tag) for tag in self.tags]
+
+    def matches(self, device):
+        """True if the device record (None for an unknown device) is watched."""
+        if self.everything:
+            return True
+        if device is None:
+            return False
+        return device.get('zone') in self.zones or not self.tags.isdisjoint(device.get('tags') or ())
+
+    def to_dict(self):
+        return {'zones': sorted(self.zones), 'tags': sorted(self.tags)}
+
+
+def _parse_names(value, what):
+    """
+    Validates a list of zone or tag names (a comma-separated string is also
+    accepted) and returns them stripped and de-duplicated. Raises ValueError.
+    """
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    if not isinstance(value, (list, tuple)) or not all(isinstance(name, str) for name in value):
+        raise ValueError(f'{what} must be a list of strings')
+    names = []
+    for name in (name.strip() for name in value):
+        if ',' in name:
+            raise ValueError(f'{what} must not contain commas')
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def parse_subscription(data):
+    """Builds a Subscription from {'zones': [...], 'tags': [...]}. Raises ValueError."""
+    if data is None:
+        return Subscription()
+    if not isinstance(data, dict):
+        raise ValueError('Subscription must be an object with zones and/or tags')
+    return Subscription(_parse_names(data.get('zones'), 'zones'), _parse_names(data.get('tags'), 'tags'))
+
+
+def parse_device_grouping(data, old_device=None):
+    """
+    Returns the (zone, tags) of a device from request data, keeping the old
+    device's values for fields the request leaves out. Raises ValueError.
+    """
+    zone = data.get('zone', old_device.get('zone') if old_device else None)
+    if zone is not None and not isinstance(zone, str):
+        raise ValueError('zone must be a string')
+    zone = zone.strip() or None if zone is not None else None
+    if 'tags' in data:
+        tags = _parse_names(data['tags'], 'tags')
+    else:
+        tags = list(old_device.get('tags') or ()) if old_device else []
+    return zone, tags
+
+
+def get_subscription(sid):
+    """Returns the subscription of a web client of this process."""
+    return state['subscriptions'].get(sid) or Subscription()
+
+
+def subscribe_web_client(sid, subscription):
+    """Moves a web client of this process into the rooms of its new subscription."""
+    previous = get_subscription(sid)
+    for room in previous.rooms():
+        leave_room(room, sid=sid)
+    for room in subscription.rooms():
+        join_room(room, sid=sid)
+    state['subscriptions'][sid] = subscription
+
+
+def emit_device_moved(device_id, old_rooms, new_rooms):
+    """
+    Tells the web clients that only watched a device through rooms it just left
+    that the device is gone. The full record reaches the new rooms with the
+    next device_changed flush, under a higher version, so a client in both an
+    old and a new room ends up with the device.
+    """
+    left = [room for room in old_rooms if room not in new_rooms]
+    if not left:
+        return
+    with state['ui_lock']:
+        version = _next_ui_version()
+        state['device_versions'][device_id] = version
+    socketio.emit('device_changed', [{'id': device_id, 'fields': {}, 'version': version, 'removed': True}], to=left)
+
+# -----------------------------------------------------------------------------
+# TCP Server for ESP32 Devices (Runs in a background thread)
+# -----------------------------------------------------------------------------
+
+def log_and_emit(message, message_type="SERVER", created=None, device_id=None):
+    """
+    Adds an entry to the web log buffer and emits it to the web clients: all of
+    them, or only those watching device_id if the entry is about one device.
+    log_writer calls this for every record at or above the UI log level; code
+    elsewhere logs through the subsystem loggers instead.
+    """
+    when = datetime.fromtimestamp(created) if created is not None else datetime.now()
+    entry = {'timestamp': when.strftime("%H:%M:%S"), 'message': message, 'type': message_type}
+    if device_id is not None:
+        entry['device_id'] = device_id
+    if cluster_bus is not None:
+        # Every worker (this one included) appends the entries in bus order
+        cluster_bus.publish('log', entry)
+    else:
+        _append_log(entry)
+
+
+def _append_log(entry):
+    """Numbers a log entry, stores it in the ring buffer and emits it to this process's web clients."""
+    with state['log_lock']:
+        state['log_seq'] += 1
+        log_entry = dict(entry, seq=state['log_seq'])
+        state['logs'].append(log_entry)  # The deque drops the oldest entry when full
+
+    # In multi-process mode every worker emits its own copy to its own web clients
+    device_id = log_entry.get('device_id')
+    rooms = list(get_device_rooms(device_id)) if device_id is not None else None
+    socketio.emit('new_log', log_entry, to=rooms, ignore_queue=True)
+
+
+def _ui_log_type(record):
+    """The web log entry type of a record: its ui_type field, else derived from the level."""
+    ui_type = getattr(record, 'ui_type', None)
+    if ui_type:
+        return ui_type
+    if record.levelno >= logging.ERROR:
+        return "ERROR"
+    if record.levelno >= logging.WARNING:
+        return "WARNING"
+    return "SERVER"
+
+
+def get_logs_since(since_seq, limit=LOG_PAGE_SIZE):
+    """
+    Returns the log entries newer than since_seq (oldest first), or None if they
+    cannot be returned without a gap: some were already evicted from the buffer
+    or there are more than limit of them.
+    """
+    with state['log_lock']:
+        logs = state['logs']
+        newest = state['log_seq']
+        oldest = logs[0]['seq'] if logs else newest + 1
+        if since_seq > newest or since_seq + 1 < oldest:
+            return None
+        missed = newest - since_seq
+        if missed > limit:
+            return None
+        # Walk from the newest end so the cost is proportional to what was missed
+        entries = list(islice(reversed(logs), missed))
+    entries.reverse()
+    return entries
+
+
+def get_logs_page(before_seq=None, limit=LOG_PAGE_SIZE):
+    """Returns up to limit entries older than before_seq (newest page if None), oldest first."""
+    with state['log_lock']:
+        logs = state['logs']
+        newest = state['log_seq']
+        skip = 0 if before_seq is None else max(0, newest - before_seq + 1)
+        entries = list(islice(reversed(logs), skip, skip + limit))
+        has_more = skip + len(entries) < len(logs)
+    entries.reverse()
+    return entries, has_more
+
+
+def filter_logs(entries, subscription):
+    """Drops the entries about devices the subscription does not watch."""
+    if subscription.everything:
+        return entries
+    return [
+        entry for entry in entries
+        if 'device_id' not in entry or subscription.matches(get_device(entry['device_id']))
+    ]
+
+
+def _get_current_client_and_led_states(subscription=None):
+    """Helper function to get the current client list and LED states, limited to the subscription's devices."""
+    devices = get_registered_devices()
+    if subscription is not None and not subscription.everything:
+        devices = [device for device in devices if subscription.matches(device)]
+    # Copy what is needed under the locks, then build the lists without holding them
+    with state['lock']:
+        current_led_states = dict(state['remote_leds'])  # Devices on other workers
+    for client_id, view in device_views():
+        if view.connected or client_id not in current_led_states:
+            current_led_states[client_id] = view.effective_led_state
+    with state['ui_lock']:
+        versions = dict(state['device_versions'])
+    links = state['heartbeat'].all_stats()
+
+    client_list = []
+    led_states = {}
+    
+    for device in devices:
+        device_id = device['id']
+        current_led_state = current_led_states.get(device_id, 'off')
+        link = links.get(device_id) or {}
+        client_list.append({
+            'id': device_id,
+            'name': device['name'],
+            'ip': device['ip'],
+            'mac': device['mac'],
+            'zone': device.get('zone'),
+            'tags': device.get('tags') or [],
+            'led_state': current_led_state,
+            'link': link.get('status'),
+            'rtt_p50_ms': link.get('p50'),
+            'rtt_p95_ms': link.get('p95'),
+            'version': versions.get(device_id, 0)
+        })
+        led_states[device_id] = current_led_state
     return client_list, led_states
 
-def update_clients_and_leds_on_frontend():
-    """Emits the current client list and LED states to all connected web clients."""
-    client_list, led_states = _get_current_client_and_led_states()
-    socketio.emit('update_clients', client_list)
-    socketio.emit('update_leds', led_states)
-    update_dashboard_on_frontend()
+def _current_led_state(client_id):
+    """The LED state the web clients show for one device, wherever it is connected."""
+    view = get_device_view(client_id)
+    with state['lock']:
+        if view is not None and (view.connected or client_id not in state['remote_leds']):
+            return view.effective_led_state
+        return state['remote_leds'].get(client_id, 'off')
+
+def _schedule_ui_flush():
+    """Schedules a flush of pending UI changes. Caller must hold state['ui_lock']."""
+    if not state['ui_flush_scheduled']:
+        state['ui_flush_scheduled'] = True
+        eventlet.spawn_after(UI_UPDATE_COALESCE_MS / 1000.0, _flush_ui_changes)
+
+def _next_ui_version():
+    """Returns the next device change version. Caller must hold state['ui_lock']."""
+    if cluster_bus is not None:
+        # Versions from different workers must be comparable: stamp them from the shared clock
+        state['ui_version'] = max(state['ui_version'] + 1, int(time.time() * 1000000))
+    else:
+        state['ui_version'] += 1
+    return state['ui_version']
+
+def mark_device_changed(client_id, removed=False, rooms=None, **fields):
+    """
+    Records a change to a single device for the web clients. Changes are merged
+    per device and delivered as one versioned 'device_changed' batch once the
+    coalescing window closes. Pass removed=True when the device was deleted,
+    along with the rooms it had, since the registry no longer knows them.
+    Returns the change's version.
+    """
+    if rooms is None:
+        rooms = get_device_rooms(client_id)
+    with state['slow_events'].span('ui'), state['ui_lock']:
+        version = _next_ui_version()
+        state['pending_rooms'][client_id] = rooms
+        change = state['pending_changes'].setdefault(client_id, {'id': client_id, 'fields': {}})
+        change['fields'].update(fields)
+        change['version'] = version
+        if removed:
+            change['removed'] = True
+        else:
+            change.pop('removed', None)
+        state['device_versions'][client_id] = version
+        _schedule_ui_flush()
+    return version
+
+def mark_led_changed(client_id):
+    """Shortcut for the most common change: a device's effective LED state."""
+    view = get_device_view(client_id)
+    led_state = view.effective_led_state if view is not None else 'off'
+    version = mark_device_changed(client_id, led_state=led_state)
+    if cluster_bus is not None:
+        cluster_bus.publish('led', {
+            'worker': CLUSTER_WORKER, 'device_id': client_id, 'led_state': led_state, 'version': version,
+        })
+
+def _flush_ui_changes():
+    """Emits all device changes accumulated during the window."""
+    with state['ui_lock']:
+        changes = list(state['pending_changes'].values())
+        rooms = state['pending_rooms']
+        state['pending_changes'] = {}
+        state['pending_rooms'] = {}
+        state['ui_flush_scheduled'] = False
+
+    if changes:
+        # The clients watching every device get one batch with all the changes;
+        # the subscribed ones get a batch per group of rooms they could be in
+        socketio.emit('device_changed', changes, to=ROOM_ALL)
+        batches = {}
+        for change in changes:
+            group = tuple(room for room in rooms[change['id']] if room != ROOM_ALL)
+            if group:
+                batches.setdefault(group, []).append(change)
+        for batch_rooms, batch in batches.items():
+            socketio.emit('device_changed', batch, to=list(batch_rooms))
+
+def emit_full_snapshot():
+    """Sends the client list and LED states of its subscription, and the status, to the requesting web client only."""
+    client_list, led_states = _get_current_client_and_led_states(get_subscription(request.sid))
+    emit('update_clients', client_list, broadcast=False)
+    emit('update_leds', led_states, broadcast=False)
+    emit('update_dashboard', _get_dashboard_status(), broadcast=False)
 
+def _get_dashboard_status():
+    """Builds the general status dict shown on the dashboard, with the windowed statistics."""
+    activity = state['stats'].snapshot(DASHBOARD_TOP_DEVICES)
+    client_count = sum(1 for _, view in device_views() if view.connected)
+    with state['lock']:
+        message_count = state['message_count']
+        last_activity = state['last_activity_time']
+        if cluster_bus is not None:
+            # Cluster-wide totals, as last reported by the other workers
+            client_count = len(state['ownership'])
+            for peer in state['peer_stats'].values():
+                message_count += peer['message_count']
+                if peer['last_activity'] is not None:
+                    peer_activity = datetime.fromtimestamp(peer['last_activity'])
+                    last_activity = max(last_activity, peer_activity) if last_activity else peer_activity
+            activity = stats.merge_snapshots(
+                [activity] + [peer['activity'] for peer in state['peer_stats'].values()], DASHBOARD_TOP_DEVICES
+            )
+        server_running = state['tcp_server_running']
+    activity['noisiest'] = [
+        {'id': device_id, 'name': (get_device(device_id) or {}).get('name'), 'presses_per_min': rate}
+        for device_id, rate in activity['noisiest']
+    ]
+    return {
+        'server_running': server_running,
+        'client_count': client_count,
+        'message_count': message_count,
+        'last_activity': last_activity.strftime("%H:%M:%S") if last_activity else "N/A",
+        **activity,
+    }
 
 
 def update_dashboard_on_frontend():
     """Emits general status updates to the frontend."""
-    with state['lock']:
-        status = {
-            'server_running': state['tcp_server_running'],
-            'client_count': len(state['clients']),
-            'message_count': state['message_count'],
-            'last_activity': state['last_activity_time'].strftime("%H:%M:%S") if state['last_activity_time'] else "N/A"
-        }
-    socketio.emit('update_dashboard', status)
+    socketio.emit('update_dashboard', _get_dashboard_status())
 
 def process_esp_message(message, client_ip, client_id):
-    """Processes a message from an ESP32 and updates the state."""
-    print(f"[TCP Handler {client_id}] Processing message: {message}")
+    """Processes a JSON text message from an ESP32."""
+    tracer = state['slow_events']
+    tracer.begin()
     try:
-        data = json.loads(message)
-        message_type = data.get('type', 'unknown')
+        with tracer.span('decode'):
+            event = wire.decode_json(message)
+    except ValueError:
+        tracer.end()
+        ingest_log.error("Invalid JSON from client %s: %s", client_id, message, extra={'device_id': client_id})
+        return
+    process_esp_event(event, client_ip, client_id)
+    tracer.end(device_id=client_id, type=event.type, format='json')
 
-        with state['lock']:
-            state['last_seen'][client_id] = datetime.now()
-            if message_type == 'connection':
-                if client_id in state['clients']:
-                    state['clients'][client_id]['mac'] = data.get('mac', 'N/A')
-                log_and_emit(
-                    f"Device registered - ID: {client_id}, MAC: {data.get('mac', 'N/A')}", "CLIENT"
-                )
-                
-            elif message_type == 'button_press':
-                state['message_count'] += 1
-                state['last_activity_time'] = datetime.now()
-                state['led_states'][client_id] = 'alarm'
 
-                log_and_emit(
-                    f"BUTTON PRESS from client {client_id} (IP: {client_ip})", "RECV"
-                )
-                
-                # Buzzer and alarm state are now handled by handle_play_buzzer
-                handle_play_buzzer(client_id)
+def process_esp_event(event, client_ip, client_id):
+    """Processes a decoded device message, whichever wire format it came in, and updates the state."""
+    ingest_log.debug("Processing message: %r", event, extra={'device_id': client_id})
+    try:
+        message_type = event.type
+        now = datetime.now()
+        # A press beyond the device's rate limit only counts as a sign of life;
+        # suppression_summary_writer reports how many were dropped
+        suppressed = message_type == 'button_press' and not state['press_limiter'].allow(client_id)
+
+        pressed = message_type == 'button_press' and not suppressed
+
+        # Update the state first; logging and emits happen after the locks are released
+        with state['slow_events'].span('state'):
+            device_state = _device_state(client_id)
+            with device_state.lock:
+                view = device_state.view
+                if message_type == 'connection' and view.connected:
+                    device_state.update(last_seen=time.time(), messages=view.messages + 1, mac=event.get('mac', 'N/A'))
+                elif pressed:
+                    device_state.update(
+                        last_seen=time.time(), messages=view.messages + 1, presses=view.presses + 1, led_state='alarm'
+                    )
+                elif message_type == 'pong':
+                    device_state.update(last_seen=time.time())
+                else:
+                    device_state.update(last_seen=time.time(), messages=view.messages + 1)
+            if pressed:
+                with state['lock']:
+                    state['message_count'] += 1
+                    state['last_activity_time'] = now
+        state['liveness'].touch(client_id)
+        if message_type == 'pong':
+            # A pong is a sign of life but not a device message: it counts in
+            # neither the device's nor the dashboard's message figures
+            with state['slow_events'].span('heartbeat'):
+                _on_pong(client_id, event.seq)
+            return
+        state['stats'].record_message()
+        if suppressed:
+            return
+        if message_type == 'button_press':
+            state['journal'].record('button_press', client_id, ip=client_ip)
 
-            else:
-                log_and_emit(f"Unknown message type from {client_id}: {message}", "WARNING")
+        if message_type == 'connection':
+            ingest_log.info(
+                "Device registered - ID: %s, MAC: %s", client_id, event.get('mac', 'N/A'),
+                extra={'device_id': client_id, 'ui_type': 'CLIENT'}
+            )
+            
+        elif message_type == 'button_press':
+            ingest_log.info(
+                "BUTTON PRESS from client %s (IP: %s)", client_id, client_ip,
+                extra={'device_id': client_id, 'ui_type': 'RECV'}
+            )
+            
+            # Buzzer and alarm state are now handled by handle_play_buzzer
+            state['stats'].record_press(client_id)
+            with state['slow_events'].span('alarm'):
+                handle_play_buzzer(client_id)
 
-        # After processing, send updates to all web clients
-        update_clients_and_leds_on_frontend()
+        else:
+            ingest_log.warning(
+                "Unknown message type from %s: %r", client_id, event, extra={'device_id': client_id}
+            )
 
-    except json.JSONDecodeError:
-        log_and_emit(f"Invalid JSON from client {client_id}: {message}", "ERROR")
     except Exception as e:
-        log_and_emit(f"Error processing message from {client_id}: {e}", "ERROR")
+        ingest_log.error("Error processing message from %s: %s", client_id, e, extra={'device_id': client_id})
+
+
+def _on_pong(client_id, seq):
+    """Feeds a heartbeat pong to the monitor and reports the link if it changed."""
+    rtt, status = state['heartbeat'].on_pong(client_id, seq)
+    if rtt is None:
+        ingest_log.debug("Unexpected pong %r from client %s.", seq, client_id, extra={'device_id': client_id})
+        return
+    if METRICS_ENABLED:
+        DEVICE_RTT_SECONDS.observe(rtt)
+    if status is not None:
+        report_link_status(client_id, status)
+    elif state['heartbeat'].report_due(client_id, HEARTBEAT_REPORT_S):
+        publish_link_stats(client_id)
+
+
+def disconnect_client_socket(client_socket):
+    """
+    Forces a device connection to end. Shutting the socket down (rather than
+    closing it) wakes whichever ingest engine is reading it, and that engine
+    then performs the full cleanup and close.
+    """
+    try:
+        client_socket.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        # Already disconnected; closing makes any pending recv() fail
+        client_socket.close()
+
+
+def configure_client_socket(client_socket):
+    """Applies the per-connection socket options used for every ESP32 connection."""
+    # --- Configure TCP Keep-Alive (Linux-specific) ---
+    # A backstop for peers that vanished without closing the connection; the
+    # heartbeat and the liveness watchdog detect everything else. Aggressive
+    # values here only cause probe traffic and false disconnects on lossy Wi-Fi.
+    try:
+        # Enable keep-alive probes on the socket
+        client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        
+        # The following options are available on Linux and some other OSes
+        if hasattr(socket, 'TCP_KEEPIDLE'):
+            # Time (in seconds) the connection needs to be idle before sending the first keep-alive probe.
+            client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, TCP_KEEPALIVE_IDLE_S)
+        
+        if hasattr(socket, 'TCP_KEEPINTVL'):
+            # Interval (in seconds) between subsequent keep-alive probes.
+            client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, TCP_KEEPALIVE_INTERVAL_S)
+            
+        if hasattr(socket, 'TCP_KEEPCNT'):
+            # Number of unanswered probes before considering the connection dead.
+            client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, TCP_KEEPALIVE_COUNT)
+            
+    except OSError as e:
+        tcp_log.warning("Could not set all TCP keep-alive options: %s", e)
+
+
+def admit_esp_client(client_socket, client_ip):
+    """
+    Authorizes a freshly accepted connection and registers it as the device's
+    active connection. Returns the client_id, or None if the IP is not registered
+    (the socket is closed in that case).
+    """
+    started = time.perf_counter()
+
+    # --- Authorization Check ---
+    device = get_device_by_ip(client_ip)
+
+    if device is None:
+        client_socket.close()
+        deny_list = state['deny_list']
+        if deny_list.is_denied(client_ip):
+            outcome = 'denied'  # Counted, and reported by suppression_summary_writer
+        else:
+            outcome = 'rejected'
+            tcp_log.warning("Rejected connection from unauthorized IP: %s", client_ip, extra={'ip': client_ip})
+            state['journal'].record('rejected', ip=client_ip)
+            if deny_list.record_rejection(client_ip):
+                tcp_log.warning(
+                    "IP %s denied for %ss after %d rejected connections.", client_ip, DENY_SECONDS,
+                    DENY_AFTER_REJECTIONS, extra={'ip': client_ip}
+                )
+        if METRICS_ENABLED:
+            ACCEPT_SECONDS.observe(time.perf_counter() - started, outcome)
+        return None
+
+    configure_client_socket(client_socket)  # Only for connections that are kept
+
+    # --- If Authorized, Proceed ---
+    # Use the database ID as the client_id for consistency
+    client_id = device['id']
+    outbox = OutboundQueue(OUTBOUND_QUEUE_SIZE, OUTBOUND_FULL_POLICY)
+    token = None
+    if cluster_bus is not None:
+        with state['lock']:
+            state['connection_seq'] += 1
+            token = f"{CLUSTER_WORKER}:{state['connection_seq']}"
+        claim = {'device_id': client_id, 'worker': CLUSTER_WORKER, 'token': token}
+    device_state = _device_state(client_id)
+    with device_state.lock:
+        old = device_state.view
+        old_socket = old.socket
+        old_outbox = old.outbox
+        device_state.update(
+            socket=client_socket, outbox=outbox, ip=client_ip,
+            mac=device['mac'],  # Get MAC from DB
+            led_state='alarm' if old.alarming else 'connected', token=token,
+        )
+    state['liveness'].touch(client_id)
+    if HEARTBEAT_ENABLED:
+        state['heartbeat'].add(client_id)
+    if cluster_bus is not None:
+        # Another worker holding an older connection of this device closes it on seeing the claim
+        cluster_bus.publish('claim', claim)
+    eventlet.spawn(device_writer, client_socket, client_id, outbox)
+
+    # If the client was already connected, end the old connection
+    if old_outbox is not None:
+        old_outbox.close()
+    if old_socket is not None:
+        tcp_log.debug("Client %s is reconnecting. Closing old socket.", client_id, extra={'device_id': client_id})
+        try:
+            disconnect_client_socket(old_socket)
+        except Exception as e:
+            tcp_log.warning(
+                "Error closing old socket for %s: %s", client_id, e, extra={'device_id': client_id}
+            )
+
+    tcp_log.info(
+        "Authorized client %s connected. Assigned ID %s", client_ip, client_id,
+        extra={'device_id': client_id, 'ip': client_ip}
+    )
+    state['journal'].record('connect', client_id, ip=client_ip, reconnect=old_socket is not None)
+    state['stats'].record_connect()
+    recorder = state['recorder']
+    if recorder is not None:
+        recorder.record(recording.CONNECT, client_id, ip=client_ip)
+    mark_led_changed(client_id)
+    if METRICS_ENABLED:
+        ACCEPT_SECONDS.observe(time.perf_counter() - started, 'admitted')
+    return client_id
+
+
+def release_esp_client(client_socket, client_ip, client_id):
+    """
+    Closes a device connection and removes it from the state, unless the device
+    has already reconnected on a newer socket (which is then left untouched).
+    """
+    released = moved = False
+    outbox = None
+    device_state = state['device_states'].get(client_id)
+    if device_state is not None:
+        with device_state.lock:
+            view = device_state.view
+            if view.socket is client_socket:
+                released = True
+                token, outbox = view.token, view.outbox
+                # One view, so the whole connection is torn down in one step
+                device_state.update(socket=None, outbox=None, led_state='off')
+    if released:
+        outbox.close()  # Ends the device_writer
+        state['liveness'].remove(client_id)
+        state['heartbeat'].remove(client_id)
+        with state['lock']:
+            # Multi-process mode: the device may have reconnected to another worker
+            moved = state['ownership'].owner(client_id) not in (None, CLUSTER_WORKER)
+
+    try:
+        client_socket.close()
+    except Exception:
+        pass
+
+    if released:
+        tcp_log.info(
+            "Client %s (%s) disconnected.", client_id, client_ip,
+            extra={'device_id': client_id, 'ui_type': 'CLIENT'}
+        )
+        if cluster_bus is not None:
+            cluster_bus.publish('release', {'device_id': client_id, 'worker': CLUSTER_WORKER, 'token': token})
+        state['journal'].record('disconnect', client_id, ip=client_ip)
+        state['stats'].record_disconnect()
+        recorder = state['recorder']
+        if recorder is not None:
+            recorder.record(recording.DISCONNECT, client_id)
+        if not moved:  # Otherwise the new worker already reported the device's state
+            mark_led_changed(client_id)
+            if HEARTBEAT_ENABLED:
+                mark_device_changed(client_id, link=None, rtt_p50_ms=None, rtt_p95_ms=None)
+
+
+def _forget_device(client_id):
+    """
+    Drops the runtime record of a device that was removed from the registry and
+    closes its connection, which is no longer authorized.
+    """
+    state['press_limiter'].forget(client_id)
+    state['stats'].forget(client_id)
+    with state['lock']:
+        device_states = dict(state['device_states'])
+        device_state = device_states.pop(client_id, None)
+        state['device_states'] = device_states
+    state['liveness'].remove(client_id)
+    state['heartbeat'].remove(client_id)
+    if device_state is None:
+        return
+    view = device_state.view
+    if view.outbox is not None:
+        view.outbox.close()
+    if view.connected:
+        web_log.info("Device %s deleted. Closing its connection.", client_id, extra={'device_id': client_id})
+        disconnect_client_socket(view.socket)
+        if cluster_bus is not None:
+            cluster_bus.publish('release', {
+                'device_id': client_id, 'worker': CLUSTER_WORKER, 'token': view.token,
+            })
+
+
+def _send_all(client_socket, data):
+    """Writes all of data, waiting for the socket to drain whenever it is not writable."""
+    view = memoryview(data)
+    while view:
+        try:
+            sent = client_socket.send(view)
+        except BlockingIOError:
+            # Non-blocking socket (selector engine) with a full send buffer
+            eventlet.hubs.trampoline(client_socket.fileno(), write=True)
+            continue
+        view = view[sent:]
+
+
+def device_writer(client_socket, client_id, outbox):
+    """
+    Drains one connection's outbound queue. A device that stops reading only stalls
+    its own writer; everything else keeps running. Exits when the queue is closed.
+    """
+    while True:
+        item = outbox.get()
+        if item is None:
+            return
+        data, enqueued_at = item
+        try:
+            _send_all(client_socket, data)
+        except OSError as e:
+            tcp_log.error("Failed to send to client %s: %s", client_id, e, extra={'device_id': client_id})
+            disconnect_client_socket(client_socket)
+            return
+        outbox.mark_sent(enqueued_at)
+
+
+def send_to_devices(client_ids, data):
+    """
+    Queues bytes for each connected device in client_ids ('all' for every connected
+    device) and returns the ids it was queued for. Devices whose queue is full under
+    the 'disconnect' policy are disconnected as slow consumers.
+    """
+    if client_ids == 'all':
+        targets = [(client_id, view.socket, view.outbox) for client_id, view in device_views() if view.connected]
+    else:
+        targets = []
+        for client_id in client_ids:
+            view = get_connected_device(client_id)
+            if view is not None:
+                targets.append((client_id, view.socket, view.outbox))
+
+    queued, slow = [], []
+    for client_id, client_socket, outbox in targets:
+        if outbox.put(data):
+            queued.append(client_id)
+        elif not outbox.closed:
+            slow.append((client_id, client_socket))
+
+    for client_id, client_socket in slow:
+        tcp_log.warning(
+            "Outbound queue of client %s is full (%d messages). Disconnecting slow client.",
+            client_id, OUTBOUND_QUEUE_SIZE, extra={'device_id': client_id}
+        )
+        disconnect_client_socket(client_socket)
+    return queued
+
+
+def process_esp_frames(framer, client_ip, client_id):
+    """Decodes every complete frame buffered in the framer and hands it to process_esp_event."""
+    dropped = framer.oversized_frames
+    traced = client_id in state['trace_devices']
+    frames = framer.pop_frames()  # Settles the wire format on the first call with data
+    decode = wire.decode_binary if framer.binary else wire.decode_json
+    wire_format = 'binary' if framer.binary else 'json'
+    tracer = state['slow_events']
+    for frame in frames:
+        if traced:
+            frame_log.debug("Frame from client %s: %r", client_id, frame, extra={'device_id': client_id})
+        if METRICS_ENABLED:
+            emits_before = _emit_tracker.count()
+            started = time.perf_counter()
+        tracer.begin()
+        try:
+            with tracer.span('decode'):
+                event = decode(frame)
+        except ValueError:
+            tracer.end()
+            ingest_log.error(
+                "Invalid %s message from client %s: %r", 'binary' if framer.binary else 'JSON', client_id, frame,
+                extra={'device_id': client_id}
+            )
+            continue
+        process_esp_event(event, client_ip, client_id)
+        tracer.end(device_id=client_id, type=event.type, format=wire_format)
+        if METRICS_ENABLED:
+            MESSAGE_SECONDS.observe(time.perf_counter() - started)
+            EMITS_PER_MESSAGE.observe(_emit_tracker.count() - emits_before)
+    if framer.oversized_frames != dropped:
+        ingest_log.warning(
+            "Dropped %d oversized message(s) from client %s (limit %d bytes).",
+            framer.oversized_frames - dropped, client_id, MAX_FRAME_LENGTH, extra={'device_id': client_id}
+        )
 
 
 def handle_esp_client(client_socket, client_ip, client_id):
     """Handles a single ESP32 client connection."""
-    print(f"[TCP Handler {client_id}] Thread started for {client_ip}")
-    buffer = ""
+    tcp_log.debug("Connection handler started for %s", client_ip, extra={'device_id': client_id})
+    framer = NegotiatingFramer(MAX_FRAME_LENGTH, TCP_RECV_SIZE)
     while True:
         try:
             # Check if this client is still considered active
-            with state['lock']:
-                if client_id not in state['clients'] or state['clients'][client_id]['socket'] != client_socket:
-                    break
+            view = get_device_view(client_id)
+            if view is None or view.socket is not client_socket:
+                break
             
-            data = client_socket.recv(1024).decode('utf-8')
-            if not data:
-                print(f"[TCP Handler {client_id}] Received empty data. Client disconnected.")
+            received = framer.recv_from(client_socket)
+            if not received:
+                tcp_log.debug("Received empty data. Client disconnected.", extra={'device_id': client_id})
                 break  # Connection closed by client
 
-            print(f"[TCP Handler {client_id}] Received raw data: {data}")
-            buffer += data
-            while '\n' in buffer:
-                line, buffer = buffer.split('\n', 1)
-                if line.strip():
-                    process_esp_message(line.strip(), client_ip, client_id)
+            if client_id in state['trace_devices']:
+                frame_log.debug(
+                    "Received %d bytes of raw data from client %s.", received, client_id,
+                    extra={'device_id': client_id}
+                )
+            recorder = state['recorder']
+            if recorder is not None:
+                recorder.record(recording.DATA, client_id, data=framer.received(received))
+            process_esp_frames(framer, client_ip, client_id)
 
         except (ConnectionResetError, BrokenPipeError):
-            print(f"[TCP Handler {client_id}] Connection lost abruptly.")
+            tcp_log.debug("Connection lost abruptly.", extra={'device_id': client_id})
             break
         except Exception as e:
-            print(f"[TCP Handler {client_id}] Error: {e}")
-            log_and_emit(f"Error with client {client_id}: {e}", "ERROR")
+            tcp_log.error("Error with client %s: %s", client_id, e, extra={'device_id': client_id})
             break
 
     # Cleanup after disconnection
-    print(f"[TCP Handler {client_id}] Cleaning up and closing connection for {client_ip}.")
-    log_message = None
+    release_esp_client(client_socket, client_ip, client_id)
+    tcp_log.debug("Connection handler finished for %s", client_ip, extra={'device_id': client_id})
+
+
+def _finish_tcp_server_loop():
+    """Closes the listening socket and marks the server stopped. Shared by both ingest engines."""
     with state['lock']:
-        if client_id in state['clients']:
-            log_message = f"Client {client_id} ({client_ip}) disconnected."
-            state['clients'][client_id]['socket'].close()
-            del state['clients'][client_id]
-            if client_id in state['led_states']:
-                 del state['led_states'][client_id]
-    
-    if log_message:
-        log_and_emit(log_message, "CLIENT")
+        if state['tcp_server_socket'] is not None:
+            try:
+                state['tcp_server_socket'].close()
+            except Exception:
+                pass
+            state['tcp_server_socket'] = None
 
-    update_clients_and_leds_on_frontend()
-    print(f"[TCP Handler {client_id}] Thread finished for {client_ip}.")
+        state['tcp_server_running'] = False
+
+    server_log.info("TCP server loop finished.")
+    update_dashboard_on_frontend()
 
 
 def tcp_server_loop():
     """The main loop for the TCP server accepting ESP32 connections."""
-    log_and_emit("TCP server loop started.", "SERVER")
-    print("[TCP Server] Loop started.")
+    server_log.info("TCP server loop started.")
 
     try:
         while True:
@@ -248,78 +1465,19 @@ def tcp_server_loop():
                 server_socket = state['tcp_server_socket']
 
             if not running or server_socket is None:
-                print("[TCP Server] Stopping loop because server_running is False or socket is None.")
+                server_log.debug("Stopping loop because server_running is False or socket is None.")
                 break
 
             try:
                 # accept() may timeout because of settimeout(1.0)
                 client_socket, client_address = server_socket.accept()
-                print(f"[TCP Server] Accepted connection from {client_address}")
-
-                # --- Configure TCP Keep-Alive (Linux-specific) ---
-                # This helps detect disconnected clients (e.g., unplugged cable) much faster
-                # than the default OS settings. The OS will automatically send probes on idle
-                # connections and close them if the probes are not answered.
-                try:
-                    # Enable keep-alive probes on the socket
-                    client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
-                    
-                    # The following options are available on Linux and some other OSes
-                    if hasattr(socket, 'TCP_KEEPIDLE'):
-                        # Time (in seconds) the connection needs to be idle before sending the first keep-alive probe.
-                        client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 2)
-                    
-                    if hasattr(socket, 'TCP_KEEPINTVL'):
-                        # Interval (in seconds) between subsequent keep-alive probes.
-                        client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 1)
-                        
-                    if hasattr(socket, 'TCP_KEEPCNT'):
-                        # Number of unanswered probes before considering the connection dead.
-                        client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 2)
-                        
-                except OSError as e:
-                    print(f"[TCP Server] Warning: Could not set all TCP keep-alive options: {e}")
-
+                tcp_log.debug("Accepted connection from %s", client_address)
                 client_ip = client_address[0]
 
-                # --- Authorization Check ---
-                conn = get_db_connection()
-                try:
-                    device = conn.execute(
-                        'SELECT * FROM devices WHERE ip = ?',
-                        (client_ip,)
-                    ).fetchone()
-                finally:
-                    conn.close()
-
-                if device is None:
-                    log_and_emit(
-                        f"Rejected connection from unauthorized IP: {client_ip}",
-                        "WARNING"
-                    )
-                    client_socket.close()
+                client_id = admit_esp_client(client_socket, client_ip)
+                if client_id is None:
                     continue  # Move to the next connection attempt
 
-                # --- If Authorized, Proceed ---
-                with state['lock']:
-                    # Use the database ID as the client_id for consistency
-                    client_id = device['id']
-
-                    # If the client is already connected, handle re-connection
-                    if client_id in state['clients']:
-                        print(f"[TCP Server] Client {client_id} is reconnecting. Closing old socket.")
-                        try:
-                            state['clients'][client_id]['socket'].close()
-                        except Exception as e:
-                            print(f"[TCP Server] Error closing old socket for {client_id}: {e}")
-
-                    state['clients'][client_id] = {
-                        'socket': client_socket,
-                        'ip': client_ip,
-                        'mac': device['mac']  # Get MAC from DB
-                    }
-                    state['led_states'][client_id] = 'connected'
-
                 eventlet.spawn(
                     handle_esp_client,
                     client_socket,
@@ -327,143 +1485,831 @@ def tcp_server_loop():
                     client_id
                 )
 
-                log_and_emit(
-                    f"Authorized client {client_ip} connected. Assigned ID {client_id}",
-                    "SERVER"
-                )
-                update_clients_and_leds_on_frontend()
-
             except socket.timeout:
                 # Normal case due to settimeout(1.0); just loop again
                 continue
 
             except OSError as e:
                 # Usually means the server socket was closed or is invalid
-                print(f"[TCP Server] OS Error on accept: {e}")
-                log_and_emit(f"TCP server socket error: {e}", "ERROR")
+                server_log.error("TCP server socket error: %s", e)
                 break
 
             except Exception as e:
                 # Unexpected error: log it, but don't kill the entire server unless it keeps repeating
-                print(f"[TCP Server] Unexpected error on accept/handling: {e}")
-                log_and_emit(f"TCP server error: {e}", "ERROR")
+                server_log.error("TCP server error: %s", e)
                 # continue listening for new connections
                 continue
 
     finally:
         # Clean shutdown / state update
+        _finish_tcp_server_loop()
+
+
+# -----------------------------------------------------------------------------
+# Selector Ingest Engine (All device sockets on one event loop)
+# -----------------------------------------------------------------------------
+
+# eventlet strips epoll from the patched select module, so the engine uses the
+# original one. The epoll descriptor itself becomes readable whenever any
+# registered socket is ready, so the eventlet hub only has to watch that single
+# descriptor for the whole fleet.
+_native_select = eventlet.patcher.original('select')
+
+
+class _SelectorConnection:
+    """Per-connection bookkeeping for the selector engine."""
+    __slots__ = ('client_socket', 'client_ip', 'client_id', 'fd', 'framer')
+
+    def __init__(self, client_socket, client_ip, client_id):
+        self.client_socket = client_socket
+        self.client_ip = client_ip
+        self.client_id = client_id
+        self.fd = client_socket.fileno()
+        self.framer = NegotiatingFramer(MAX_FRAME_LENGTH, TCP_RECV_SIZE)
+
+
+def _selector_accept_batch(poller, connections, server_socket):
+    """Accepts up to TCP_ACCEPT_BATCH pending connections and registers the authorized ones."""
+    for _ in range(TCP_ACCEPT_BATCH):
+        try:
+            client_socket, client_address = server_socket.accept()
+        except (BlockingIOError, socket.timeout):
+            return  # Backlog drained
+        tcp_log.debug("Accepted connection from %s", client_address)
+        client_ip = client_address[0]
+
+        client_id = admit_esp_client(client_socket, client_ip)
+        if client_id is None:
+            continue
+
+        client_socket.setblocking(False)
+        conn = _SelectorConnection(client_socket, client_ip, client_id)
+        stale = connections.get(conn.fd)
+        if stale is not None:
+            # The descriptor was closed behind our back and has been reused
+            _selector_close(poller, connections, stale)
+        connections[conn.fd] = conn
+        poller.register(conn.fd, _native_select.EPOLLIN)
+
+
+def _selector_close(poller, connections, conn):
+    """Unregisters a connection and runs the shared cleanup."""
+    if connections.get(conn.fd) is conn:
+        del connections[conn.fd]
+        try:
+            poller.unregister(conn.fd)
+        except OSError:
+            pass  # Closed descriptors are dropped by the kernel automatically
+    release_esp_client(conn.client_socket, conn.client_ip, conn.client_id)
+
+
+def _selector_read(poller, connections, conn):
+    """Reads what is available on a ready connection and processes every complete line."""
+    try:
+        received = conn.framer.recv_from(conn.client_socket)
+    except (BlockingIOError, InterruptedError):
+        return
+    except OSError as e:
+        tcp_log.debug("Connection lost: %s", e, extra={'device_id': conn.client_id})
+        _selector_close(poller, connections, conn)
+        return
+
+    if not received:
+        tcp_log.debug("Received empty data. Client disconnected.", extra={'device_id': conn.client_id})
+        _selector_close(poller, connections, conn)
+        return
+
+    if conn.client_id in state['trace_devices']:
+        frame_log.debug(
+            "Received %d bytes of raw data from client %s.", received, conn.client_id,
+            extra={'device_id': conn.client_id}
+        )
+    recorder = state['recorder']
+    if recorder is not None:
+        recorder.record(recording.DATA, conn.client_id, data=conn.framer.received(received))
+    process_esp_frames(conn.framer, conn.client_ip, conn.client_id)
+
+
+def _selector_sweep(poller, connections):
+    """Drops connections whose socket was closed directly instead of via disconnect_client_socket()."""
+    for conn in list(connections.values()):
+        if conn.client_socket.fileno() == -1:
+            _selector_close(poller, connections, conn)
+
+
+def selector_server_loop():
+    """Accepts and reads every ESP32 connection from a single epoll-driven loop."""
+    server_log.info("TCP server loop started (selector engine).")
+
+    poller = _native_select.epoll()
+    connections = {}  # {fd: _SelectorConnection}
+    try:
         with state['lock']:
-            if state['tcp_server_socket'] is not None:
+            server_socket = state['tcp_server_socket']
+        server_socket.setblocking(False)
+        server_fd = server_socket.fileno()
+        poller.register(server_fd, _native_select.EPOLLIN)
+
+        while True:
+            # A single bool read needs no lock; stop_tcp_server() flips it and the
+            # loop sees it on its next wake-up, at most one second later
+            if not state['tcp_server_running']:
+                server_log.debug("Stopping selector loop because server_running is False.")
+                break
+
+            # Park this greenlet until some socket is ready (at most one second)
+            try:
+                eventlet.hubs.trampoline(poller.fileno(), read=True, timeout=1.0)
+            except eventlet.Timeout:
+                _selector_sweep(poller, connections)
+                continue
+
+            for fd, _ in poller.poll(0):
+                conn = connections.get(fd)
                 try:
-                    state['tcp_server_socket'].close()
-                except Exception:
-                    pass
-                state['tcp_server_socket'] = None
+                    if fd == server_fd:
+                        _selector_accept_batch(poller, connections, server_socket)
+                    elif conn is not None:
+                        _selector_read(poller, connections, conn)
+                except OSError as e:
+                    if fd == server_fd:
+                        server_log.error("TCP server socket error: %s", e)
+                        return
+                    _selector_close(poller, connections, conn)
+                except Exception as e:
+                    server_log.error("TCP server error: %s", e)
 
-            state['tcp_server_running'] = False
+    finally:
+        for conn in list(connections.values()):
+            _selector_close(poller, connections, conn)
+        poller.close()
+        _finish_tcp_server_loop()
 
-        print("[TCP Server] Loop finished.")
-        log_and_emit("TCP server loop finished.", "SERVER")
-        update_dashboard_on_frontend()
 
 def start_tcp_server():
-    print("[start_tcp_server] Function called.")
     """Initializes and starts the TCP server."""
     if state['tcp_server_running']:
-        print("[Main] TCP server is already running.")
-        log_and_emit("TCP server is already running.", "WARNING")
+        server_log.warning("TCP server is already running.")
         return
 
     try:
         server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        print(f"[Main] Binding TCP server to {TCP_HOST}:{TCP_PORT}...")
+        if cluster_bus is not None:
+            # Every worker listens on the same port; the kernel spreads new connections
+            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        server_log.debug("Binding TCP server to %s:%s...", TCP_HOST, TCP_PORT)
         server_socket.bind((TCP_HOST, TCP_PORT))
-        server_socket.listen(5)
+        server_socket.listen(TCP_LISTEN_BACKLOG)
         server_socket.settimeout(1.0)  # Non-blocking accept
 
         with state['lock']:
             state['tcp_server_socket'] = server_socket
             state['tcp_server_running'] = True
 
-        eventlet.spawn(tcp_server_loop)
-        print("[Main] TCP server thread started.")
-        
-        log_and_emit(f"TCP server started on {TCP_HOST}:{TCP_PORT}", "SERVER")
+        if INGEST_ENGINE == 'selector' and hasattr(_native_select, 'epoll'):
+            eventlet.spawn(selector_server_loop)
+        else:
+            eventlet.spawn(tcp_server_loop)
+        server_log.info("TCP server started on %s:%s", TCP_HOST, TCP_PORT)
         update_dashboard_on_frontend()
     except Exception as e:
-        print(f"[Main] Failed to start TCP server: {e}")
-        log_and_emit(f"Failed to start TCP server: {e}", "ERROR")
+        server_log.error("Failed to start TCP server: %s", e)
         state['tcp_server_running'] = False
         update_dashboard_on_frontend()
 
 
 
 
-# Watchdog thread to remove inactive clients
-def client_timeout_watcher(timeout_seconds, interval_seconds):
+def suppression_summary_writer():
     """
-    Periodically checks for clients that haven't sent an application message recently.
-    If a client is silent for too long, its connection is assumed to be stalled or dead,
-    and the watcher forcefully closes the socket. This allows the client's handler
-    thread to perform a full cleanup.
+    Logs, once per interval, how many button presses each rate-limited device had
+    dropped and how many connections each denied IP had refused.
     """
+    limiter = state['press_limiter']
+    deny_list = state['deny_list']
     while True:
-        time.sleep(interval_seconds)
-        now = datetime.now()
-
-        # Create a list of clients to drop to avoid modifying dict while iterating
-        clients_to_close = []
-        with state['lock']:
-            # Check for clients that are connected but haven't sent data
-            for client_id, last_seen_time in state['last_seen'].items():
-                if client_id in state['clients'] and (now - last_seen_time).total_seconds() > timeout_seconds:
-                    clients_to_close.append(client_id)
-        
-        # Now, close the sockets for the timed-out clients
-        for client_id in clients_to_close:
-            with state['lock']:
-                # Check if client still exists before trying to close
-                if client_id in state['clients']:
-                    client_socket = state['clients'][client_id]['socket']
-                    log_and_emit(
-                        f"Client {client_id} timed out after {timeout_seconds}s of inactivity. Closing connection.",
-                        "SERVER"
-                    )
-                    try:
-                        # Closing the socket will cause the recv() in the client's
-                        # handler thread to raise an exception, which triggers the full cleanup.
-                        client_socket.close()
-                    except Exception as e:
-                        print(f"[Watcher] Error closing socket for timed-out client {client_id}: {e}")
+        eventlet.sleep(PRESS_SUMMARY_INTERVAL_S)
+        for client_id, count in sorted(limiter.pop_suppressed().items()):
+            alarm_log.warning(
+                "Device %s: %d button presses suppressed in %ss.", client_id, count, PRESS_SUMMARY_INTERVAL_S,
+                extra={'device_id': client_id, 'suppressed': count}
+            )
+            state['journal'].record('presses_suppressed', client_id, count=count, interval=PRESS_SUMMARY_INTERVAL_S)
+        for client_ip, count in sorted(deny_list.pop_denied().items()):
+            tcp_log.warning(
+                "IP %s: %d connections denied in %ss.", client_ip, count, PRESS_SUMMARY_INTERVAL_S,
+                extra={'ip': client_ip, 'denied': count}
+            )
+            state['journal'].record('connections_denied', ip=client_ip, count=count, interval=PRESS_SUMMARY_INTERVAL_S)
 
-# -----------------------------------------------------------------------------
-# WebSocket Event Handlers (Communication with React Frontend)
-# -----------------------------------------------------------------------------
 
-@socketio.on('connect')
-def handle_connect():
-    """Handler for when a new web client connects."""
-    log_and_emit("Web UI connected.", "SERVER")
+# Watchdog thread to remove inactive clients
+def liveness_watcher():
+    """
+    Closes the connection of every client that hasn't sent an application message
+    within its timeout. A silent connection is assumed to be stalled or dead; shutting
+    it down lets the client's ingest engine perform the full cleanup. The watcher
+    sleeps until the earliest deadline, so it costs nothing while devices are healthy.
+    """
+    tracker = state['liveness']
+    while True:
+        tracker.wakeup.clear()
+        tracker.wakeup.wait(tracker.seconds_until_next())
 
-    # Send current clients + LEDs
-    client_list, led_states = _get_current_client_and_led_states()
-    emit('update_clients', client_list, broadcast=False)
-    emit('update_leds', led_states, broadcast=False)
+        for client_id in tracker.pop_expired():
+            view = get_connected_device(client_id)
+            if view is None:
+                continue
+            client_socket = view.socket
+            tcp_log.info(
+                "Client %s timed out after %ss of inactivity. Closing connection.",
+                client_id, tracker.timeout_for(client_id), extra={'device_id': client_id}
+            )
+            state['journal'].record('timeout', client_id, timeout=tracker.timeout_for(client_id))
+            try:
+                disconnect_client_socket(client_socket)
+            except Exception as e:
+                tcp_log.warning(
+                    "Error closing socket for timed-out client %s: %s", client_id, e,
+                    extra={'device_id': client_id}
+                )
 
-    # Send logs
-    with state['lock']:
-        logs = state['logs'][:]
-        status = {
-            'server_running': state['tcp_server_running'],
-            'client_count': len(state['clients']),
+def heartbeat_sender():
+    """
+    Sends the heartbeat pings as they fall due and reports links that stopped
+    answering (see heartbeat.py). Like liveness_watcher it sleeps until the next
+    scheduled ping. Pongs are handled by process_esp_event.
+    """
+    monitor = state['heartbeat']
+    while True:
+        monitor.wakeup.clear()
+        monitor.wakeup.wait(monitor.seconds_until_next())
+
+        pings, changes = monitor.pop_due()
+        for client_id, seq in pings:
+            send_to_devices([client_id], (json.dumps({'type': 'ping', 'seq': seq}) + '\n').encode('utf-8'))
+        for client_id, status in changes:
+            report_link_status(client_id, status)
+
+def publish_link_stats(client_id):
+    """Pushes a device's link status and RTT percentiles to the web clients."""
+    link_stats = state['heartbeat'].stats(client_id)
+    if link_stats is not None:
+        mark_device_changed(
+            client_id, link=link_stats['status'], rtt_p50_ms=link_stats['p50'], rtt_p95_ms=link_stats['p95']
+        )
+
+def report_link_status(client_id, status):
+    """Logs, journals and publishes a change of a device link's heartbeat status."""
+    link_stats = state['heartbeat'].stats(client_id) or {}
+    if status == heartbeat.OK:
+        tcp_log.info(
+            "Link to client %s recovered (RTT p50 %sms).", client_id, link_stats.get('p50'),
+            extra={'device_id': client_id}
+        )
+    elif status == heartbeat.DEGRADED:
+        tcp_log.warning(
+            "Link to client %s degraded: RTT p50 %sms, p95 %sms.", client_id,
+            link_stats.get('p50'), link_stats.get('p95'), extra={'device_id': client_id}
+        )
+    else:
+        tcp_log.warning(
+            "Client %s stopped answering heartbeats (%d missed).", client_id, HEARTBEAT_MISSED_LIMIT,
+            extra={'device_id': client_id}
+        )
+    state['journal'].record(
+        f'link_{status}', client_id, rtt_p50_ms=link_stats.get('p50'), rtt_p95_ms=link_stats.get('p95')
+    )
+    state['heartbeat'].report_due(client_id, 0)  # Restarts the periodic report interval
+    publish_link_stats(client_id)
+
+def dashboard_ticker():
+    """
+    Pushes the dashboard status, with the windowed statistics, to the web clients
+    every DASHBOARD_TICK_MS if it changed. Device events only update counters (see
+    stats.py), so the dashboard costs at most one emit per tick at any event rate.
+    In multi-process mode every worker reports its own figures to the others each
+    tick, and worker 0 emits the cluster-wide status to every browser.
+    """
+    published = emitted = None
+    while True:
+        eventlet.sleep(DASHBOARD_TICK_MS / 1000.0)
+        if cluster_bus is not None:
+            own = _cluster_stats()
+            if own != published:
+                cluster_bus.publish('stats', own)
+                published = own
+            if CLUSTER_WORKER != 0:
+                continue
+        status = _get_dashboard_status()
+        if status != emitted:
+            socketio.emit('update_dashboard', status)
+            emitted = status
+
+def event_journal_writer():
+    """
+    Writes the queued journal events to SQLite every EVENT_FLUSH_INTERVAL_MS, one
+    transaction per batch. The insert runs on a worker thread so disk latency never
+    stalls the event loop that serves devices and web clients.
+    """
+    events = state['journal']
+    while True:
+        eventlet.sleep(EVENT_FLUSH_INTERVAL_MS / 1000.0)
+        batch = events.drain()
+        if not batch:
+            continue
+        try:
+            started = time.perf_counter()
+            tpool.execute(events.write, batch)
+            if METRICS_ENABLED:
+                JOURNAL_WRITE_SECONDS.observe(time.perf_counter() - started)
+        except Exception as e:
+            journal_log.error("Error writing %d events, will retry: %s", len(batch), e)
+
+def start_traffic_recording():
+    """Starts recording device traffic to TRAFFIC_RECORD_FILE, replacing an earlier recording."""
+    state['recorder'] = recording.TrafficRecorder(
+        TRAFFIC_RECORD_FILE, get_registered_devices(), EVENT_QUEUE_LIMIT,
+    )
+    server_log.info("Recording device traffic to %s.", TRAFFIC_RECORD_FILE)
+
+def traffic_record_writer():
+    """
+    Writes the queued traffic events every EVENT_FLUSH_INTERVAL_MS on a worker
+    thread, and closes a recording once it has been stopped or replaced.
+    """
+    active = None
+    while True:
+        eventlet.sleep(EVENT_FLUSH_INTERVAL_MS / 1000.0)
+        recorder = state['recorder']
+        try:
+            if active is not None and active is not recorder:
+                tpool.execute(active.close)
+                server_log.info("Traffic recording %s closed: %d events.", active.path, active.written)
+            active = recorder
+            if recorder is not None and len(recorder):
+                tpool.execute(recorder.flush)
+        except Exception as e:
+            server_log.error("Error writing traffic recording, stopping it: %s", e)
+            if state['recorder'] is active:
+                state['recorder'] = None
+            active = None
+
+def log_writer():
+    """
+    Drains the log pipeline every LOG_FLUSH_INTERVAL_MS. Records at or above the UI
+    log level go to the web log view first; formatting and writing the console/file
+    output then runs on a worker thread so a slow terminal never stalls the event loop.
+    """
+    pipeline = state['log_pipeline']
+    while True:
+        eventlet.sleep(LOG_FLUSH_INTERVAL_MS / 1000.0)
+        batch = pipeline.drain()
+        if not batch:
+            continue
+        ui_level = state['ui_log_level']
+        for record in batch:
+            if record.levelno >= ui_level:
+                log_and_emit(
+                    record.getMessage(), _ui_log_type(record), record.created, getattr(record, 'device_id', None)
+                )
+        try:
+            tpool.execute(pipeline.write, batch)
+        except Exception as e:
+            # Nowhere left to log this; stderr is the last resort
+            sys.stderr.write(f"[Logging] Error writing {len(batch)} records: {e}\n")
+
+# -----------------------------------------------------------------------------
+# Warm Restart and Graceful Shutdown (see snapshot.py)
+# -----------------------------------------------------------------------------
+
+def collect_runtime_snapshot():
+    """Copies the runtime state that should survive a restart into a JSON-serializable dict."""
+    with state['lock']:
+        last_activity = state['last_activity_time']
+        data = {
+            'global_sound': state['global_selected_sound'],
             'message_count': state['message_count'],
-            'last_activity': state['last_activity_time'].strftime("%H:%M:%S")
-                             if state['last_activity_time'] else "N/A"
+            'last_activity': last_activity.timestamp() if last_activity else None,
+        }
+    data['devices'] = [
+        {
+            'id': client_id, 'alarming': view.alarming, 'sound': view.sound,
+            'messages': view.messages, 'presses': view.presses,
+            'last_seen': view.last_seen, 'ip': view.ip, 'mac': view.mac,
         }
+        for client_id, view in device_views()
+    ]
+    with state['log_lock']:
+        data['logs'] = list(state['logs'])
+        data['log_seq'] = state['log_seq']
+    with state['ui_lock']:
+        data['ui_version'] = state['ui_version']
+    return data
+
+def restore_runtime_snapshot():
+    """
+    Loads SNAPSHOT_FILE into the state. Runs at startup after the registry is
+    loaded and before devices or web clients can connect, so the first browser
+    gets the restored alarms right away. Devices that were deleted meanwhile are
+    skipped.
+    """
+    try:
+        data = snapshot.load(SNAPSHOT_FILE, SNAPSHOT_MAX_AGE_S)
+    except ValueError as e:
+        server_log.warning("Ignoring runtime snapshot %s: %s", SNAPSHOT_FILE, e)
+        return
+    if data is None:
+        return
+
+    restored = alarms = 0
+    with state['lock']:
+        state['global_selected_sound'] = data['global_sound']
+        state['message_count'] = data['message_count']
+        if data['last_activity'] is not None:
+            state['last_activity_time'] = datetime.fromtimestamp(data['last_activity'])
+    for record in data['devices']:
+        client_id = record['id']
+        if get_device(client_id) is None:
+            continue
+        device_state = _device_state(client_id)
+        with device_state.lock:
+            device_state.update(
+                alarming=record['alarming'], led_state='alarm' if record['alarming'] else 'off',
+                sound=record['sound'], messages=record['messages'], presses=record['presses'],
+                last_seen=record['last_seen'], ip=record['ip'], mac=record['mac'],
+            )
+        restored += 1
+        alarms += record['alarming']
+    with state['log_lock']:
+        # Entries logged during startup go after the restored ones
+        startup_entries = list(state['logs'])
+        state['logs'].clear()
+        state['logs'].extend(data['logs'])
+        seq = data['log_seq']
+        for entry in startup_entries:
+            seq += 1
+            state['logs'].append(dict(entry, seq=seq))
+        state['log_seq'] = seq
+    with state['ui_lock']:
+        # Web clients compare change versions, so they must keep increasing across restarts
+        state['ui_version'] = max(state['ui_version'], data['ui_version'])
+    server_log.info(
+        "Restored runtime snapshot from %s: %d devices, %d active alarms, %d log entries.",
+        datetime.fromtimestamp(data['saved_at']).strftime('%Y-%m-%d %H:%M:%S'), restored, alarms, len(data['logs'])
+    )
+
+def write_runtime_snapshot():
+    """
+    Collects the runtime state on the event loop and writes it to SNAPSHOT_FILE
+    on a worker thread. Returns True if the snapshot was written.
+    """
+    data = collect_runtime_snapshot()
+    try:
+        tpool.execute(snapshot.save, SNAPSHOT_FILE, data)
+    except Exception as e:
+        server_log.error("Error writing runtime snapshot %s: %s", SNAPSHOT_FILE, e)
+        return False
+    return True
+
+def _snapshot_fingerprint():
+    """
+    A cheap summary of what collect_runtime_snapshot() copies, to tell whether the
+    state moved since the last snapshot. Device message counters and last_seen
+    are left out: every device message moves them, even one that changes nothing
+    else, and they are saved with the next other change and on shutdown.
+    """
+    with state['lock']:
+        counters = (state['global_selected_sound'], state['message_count'], state['last_activity_time'])
+    with state['log_lock']:
+        logs = (state['log_seq'], len(state['logs']))  # Clearing the logs keeps the seq
+    with state['ui_lock']:
+        ui_version = state['ui_version']
+    devices = [
+        (client_id, view.alarming, view.sound, view.presses, view.ip, view.mac) for client_id, view in device_views()
+    ]
+    return counters, logs, ui_version, devices
+
+def snapshot_writer():
+    """Writes the runtime snapshot every SNAPSHOT_INTERVAL_S, unless nothing changed since the last one."""
+    written = None
+    while True:
+        eventlet.sleep(SNAPSHOT_INTERVAL_S)
+        fingerprint = _snapshot_fingerprint()
+        if fingerprint != written and write_runtime_snapshot():
+            written = fingerprint
+
+def graceful_shutdown(main_greenlet):
+    """
+    Stops accepting devices, gives the connected ones SHUTDOWN_DRAIN_S to receive
+    their queued messages and closes them, then flushes the event journal, the
+    runtime snapshot and the logs before stopping the web server, which runs in
+    main_greenlet.
+    """
+    server_log.info("Shutting down.")
+    with state['lock']:
+        state['tcp_server_running'] = False  # The accept loop exits within its 1 s timeout
+
+    deadline = time.monotonic() + SHUTDOWN_DRAIN_S
+    while time.monotonic() < deadline:
+        sending = any(view.outbox is not None and len(view.outbox) for _, view in device_views())
+        if not sending:
+            break
+        eventlet.sleep(0.05)
+    sockets = [view.socket for _, view in device_views() if view.connected]
+    for client_socket in sockets:
+        disconnect_client_socket(client_socket)
+    eventlet.sleep(0.1)  # Let the connection handlers record their disconnects
+
+    events = state['journal']
+    try:
+        written = tpool.execute(events.flush)
+        journal_log.info("Flushed %d journal events.", written)
+    except Exception as e:
+        journal_log.error("Error flushing %d journal events: %s", len(events), e)
+    if SNAPSHOT_FILE and CLUSTER_WORKER is None:
+        write_runtime_snapshot()
+    recorder, state['recorder'] = state['recorder'], None
+    if recorder is not None:
+        try:
+            tpool.execute(recorder.close)
+        except Exception as e:
+            server_log.error("Error closing traffic recording: %s", e)
+    server_log.info("Shutdown complete: %d devices disconnected.", len(sockets))
 
-    emit('all_logs', logs, broadcast=False)
-    emit('update_dashboard', status, broadcast=False)
+    pipeline = state['log_pipeline']
+    pipeline.write(pipeline.drain())
+    eventlet.hubs.get_hub().schedule_call_global(0, main_greenlet.throw, SystemExit)
+
+def install_shutdown_handlers():
+    """Runs graceful_shutdown() on SIGTERM and SIGINT. Must be called from the main greenlet."""
+    main_greenlet = eventlet.getcurrent()
+    started = []
+
+    def on_signal(signum, _frame):
+        if not started:  # A second signal while draining is ignored
+            started.append(signum)
+            eventlet.spawn_n(graceful_shutdown, main_greenlet)
+
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, on_signal)
+
+# -----------------------------------------------------------------------------
+# Cluster (Multi-process mode, see cluster.py)
+# -----------------------------------------------------------------------------
+
+def _route_to_owner(event, data, client_id):
+    """
+    In multi-process mode, forwards a device command from a web client to the
+    worker holding the device's connection. Returns True if it was forwarded;
+    otherwise (the device is connected here, or nowhere) the caller handles it.
+    """
+    if cluster_bus is None:
+        return False
+    if get_connected_device(client_id) is not None:
+        return False
+    with state['lock']:
+        owner = state['ownership'].owner(client_id)
+    if owner is None or owner == CLUSTER_WORKER:
+        return False
+    cluster_bus.publish('command', {'worker': owner, 'event': event, 'data': data})
+    return True
+
+def _broadcast_command(event, data=None):
+    """In multi-process mode, has every other worker apply a setting or reset to its own devices."""
+    if cluster_bus is not None:
+        cluster_bus.publish('command', {'worker': None, 'origin': CLUSTER_WORKER, 'event': event, 'data': data})
+
+def _on_cluster_command(message):
+    """Runs a command that another worker addressed to this worker or to all workers."""
+    if message['worker'] == CLUSTER_WORKER:
+        handler = _ROUTED_COMMANDS.get(message['event'])
+    elif message['worker'] is None and message['origin'] != CLUSTER_WORKER:
+        handler = _BROADCAST_COMMANDS.get(message['event'])
+    else:
+        return
+    if handler is not None:
+        eventlet.spawn(handler, message['data'])
+
+def _on_cluster_claim(claim):
+    """Applies a device claim. If it supersedes this worker's connection of the device, closes it."""
+    client_id = claim['device_id']
+    client_socket = None
+    with state['lock']:
+        superseded = state['ownership'].on_claim(client_id, claim['worker'], claim['token'])
+        if claim['worker'] == CLUSTER_WORKER:
+            state['remote_leds'].pop(client_id, None)
+        elif superseded is not None:
+            view = get_connected_device(client_id)
+            if view is not None and view.token == superseded:
+                client_socket = view.socket
+    if client_socket is not None:
+        tcp_log.info(
+            "Client %s reconnected to worker %s. Closing its old connection.", client_id, claim['worker'],
+            extra={'device_id': client_id}
+        )
+        disconnect_client_socket(client_socket)
+
+def _on_cluster_announce(announce):
+    """Records a connection that an existing worker reported after this worker started."""
+    client_id = announce['device_id']
+    with state['lock']:
+        state['ownership'].on_announce(client_id, announce['worker'], announce['token'])
+        if state['ownership'].owner(client_id) == announce['worker'] != CLUSTER_WORKER:
+            state['remote_leds'][client_id] = announce['led_state']
+
+def _on_cluster_release(release):
+    client_id = release['device_id']
+    with state['lock']:
+        state['ownership'].on_release(client_id, release['worker'], release['token'])
+        if release['worker'] != CLUSTER_WORKER and state['ownership'].owner(client_id) is None:
+            state['remote_leds'].pop(client_id, None)
+
+def _on_cluster_led(change):
+    """Mirrors the LED state of a device connected to another worker, for snapshots."""
+    if change['worker'] == CLUSTER_WORKER:
+        return
+    client_id = change['device_id']
+    with state['lock']:
+        if state['ownership'].owner(client_id) == change['worker']:
+            state['remote_leds'][client_id] = change['led_state']
+    with state['ui_lock']:
+        # Keep local versions ahead of every version the web clients have seen
+        state['ui_version'] = max(state['ui_version'], change['version'])
+        versions = state['device_versions']
+        versions[client_id] = max(versions.get(client_id, 0), change['version'])
+
+def _cluster_stats():
+    """This worker's share of the dashboard figures, as reported to the other workers."""
+    with state['lock']:
+        message_count = state['message_count']
+        last_activity = state['last_activity_time']
+    return {
+        'worker': CLUSTER_WORKER,
+        'message_count': message_count,
+        'last_activity': last_activity.timestamp() if last_activity else None,
+        'activity': state['stats'].snapshot(DASHBOARD_TOP_DEVICES),
+    }
+
+def _publish_cluster_stats():
+    cluster_bus.publish('stats', _cluster_stats())
+
+def _on_cluster_stats(peer_snapshot):
+    if peer_snapshot['worker'] != CLUSTER_WORKER:
+        with state['lock']:
+            state['peer_stats'][peer_snapshot['worker']] = peer_snapshot
+
+def _on_cluster_registry(message):
+    """Another worker changed the devices table: reload it and apply the change to local devices."""
+    if message['worker'] != CLUSTER_WORKER:
+        eventlet.spawn(_reload_registry)
+
+def _reload_registry():
+    load_device_registry()
+    removed, moved = [], []
+    for client_id, view in device_views():
+        device = get_device(client_id)
+        if device is None:
+            removed.append(client_id)
+        elif view.connected and view.ip != device['ip']:
+            moved.append((client_id, view.socket))
+    for client_id in removed:
+        _forget_device(client_id)
+    for client_id, client_socket in moved:
+        tcp_log.info(
+            "Device %s IP changed. Closing old connection.", client_id, extra={'device_id': client_id}
+        )
+        disconnect_client_socket(client_socket)
+
+def _publish_registry_change():
+    if cluster_bus is not None:
+        cluster_bus.publish('registry', {'worker': CLUSTER_WORKER})
+
+def _on_cluster_hello(message):
+    """A worker (re)started: forget what it held and tell it about this worker's connections."""
+    worker = message['worker']
+    if worker == CLUSTER_WORKER:
+        return
+    with state['lock']:
+        gone = state['ownership'].forget_worker(worker)
+        for client_id in gone:
+            state['remote_leds'].pop(client_id, None)
+        state['peer_stats'].pop(worker, None)
+    connections = [(client_id, view.token, view.led_state) for client_id, view in device_views() if view.connected]
+    for client_id in gone:
+        mark_device_changed(client_id, led_state='off')
+    for client_id, token, led_state in connections:
+        cluster_bus.publish('announce', {
+            'device_id': client_id, 'worker': CLUSTER_WORKER, 'token': token, 'led_state': led_state,
+        })
+    _publish_cluster_stats()
+
+def _on_bus_lost():
+    """The supervisor is gone. Without the bus this worker cannot stay consistent, so it exits."""
+    sys.stderr.write(f"[Cluster] Worker {CLUSTER_WORKER} lost the message bus. Exiting.\n")
+    os._exit(1)
+
+def start_cluster_worker():
+    """Connects this worker to the bus and announces it. Call before the TCP server starts."""
+    cluster_bus.subscribe('log', _append_log)
+    cluster_bus.subscribe('command', _on_cluster_command)
+    cluster_bus.subscribe('claim', _on_cluster_claim)
+    cluster_bus.subscribe('announce', _on_cluster_announce)
+    cluster_bus.subscribe('release', _on_cluster_release)
+    cluster_bus.subscribe('led', _on_cluster_led)
+    cluster_bus.subscribe('stats', _on_cluster_stats)
+    cluster_bus.subscribe('registry', _on_cluster_registry)
+    cluster_bus.subscribe('hello', _on_cluster_hello)
+    cluster_bus.start()
+    cluster_bus.publish('hello', {'worker': CLUSTER_WORKER})
+    server_log.info("Worker %s joined the cluster.", CLUSTER_WORKER)
+
+# -----------------------------------------------------------------------------
+# WebSocket Event Handlers (Communication with React Frontend)
+# -----------------------------------------------------------------------------
+
+@socketio.on('connect')
+def handle_connect(auth=None):
+    """
+    Handler for when a new web client connects. A reconnecting client can pass
+    {'log_since': seq} as auth data to receive only the log entries it missed.
+    A control-room screen passes {'zones': [...], 'tags': [...]} to watch only
+    those devices (see handle_subscribe).
+    """
+    auth = auth if isinstance(auth, dict) else {}
+    try:
+        subscription = parse_subscription({key: auth.get(key) for key in ('zones', 'tags')})
+    except ValueError as e:
+        raise ConnectionRefusedError(str(e))
+    subscribe_web_client(request.sid, subscription)
+
+    # Send current clients + LEDs + status; afterwards only deltas are pushed
+    emit_full_snapshot()
+
+    # Send logs: only the missed ones if the client can resume, else the newest page
+    since_seq = auth.get('log_since')
+    missed = get_logs_since(since_seq) if isinstance(since_seq, int) else None
+    if missed is not None:
+        emit('missed_logs', filter_logs(missed, subscription), broadcast=False)
+    else:
+        logs, _ = get_logs_page()
+        emit('all_logs', filter_logs(logs, subscription), broadcast=False)
+
+    web_log.info("Web UI connected.")
+
+
+@socketio.on('disconnect')
+def handle_disconnect(reason=None):
+    """Forgets the subscription of a web client that went away; Socket.IO already dropped its rooms."""
+    state['subscriptions'].pop(request.sid, None)
+
+
+@socketio.on('subscribe')
+def handle_subscribe(data):
+    """
+    Changes which devices this web client watches: {'zones': [...], 'tags': [...]},
+    both empty for every device. A device is watched if it is in one of the
+    zones or has one of the tags. The client then receives a fresh snapshot and
+    log page for its new selection. Acknowledged with the applied subscription,
+    or {'error': ...}.
+    """
+    try:
+        subscription = parse_subscription(data)
+    except ValueError as e:
+        return {'error': str(e)}
+    subscribe_web_client(request.sid, subscription)
+    emit_full_snapshot()
+    logs, _ = get_logs_page()
+    emit('all_logs', filter_logs(logs, subscription), broadcast=False)
+    return subscription.to_dict()
+
+
+@socketio.on('get_logs')
+def handle_get_logs(data):
+    """
+    Returns a page of older log entries as the event acknowledgement:
+    {'before': seq, 'limit': n} -> {'entries': [...], 'has_more': bool}, or
+    {'error': ...} if they are not integers. limit is clamped to 1..LOG_PAGE_SIZE.
+    Entries about devices the client does not watch are left out.
+    """
+    data = data if isinstance(data, dict) else {}
+    before_seq = data.get('before')
+    limit = data.get('limit', LOG_PAGE_SIZE)
+    if before_seq is not None and (isinstance(before_seq, bool) or not isinstance(before_seq, int)):
+        return {'error': 'before must be an integer'}
+    if isinstance(limit, bool) or not isinstance(limit, int):
+        return {'error': 'limit must be an integer'}
+    limit = max(1, min(limit, LOG_PAGE_SIZE))
+    entries, has_more = get_logs_page(before_seq, limit)
+    return {'entries': filter_logs(entries, get_subscription(request.sid)), 'has_more': has_more}
+
+
+@socketio.on('request_resync')
+@socketio.on('get_clients')
+def handle_request_resync():
+    """Re-sends the full snapshot to a web client that lost track of the device deltas."""
+    emit_full_snapshot()
 
 
 @socketio.on('reset_all_leds')
@@ -472,88 +2318,114 @@ def handle_reset_leds():
     Resets all LED states to 'connected' and clears internal alarm states.
     Emits an event to the frontend to stop any sounds it might be playing.
     """
-    with state['lock']:
-        # Reset internal LED and alarm states
-        for client_id in list(state['alarming_clients'].keys()):
-            state['led_states'][client_id] = 'connected'
-            state['alarming_clients'][client_id] = False
-        
-        # Clear the dictionaries safely
-        state['alarming_clients'].clear()
-        if 'alarm_channels' in state:
-            state['alarm_channels'].clear() # Still good to clear our internal reference
+    reset_ids = _reset_local_alarms()
+    _broadcast_command('reset_all_leds')
 
-    log_and_emit("All LEDs and internal alarm states have been reset.", "SERVER")
+    alarm_log.info("All LEDs and internal alarm states have been reset.")
+    state['journal'].record('alarm_reset_all', devices=reset_ids)
     
     # Instruct the frontend to stop all sounds
     socketio.emit('stop_all_sounds_on_frontend')
-    log_and_emit("Sent request to frontend to stop all sounds.", "SERVER")
-    
-    update_clients_and_leds_on_frontend()
+    alarm_log.info("Sent request to frontend to stop all sounds.")
+
+    for client_id in reset_ids:
+        mark_led_changed(client_id)
+
+def _reset_local_alarms():
+    """Clears the alarm state of every device known to this process. Returns the ids that were reset."""
+    reset_ids = []
+    for client_id, device_state in state['device_states'].items():
+        with device_state.lock:
+            view = device_state.view
+            if view.alarming or view.led_state == 'alarm':
+                device_state.update(alarming=False, led_state='connected' if view.connected else view.led_state)
+                reset_ids.append(client_id)
+    return reset_ids
+
+def _apply_remote_reset_all(_data):
+    """Applies a reset_all_leds issued on another worker to this worker's devices."""
+    reset_ids = _reset_local_alarms()
+    if reset_ids:
+        state['journal'].record('alarm_reset_all', devices=reset_ids)
+    for client_id in reset_ids:
+        mark_led_changed(client_id)
+
+def _test_message():
+    return (json.dumps({
+        "type": "test",
+        "message": "Hello Client!",
+        "timestamp": time.time()
+    }) + '\n').encode('utf-8')
 
 @socketio.on('send_test_message')
 def handle_send_test_message(data):
     """Sends a test message to one or all ESP32 clients."""
     client_id_to_send = data.get('client_id') # can be "all" or a specific ID
-    message = json.dumps({
-        "type": "test",
-        "message": "Hello Client!",
-        "timestamp": time.time()
-    }) + '\n'
+    if client_id_to_send != 'all' and _route_to_owner('send_test_message', data, client_id_to_send):
+        return
 
-    with state['lock']:
-        clients_to_send_to = []
-        if client_id_to_send == 'all':
-            clients_to_send_to = state['clients'].items()
-            log_msg = "Sending test message to all clients."
-        elif client_id_to_send in state['clients']:
-            clients_to_send_to = [(client_id_to_send, state['clients'][client_id_to_send])]
-            log_msg = f"Sending test message to client {client_id_to_send}."
-        else:
-            log_msg = f"Cannot send test message: Client {client_id_to_send} not found."
-            clients_to_send_to = []
-        
-        log_and_emit(log_msg, "SERVER")
-        
-        for cid, client in clients_to_send_to:
-            try:
-                client['socket'].send(message.encode('utf-8'))
-            except Exception as e:
-                log_and_emit(f"Failed to send to client {cid}: {e}", "ERROR")
+    # Each device's writer does the actual send, so this never waits on a socket
+    if client_id_to_send == 'all':
+        queued = send_to_devices('all', _test_message())
+        _broadcast_command('send_test_message', data)
+        connected = len(state['ownership']) if cluster_bus is not None else len(queued)
+        log_msg = f"Sending test message to all clients ({connected} connected)."
+    elif send_to_devices([client_id_to_send], _test_message()):
+        log_msg = f"Sending test message to client {client_id_to_send}."
+    else:
+        log_msg = f"Cannot send test message: Client {client_id_to_send} not found."
+
+    web_log.info(log_msg)
 
 @socketio.on('disconnect_client')
 def handle_disconnect_client(data):
     """Forcefully disconnects an ESP32 client."""
     client_id = data.get('client_id')
-    with state['lock']:
-        if client_id in state['clients']:
-            log_and_emit(f"Disconnecting client {client_id} by UI request.", "SERVER")
-            state['clients'][client_id]['socket'].close() # This will trigger the cleanup in handle_esp_client
-            # The removal from the dict happens in the client handler thread
-        else:
-            log_and_emit(f"Cannot disconnect: Client {client_id} not found.", "WARNING")
+    if _route_to_owner('disconnect_client', data, client_id):
+        return
+    view = get_connected_device(client_id)
+    if view is not None:
+        web_log.info("Disconnecting client %s by UI request.", client_id, extra={'device_id': client_id})
+        disconnect_client_socket(view.socket) # This will trigger the cleanup in the ingest engine
+        # The removal from the dict happens in the client handler thread
+    else:
+        web_log.warning("Cannot disconnect: Client %s not found.", client_id)
 
 @socketio.on('clear_logs')
 def handle_clear_log():
-    with state['lock']:
+    _clear_local_logs()
+    _broadcast_command('clear_logs')
+    web_log.info("Log cleared by user.")
+
+def _clear_local_logs(_data=None):
+    """Empties this process's log buffer and resets its message counter."""
+    with state['log_lock']:
         state['logs'].clear()
+    with state['lock']:
         state['message_count'] = 0
-    log_and_emit("Log cleared by user.", "SERVER")
-    update_dashboard_on_frontend()
 
 @socketio.on('reset_alarm')
 def handle_reset_alarm(data):
     client_id = data.get('client_id')
-    with state['lock']:
-        if client_id in state['alarming_clients']:
-            state['alarming_clients'][client_id] = False
-            # Optionally reset LED state from 'alarm' to 'connected' or 'off'
-            if state['led_states'].get(client_id) == 'alarm':
-                state['led_states'][client_id] = 'connected'
-            log_and_emit(f"Alarm reset for client {client_id}.", "SERVER")
-        else:
-            log_and_emit(f"No active alarm found for client {client_id}.", "WARNING")
-    update_clients_and_leds_on_frontend()
+    if _route_to_owner('reset_alarm', data, client_id):
+        return
+    was_alarming = False
+    device_state = state['device_states'].get(client_id)
+    if device_state is not None:
+        with device_state.lock:
+            view = device_state.view
+            was_alarming = view.alarming
+            if was_alarming:
+                # Optionally reset LED state from 'alarm' to 'connected' or 'off'
+                device_state.update(
+                    alarming=False, led_state='connected' if view.led_state == 'alarm' else view.led_state
+                )
+    if was_alarming:
+        alarm_log.info("Alarm reset for client %s.", client_id, extra={'device_id': client_id})
+        state['journal'].record('alarm_reset', client_id)
+    else:
+        alarm_log.warning("No active alarm found for client %s.", client_id, extra={'device_id': client_id})
+    mark_led_changed(client_id)
 
 @socketio.on('set_default_sound')
 def set_default_sound(data):
@@ -561,19 +2433,33 @@ def set_default_sound(data):
     client_id = data.get('client_id')
     sound_file = data.get('sound')
     if client_id and sound_file:
-        with state['lock']:
-            state['client_sound_prefs'][client_id] = sound_file
-            log_and_emit(f"Default alarm for client {client_id} set to '{sound_file}'.", "SERVER")
+        _apply_default_sound(data)
+        _broadcast_command('set_default_sound', data)
+        alarm_log.info(
+            "Default alarm for client %s set to '%s'.", client_id, sound_file, extra={'device_id': client_id}
+        )
+
+def _apply_default_sound(data):
+    device_state = _device_state(data['client_id'])
+    with device_state.lock:
+        device_state.update(sound=data['sound'])
 
 @socketio.on('set_global_sound')
 def set_global_sound(data):
     """Sets the global alarm sound."""
     sound_file = data.get('sound')
     if sound_file:
-        with state['lock']:
-            if state['global_selected_sound'] != sound_file:
-                state['global_selected_sound'] = sound_file
-                log_and_emit(f"Global alarm sound set to '{sound_file}'.", "SERVER")
+        changed = _apply_global_sound(data)
+        if changed:
+            _broadcast_command('set_global_sound', data)
+            alarm_log.info("Global alarm sound set to '%s'.", sound_file)
+
+def _apply_global_sound(data):
+    """Stores the global alarm sound. Returns True if it changed."""
+    with state['lock']:
+        changed = state['global_selected_sound'] != data['sound']
+        state['global_selected_sound'] = data['sound']
+    return changed
 
 @socketio.on('play_buzzer')
 def handle_play_buzzer(data):
@@ -582,30 +2468,64 @@ def handle_play_buzzer(data):
     This function NO LONGER plays the sound directly. Instead, it sets the
     alarm state and emits an event to the frontend, instructing it to play the sound.
     """
-    with state['lock']:
-        if isinstance(data, dict):
-            client_id = data.get('client_id')
-        else:
-            client_id = data
-
-        if client_id is None:
-            log_and_emit("play_buzzer called without a client_id.", "ERROR")
-            return
-
-        sound_file = state.get('client_sound_prefs', {}).get(client_id, state['global_selected_sound'])
-
-        if not state['alarming_clients'].get(client_id, False):
-            state['alarming_clients'][client_id] = True
-            state['led_states'][client_id] = 'alarm'
-            log_and_emit(f"Alarm activated for client {client_id}.", "SERVER")
-        else:
-            log_and_emit(f"Buzzer re-triggered for client {client_id} (already alarming).", "WARNING")
+    if isinstance(data, dict):
+        client_id = data.get('client_id')
+    else:
+        client_id = data
 
-        # Emit an event to the frontend to play the sound
-        socketio.emit('play_sound_on_frontend', {'client_id': client_id, 'sound': sound_file})
-        log_and_emit(f"Sent request to frontend to play '{sound_file}' for client {client_id}.", "SERVER")
+    if client_id is None:
+        alarm_log.error("play_buzzer called without a client_id.")
+        return
+    if _route_to_owner('play_buzzer', data, client_id):
+        return
 
-        update_clients_and_leds_on_frontend()
+    with state['lock']:
+        global_sound = state['global_selected_sound']
+    device_state = _device_state(client_id)
+    with device_state.lock:
+        view = device_state.view
+        sound_file = view.sound or global_sound
+
+        newly_alarming = not view.alarming
+        if newly_alarming:
+            device_state.update(alarming=True, led_state='alarm')
+
+    if newly_alarming:
+        alarm_log.info("Alarm activated for client %s.", client_id, extra={'device_id': client_id})
+    else:
+        alarm_log.warning(
+            "Buzzer re-triggered for client %s (already alarming).", client_id, extra={'device_id': client_id}
+        )
+    state['journal'].record('alarm', client_id, sound=sound_file, retriggered=not newly_alarming)
+
+    # Emit an event to the frontend to play the sound
+    socketio.emit(
+        'play_sound_on_frontend', {'client_id': client_id, 'sound': sound_file}, to=list(get_device_rooms(client_id))
+    )
+    alarm_log.info(
+        "Sent request to frontend to play '%s' for client %s.", sound_file, client_id,
+        extra={'device_id': client_id}
+    )
+
+    mark_led_changed(client_id)
+
+
+# Commands another worker can send this one in multi-process mode (see _on_cluster_command).
+# Routed commands target the worker holding the device; broadcast ones apply the
+# local part of an action that the originating worker has already logged.
+_ROUTED_COMMANDS = {
+    'send_test_message': handle_send_test_message,
+    'disconnect_client': handle_disconnect_client,
+    'reset_alarm': handle_reset_alarm,
+    'play_buzzer': handle_play_buzzer,
+}
+_BROADCAST_COMMANDS = {
+    'reset_all_leds': _apply_remote_reset_all,
+    'send_test_message': lambda data: send_to_devices('all', _test_message()),
+    'clear_logs': _clear_local_logs,
+    'set_default_sound': _apply_default_sound,
+    'set_global_sound': _apply_global_sound,
+}
 
 
 # -----------------------------------------------------------------------------
@@ -615,106 +2535,369 @@ def handle_play_buzzer(data):
 @app.route('/')
 def serve_react_app():
     """Serves the main index.html of the React app."""
-    return send_from_directory(app.static_folder, 'index.html')
+    return serve_static_files('index.html')
 
 @app.route('/<path:path>')
 def serve_static_files(path):
-    """Serves static files like JS, CSS, images for the React app."""
-    return send_from_directory(app.static_folder, path)
+    """
+    Serves static files like JS, CSS, images for the React app from the manifest
+    built at startup. Files that appeared later are read from disk.
+    """
+    response = static_assets.response(path, request)
+    if response is None:
+        return send_from_directory(FRONTEND_DIST, path)
+    return response
 
 
 # -----------------------------------------------------------------------------
 # API Routes for Device Management
 # -----------------------------------------------------------------------------
 
+def _is_valid_liveness_timeout(value):
+    """A liveness timeout is either unset (None) or a positive number of seconds."""
+    if value is None:
+        return True
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0
+
+def _device_fields(data, old_device=None):
+    """
+    Validates the editable fields of a device from request data and returns
+    them as a dict. Fields other than name and IP that the request leaves out
+    keep the old device's values. Raises ValueError.
+    """
+    if not isinstance(data, dict):
+        raise ValueError('Device must be an object')
+    name = data.get('name')
+    ip = data.get('ip')
+    if not name or not ip:
+        raise ValueError('Name and IP are required')
+    if not isinstance(name, str) or not isinstance(ip, str):
+        raise ValueError('Name and IP must be strings')
+    liveness_timeout = data.get('liveness_timeout', old_device.get('liveness_timeout') if old_device else None)
+    if not _is_valid_liveness_timeout(liveness_timeout):
+        raise ValueError('liveness_timeout must be a positive number of seconds')
+    zone, tags = parse_device_grouping(data, old_device)
+    return {
+        'name': name,
+        'ip': ip,
+        'mac': data.get('mac', old_device.get('mac') if old_device else None),
+        'liveness_timeout': liveness_timeout,
+        'zone': zone,
+        'tags': tags,
+    }
+
+DEVICE_COLUMNS = ('name', 'ip', 'mac', 'liveness_timeout', 'zone', 'tags')
+_INSERT_DEVICE = f"INSERT INTO devices ({', '.join(DEVICE_COLUMNS)}) VALUES ({', '.join('?' * len(DEVICE_COLUMNS))})"
+_UPDATE_DEVICE = f"UPDATE devices SET {', '.join(f'{column} = ?' for column in DEVICE_COLUMNS)} WHERE id = ?"
+
+def _device_row(device):
+    """The column values of a device record, in DEVICE_COLUMNS order."""
+    return (
+        device['name'], device['ip'], device['mac'], device['liveness_timeout'],
+        device['zone'], ','.join(device['tags']) or None,
+    )
+
+def _apply_device_update(old_device, device, old_rooms):
+    """
+    Pushes an edited device to the web clients and closes its connection if its
+    IP changed. The registry must already hold the new record.
+    """
+    device_id = device['id']
+    emit_device_moved(device_id, old_rooms, get_device_rooms(device_id))
+
+    if old_device['ip'] != device['ip']:
+        view = get_connected_device(device_id)
+        client_socket = view.socket if view is not None else None
+        if client_socket is not None:
+            web_log.info(
+                "Device %s IP changed from %s to %s. Closing old connection.", device_id, old_device['ip'], device['ip'],
+                extra={'device_id': device_id}
+            )
+            disconnect_client_socket(client_socket)
+
+    # Clients that just started watching the device (new zone or tag) need the whole record
+    mark_device_changed(
+        device_id, name=device['name'], ip=device['ip'], mac=device['mac'], zone=device['zone'],
+        tags=device['tags'], led_state=_current_led_state(device_id)
+    )
+
 @app.route('/api/devices', methods=['GET'])
 def get_devices():
-    """API endpoint to get all registered devices."""
-    conn = get_db_connection()
-    devices = conn.execute('SELECT * FROM devices').fetchall()
-    conn.close()
-    return jsonify([dict(row) for row in devices])
+    """
+    API endpoint to list the registered devices, ordered by id. Optional query
+    parameters: zone, tag, q (substring of the name or IP), limit, and after (the
+    last id of the previous page). The body is always a plain list; when there
+    are more devices a Link header points at the next page, and X-Total-Count
+    holds the number of matching devices. The ETag changes whenever any device
+    does, so pollers can send If-None-Match and get 304 Not Modified.
+    """
+    registry = state['registry']  # One snapshot for both the ETag and the body
+    etag = registry['etag']
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    args = request.args
+    try:
+        limit = int(args['limit']) if 'limit' in args else None
+        after = int(args.get('after', 0))
+    except ValueError:
+        return jsonify({'error': 'limit and after must be integers'}), 400
+    if limit is not None and not 1 <= limit <= DEVICE_PAGE_MAX:
+        return jsonify({'error': f'limit must be between 1 and {DEVICE_PAGE_MAX}'}), 400
+
+    devices = registry['by_id'].values()
+    zone, tag, query = args.get('zone'), args.get('tag'), args.get('q', '').lower()
+    if zone:
+        devices = [device for device in devices if device.get('zone') == zone]
+    if tag:
+        devices = [device for device in devices if tag in device['tags']]
+    if query:
+        devices = [device for device in devices if query in device['name'].lower() or query in device['ip']]
+    devices = list(devices)
+    total = len(devices)
+    if after:
+        devices = [device for device in devices if device['id'] > after]
+    page = devices if limit is None else devices[:limit]
+
+    response = jsonify(page)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'  # Cacheable, but always revalidated
+    response.headers['X-Total-Count'] = str(total)
+    if len(page) < len(devices):
+        next_args = args.to_dict()
+        next_args['after'] = page[-1]['id']
+        next_url = f"{request.base_url}?{urlencode(next_args)}"
+        response.headers['Link'] = f'<{next_url}>; rel="next"'
+    return response
 
 @app.route('/api/devices', methods=['POST'])
 def add_device():
     """API endpoint to add a new device."""
-    new_device = request.json
-    name = new_device.get('name')
-    ip = new_device.get('ip')
-    mac = new_device.get('mac')
+    try:
+        device = _device_fields(request.json)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-    if not name or not ip:
-        return jsonify({'error': 'Name and IP are required'}), 400
+    if get_device_by_name(device['name']) is not None:
+        return jsonify({'error': 'Device name already exists'}), 409
 
     conn = get_db_connection()
     try:
-        existing_device = conn.execute('SELECT id FROM devices WHERE name = ?', (name,)).fetchone()
-        if existing_device:
-            conn.close()
-            return jsonify({'error': 'Device name already exists'}), 409
-
         cursor = conn.cursor()
-        cursor.execute('INSERT INTO devices (name, ip, mac) VALUES (?, ?, ?)', (name, ip, mac))
+        cursor.execute(_INSERT_DEVICE, _device_row(device))
         conn.commit()
-        new_id = cursor.lastrowid
+        device['id'] = cursor.lastrowid
         conn.close()
+        registry_put(device)
+        _publish_registry_change()
         
-        # After adding, fetch all devices again to update the frontend
-        update_clients_and_leds_on_frontend()
+        # Push the new device to the frontend
+        mark_device_changed(
+            device['id'], name=device['name'], ip=device['ip'], mac=device['mac'],
+            zone=device['zone'], tags=device['tags'], led_state='off'
+        )
         
-        return jsonify({'id': new_id, 'name': name, 'ip': ip, 'mac': mac}), 201
+        return jsonify(device), 201
     except sqlite3.IntegrityError:
         conn.close()
         return jsonify({'error': 'IP address already exists'}), 409
 
 @app.route('/api/devices/<int:device_id>', methods=['PUT'])
 def update_device(device_id):
-    """API endpoint to update an existing device."""
-    device_data = request.json
-    name = device_data.get('name')
-    ip = device_data.get('ip')
-    mac = device_data.get('mac')
+    """
+    API endpoint to update an existing device. Fields other than name and IP
+    that the request leaves out keep their current values.
+    """
+    old_device = get_device(device_id)
+    if old_device is None:
+        return jsonify({'error': 'Device not found'}), 404
+    try:
+        device = _device_fields(request.json, old_device)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    device['id'] = device_id
 
-    if not name or not ip:
-        return jsonify({'error': 'Name and IP are required'}), 400
+    existing_device = get_device_by_name(device['name'])
+    if existing_device is not None and existing_device['id'] != device_id:
+        return jsonify({'error': 'Device name already exists for another device'}), 409
 
     conn = get_db_connection()
     try:
-        existing_device = conn.execute('SELECT id FROM devices WHERE name = ? AND id != ?', (name, device_id)).fetchone()
-        if existing_device:
-            conn.close()
-            return jsonify({'error': 'Device name already exists for another device'}), 409
-
-        # --- Get the old IP before updating ---
-        old_device = conn.execute('SELECT ip FROM devices WHERE id = ?', (device_id,)).fetchone()
-        old_ip = old_device['ip'] if old_device else None
-
         cursor = conn.cursor()
-        cursor.execute(
-            'UPDATE devices SET name = ?, ip = ?, mac = ? WHERE id = ?',
-            (name, ip, mac, device_id)
-        )
+        cursor.execute(_UPDATE_DEVICE, _device_row(device) + (device_id,))
         conn.commit()
+        updated = cursor.rowcount > 0
         conn.close()
-
-        # --- Handle disconnection if IP changed ---
-        if old_ip and old_ip != ip:
-            with state['lock']:
-                if device_id in state['clients']:
-                    log_and_emit(
-                        f"Device {device_id} IP changed from {old_ip} to {ip}. Closing old connection.",
-                        "SERVER"
-                    )
-                    state['clients'][device_id]['socket'].close()
-        
-        # After updating, fetch all devices again to update the frontend
-        update_clients_and_leds_on_frontend()
-        
-        return jsonify({'id': device_id, 'name': name, 'ip': ip, 'mac': mac}), 200
+        if not updated:  # Deleted since the registry lookup
+            return jsonify({'error': 'Device not found'}), 404
+        old_rooms = get_device_rooms(device_id)
+        registry_put(device)
+        _publish_registry_change()
+        _apply_device_update(old_device, device, old_rooms)
+
+        return jsonify(device), 200
     except sqlite3.IntegrityError:
         conn.close()
         return jsonify({'error': 'IP address already exists for another device'}), 409
 
+def _bulk_records():
+    """
+    Yields (row number, fields) for every record of a bulk import body, read from
+    the request stream as it arrives. fields is a ValueError for a record that
+    cannot be used; a body that cannot be parsed at all raises ValueError.
+    """
+    content_type = request.mimetype
+    if content_type == 'text/csv':
+        reader = csv.DictReader(io.TextIOWrapper(request.stream, encoding='utf-8', newline=''))
+        for row_number, row in enumerate(reader, 1):
+            # Empty cells mean "not given", so an update keeps the current value
+            fields = {key: value for key, value in row.items() if key and value}
+            if 'liveness_timeout' in fields:
+                try:
+                    fields['liveness_timeout'] = float(fields['liveness_timeout'])
+                except ValueError:
+                    fields = ValueError('liveness_timeout must be a positive number of seconds')
+            yield row_number, fields
+    elif content_type == 'application/x-ndjson':
+        row_number = 0
+        for line in io.TextIOWrapper(request.stream, encoding='utf-8'):
+            if not line.strip():
+                continue
+            row_number += 1
+            try:
+                yield row_number, json.loads(line)
+            except ValueError:
+                yield row_number, ValueError('Invalid JSON')
+    elif content_type == 'application/json':
+        records = request.get_json(silent=True)
+        if not isinstance(records, list):
+            raise ValueError('Body must be a JSON array of devices')
+        yield from enumerate(records, 1)
+    else:
+        raise ValueError('Content-Type must be text/csv, application/x-ndjson or application/json')
+
+@app.route('/api/devices/bulk', methods=['POST'])
+def bulk_import_devices():
+    """
+    API endpoint to create or update many devices at once, matched by name. The
+    body is CSV with a header row, NDJSON or a JSON array, with the same fields
+    as POST /api/devices. Valid rows are written in one transaction and the web
+    clients get one update; invalid rows are skipped and reported by row number.
+    """
+    registry = state['registry']
+    by_name, by_ip = dict(registry['by_name']), dict(registry['by_ip'])
+    changes = {}  # {device id: (record before the import or None, record after)}
+    created = updated = unchanged = 0
+    errors = []
+
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN')
+        for row_number, fields in _bulk_records():
+            if row_number > BULK_MAX_ROWS:
+                conn.rollback()
+                return jsonify({'error': f'At most {BULK_MAX_ROWS} rows per import'}), 413
+            # A name that is not a string cannot be looked up; _device_fields rejects the row
+            name = fields.get('name') if isinstance(fields, dict) else None
+            old_device = by_name.get(name) if isinstance(name, str) else None
+            try:
+                if isinstance(fields, ValueError):
+                    raise fields
+                device = _device_fields(fields, old_device)
+                holder = by_ip.get(device['ip'])
+                if holder is not None and holder['name'] != device['name']:
+                    raise ValueError('IP address already exists for another device')
+            except ValueError as e:
+                errors.append({'row': row_number, 'error': str(e)})
+                continue
+
+            if old_device is not None and all(device[column] == old_device.get(column) for column in DEVICE_COLUMNS):
+                unchanged += 1
+                continue
+            # A savepoint per row, so a row the database rejects does not abort the import
+            conn.execute('SAVEPOINT bulk_row')
+            try:
+                if old_device is None:
+                    device['id'] = conn.execute(_INSERT_DEVICE, _device_row(device)).lastrowid
+                else:
+                    device['id'] = old_device['id']
+                    conn.execute(_UPDATE_DEVICE, _device_row(device) + (device['id'],))
+            except sqlite3.IntegrityError:
+                conn.execute('ROLLBACK TO bulk_row')
+                conn.execute('RELEASE bulk_row')
+                errors.append({'row': row_number, 'error': 'IP address already exists for another device'})
+                continue
+            conn.execute('RELEASE bulk_row')
+
+            if old_device is None:
+                created += 1
+            else:
+                updated += 1
+                by_ip.pop(old_device['ip'], None)
+            by_name[device['name']] = by_ip[device['ip']] = device
+            changes[device['id']] = (changes.get(device['id'], (old_device,))[0], device)
+        conn.commit()
+    except (ValueError, csv.Error) as e:  # UnicodeDecodeError is a ValueError
+        conn.rollback()
+        return jsonify({'error': f'Malformed import: {e}'}), 400
+    finally:
+        conn.close()
+
+    if changes:
+        old_rooms = {device_id: get_device_rooms(device_id) for device_id in changes}
+        load_device_registry()
+        _publish_registry_change()
+        for device_id, (old_device, device) in changes.items():
+            if old_device is None:
+                mark_device_changed(
+                    device_id, name=device['name'], ip=device['ip'], mac=device['mac'],
+                    zone=device['zone'], tags=device['tags'], led_state='off'
+                )
+            else:
+                _apply_device_update(old_device, device, old_rooms[device_id])
+
+    web_log.info(
+        "Bulk import: %d created, %d updated, %d unchanged, %d rejected.",
+        created, updated, unchanged, len(errors)
+    )
+    return jsonify({'created': created, 'updated': updated, 'unchanged': unchanged, 'errors': errors}), 200
+
+EXPORT_CHUNK_ROWS = 500  # Rows per chunk of a streamed export
+
+@app.route('/api/devices/export', methods=['GET'])
+def export_devices():
+    """
+    API endpoint to download every device as CSV (the default) or NDJSON, in a
+    form the bulk import accepts. The response is streamed in chunks.
+    """
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'ndjson'):
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    devices = get_registered_devices()
+
+    def generate():
+        for offset in range(0, len(devices), EXPORT_CHUNK_ROWS):
+            chunk = devices[offset:offset + EXPORT_CHUNK_ROWS]
+            if export_format == 'ndjson':
+                yield ''.join(json.dumps(device) + '\n' for device in chunk)
+                continue
+            out = io.StringIO()
+            writer = csv.writer(out, lineterminator='\n')
+            if offset == 0:
+                writer.writerow(('id',) + DEVICE_COLUMNS)
+            for device in chunk:
+                writer.writerow((device['id'],) + _device_row(device))
+            yield out.getvalue()
+        if not devices and export_format == 'csv':
+            yield ','.join(('id',) + DEVICE_COLUMNS) + '\n'
+
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    response = Response(generate(), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=devices.{export_format}'
+    return response
+
 @app.route('/api/devices/<int:device_id>', methods=['DELETE'])
 def delete_device(device_id):
     """API endpoint to delete a device."""
@@ -724,30 +2907,297 @@ def delete_device(device_id):
     conn.commit()
     conn.close()
     
-    # After deleting, fetch all devices again to update the frontend
-    update_clients_and_leds_on_frontend()
-    
+    # Tell the frontend the device is gone
+    rooms = get_device_rooms(device_id)
+    if registry_remove(device_id) is not None:
+        mark_device_changed(device_id, removed=True, rooms=rooms)
+
+    _forget_device(device_id)
+    _publish_registry_change()
+
     return jsonify({'message': 'Device deleted successfully'}), 200
 
+@app.route('/api/events', methods=['GET'])
+def get_events():
+    """
+    API endpoint to page through the event journal, newest first. Optional query
+    parameters: device_id, type, since and until (Unix timestamps), limit, and the
+    cursor returned as next_cursor by the previous page.
+    """
+    args = request.args
+    try:
+        device_id = int(args['device_id']) if 'device_id' in args else None
+        since = float(args['since']) if 'since' in args else None
+        until = float(args['until']) if 'until' in args else None
+        limit = int(args.get('limit', EVENT_PAGE_SIZE))
+        cursor = journal.decode_cursor(args['cursor']) if 'cursor' in args else None
+    except ValueError:
+        return jsonify({'error': 'device_id, limit and cursor must be valid, since and until numeric'}), 400
+    if not 1 <= limit <= EVENT_PAGE_MAX:
+        return jsonify({'error': f'limit must be between 1 and {EVENT_PAGE_MAX}'}), 400
+
+    conn = get_db_connection()
+    try:
+        events, next_cursor = journal.query_events(
+            conn, device_id=device_id, event_type=args.get('type'),
+            since=since, until=until, cursor=cursor, limit=limit,
+        )
+    finally:
+        conn.close()
+    return jsonify({'events': events, 'next_cursor': next_cursor})
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus scrape endpoint."""
+    if not METRICS_ENABLED:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(metrics_registry.render(), content_type=metrics.CONTENT_TYPE)
+
+def _logging_settings():
+    """The current logging settings as returned by /api/logging."""
+    pipeline = state['log_pipeline']
+    return {
+        'levels': logpipe.get_levels(LOG_LEVELS),
+        'ui_level': logging.getLevelName(state['ui_log_level']),
+        'trace_devices': sorted(state['trace_devices']),
+        'pending': len(pipeline),
+        'dropped': pipeline.dropped,
+    }
+
+@app.route('/api/logging', methods=['GET'])
+def get_logging():
+    """API endpoint with the per-subsystem log levels, the UI log level and the traced devices."""
+    return jsonify(_logging_settings())
+
+@app.route('/api/logging', methods=['PUT'])
+def update_logging():
+    """
+    API endpoint to change logging at runtime. Every key is optional:
+    {'levels': {subsystem: level}, 'ui_level': level, 'trace_devices': [device_id, ...]}.
+    Raw frames are logged (at DEBUG, subsystem 'frames') only for the traced devices.
+    """
+    data = request.json
+    if not isinstance(data, dict):
+        return jsonify({'error': 'A JSON object is required'}), 400
+    levels = data.get('levels', {})
+    trace_devices = data.get('trace_devices')
+    try:
+        if not isinstance(levels, dict) or not set(levels) <= set(LOG_LEVELS):
+            raise ValueError
+        level_numbers = {subsystem: logpipe.level_number(level) for subsystem, level in levels.items()}
+        ui_level = logpipe.level_number(data['ui_level']) if 'ui_level' in data else None
+        if trace_devices is not None and not all(
+            isinstance(device_id, int) and not isinstance(device_id, bool) for device_id in trace_devices
+        ):
+            raise ValueError
+    except (TypeError, ValueError):
+        return jsonify({
+            'error': f'levels must map {", ".join(LOG_LEVELS)} to level names, '
+                     'ui_level must be a level name and trace_devices a list of device ids'
+        }), 400
+
+    logpipe.set_levels(level_numbers)
+    if ui_level is not None:
+        state['ui_log_level'] = ui_level
+    if trace_devices is not None:
+        state['trace_devices'] = set(trace_devices)
+    web_log.info("Logging settings changed: %s", json.dumps(data, sort_keys=True))
+    return jsonify(_logging_settings())
+
+@app.route('/api/outbound', methods=['GET'])
+def get_outbound_stats():
+    """API endpoint with the outbound queue depth, counters and send latency of every connected device."""
+    outboxes = [(client_id, view.outbox) for client_id, view in device_views() if view.connected]
+    return jsonify({
+        'policy': OUTBOUND_FULL_POLICY,
+        'queue_size': OUTBOUND_QUEUE_SIZE,
+        'devices': {client_id: outbox.stats() for client_id, outbox in outboxes},
+    })
+
+def _admin_denied():
+    """Returns an error response unless the request may use the /api/admin endpoints."""
+    if ADMIN_TOKEN is None:
+        if request.remote_addr in ('127.0.0.1', '::1'):
+            return None
+        return jsonify({'error': 'Admin endpoints are only available from localhost'}), 403
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() == 'bearer' and hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8')):
+        return None
+    return jsonify({'error': 'A valid admin token is required'}), 403
+
+@app.route('/api/admin/profile', methods=['POST'])
+def profile_server():
+    """
+    Admin API endpoint that samples the event loop for `seconds` (default 10), every
+    `interval_ms` of CPU time, and returns the profile. `format` selects a JSON summary with the
+    `top` busiest functions (default), 'collapsed' stacks for flame graphs, or a
+    'pstats' file. The request returns when the profile is complete.
+    """
+    denied = _admin_denied()
+    if denied is not None:
+        return denied
+    output = request.args.get('format', 'summary')
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        interval_ms = float(request.args.get('interval_ms', PROFILE_INTERVAL_MS))
+        top = int(request.args.get('top', 25))
+        if not 0 < seconds <= PROFILE_MAX_SECONDS or not 1 <= interval_ms <= 1000 or top < 1:
+            raise ValueError
+        if output not in ('summary', 'collapsed', 'pstats'):
+            raise ValueError
+    except ValueError:
+        return jsonify({
+            'error': f'seconds must be in (0, {PROFILE_MAX_SECONDS}], interval_ms in [1, 1000], top positive '
+                     'and format one of summary, collapsed, pstats'
+        }), 400
+    if state['profiler'] is not None:
+        return jsonify({'error': 'A profile is already being taken'}), 409
+
+    if not hasattr(signal, 'setitimer'):
+        return jsonify({'error': 'Profiling needs SIGPROF, which this platform does not have'}), 501
+
+    profiler = profiling.SamplingProfiler(interval_ms / 1000.0)
+    state['profiler'] = profiler
+    web_log.info("Profiling the event loop for %ss.", seconds)
+    try:
+        profiler.start()
+        eventlet.sleep(seconds)
+    finally:
+        profile = profiler.stop()
+        state['profiler'] = None
+
+    if output == 'collapsed':
+        response = Response(profile.collapsed(), mimetype='text/plain')
+        response.headers['Content-Disposition'] = 'attachment; filename=profile.collapsed.txt'
+        return response
+    if output == 'pstats':
+        response = Response(profile.pstats(), mimetype='application/octet-stream')
+        response.headers['Content-Disposition'] = 'attachment; filename=profile.pstats'
+        return response
+    return jsonify(profile.summary(top))
+
+def _slow_event_settings():
+    tracer = state['slow_events']
+    return {
+        'threshold_ms': tracer.threshold * 1000 if tracer.threshold is not None else None,
+        'slow_total': tracer.slow_total,
+        'events': list(reversed(tracer.events)),  # Newest first
+    }
+
+@app.route('/api/admin/slow-events', methods=['GET'])
+def get_slow_events():
+    """Admin API endpoint with the slowest recent device messages and where their time went."""
+    denied = _admin_denied()
+    if denied is not None:
+        return denied
+    return jsonify(_slow_event_settings())
+
+@app.route('/api/admin/slow-events', methods=['PUT'])
+def update_slow_events():
+    """Admin API endpoint to change the slow event threshold: {'threshold_ms': ms, or null to stop tracing}."""
+    denied = _admin_denied()
+    if denied is not None:
+        return denied
+    data = request.json
+    threshold = data.get('threshold_ms', 0) if isinstance(data, dict) else 0
+    if threshold is not None and (
+        isinstance(threshold, bool) or not isinstance(threshold, (int, float)) or threshold <= 0
+    ):
+        return jsonify({'error': 'threshold_ms must be a positive number or null'}), 400
+    tracer = state['slow_events']
+    tracer.threshold = threshold / 1000.0 if threshold is not None else None
+    tracer.events.clear()
+    web_log.info("Slow event threshold set to %s ms.", threshold)
+    return jsonify(_slow_event_settings())
+
+def _recording_status():
+    recorder = state['recorder']
+    return {
+        'recording': recorder is not None,
+        'file': TRAFFIC_RECORD_FILE,
+        'written': recorder.written if recorder is not None else None,
+        'pending': len(recorder) if recorder is not None else None,
+        'dropped': recorder.dropped if recorder is not None else None,
+    }
+
+@app.route('/api/admin/recording', methods=['GET'])
+def get_recording():
+    """Admin API endpoint with the state of the device traffic recording."""
+    denied = _admin_denied()
+    if denied is not None:
+        return denied
+    return jsonify(_recording_status())
+
+@app.route('/api/admin/recording', methods=['PUT'])
+def update_recording():
+    """
+    Admin API endpoint to start ({'enabled': true}) or stop ({'enabled': false})
+    recording device traffic to TRAFFIC_RECORD_FILE. Starting again overwrites
+    the file. The file is complete within EVENT_FLUSH_INTERVAL_MS of stopping.
+    """
+    denied = _admin_denied()
+    if denied is not None:
+        return denied
+    data = request.json
+    if not isinstance(data, dict) or not isinstance(data.get('enabled'), bool):
+        return jsonify({'error': 'enabled must be true or false'}), 400
+    if cluster_bus is not None:
+        return jsonify({'error': 'Traffic recording is not available in multi-process mode'}), 409
+    if data['enabled'] and state['recorder'] is None:
+        start_traffic_recording()
+    elif not data['enabled'] and state['recorder'] is not None:
+        state['recorder'] = None  # traffic_record_writer closes the file
+        server_log.info("Traffic recording stopped.")
+    return jsonify(_recording_status())
+
     
 # -----------------------------------------------------------------------------
 # Main Execution
 # -----------------------------------------------------------------------------
 
-if __name__ == '__main__':
-
-    print("--- Turbo Tech Backend Starting ---")
+def main():
+    """Runs the backend: as one process, or as the cluster supervisor when WORKERS > 1."""
+    eventlet.spawn(log_writer)  # First, so startup messages are written right away
 
-    print("--- Turbo Tech Backend ---")
+    if WORKERS > 1 and CLUSTER_WORKER is None:
+        server_log.info("Turbo Tech backend starting with %d workers.", WORKERS)
+        init_db()  # Once, before the workers open the database
+        cluster.run_supervisor(WORKERS, (BUS_HOST, BUS_PORT))
+        return
 
-    init_db()  # Initialize the database
+    server_log.info("Turbo Tech backend starting.")
+    install_metrics()  # Before anything takes a lock or opens the database
+    socketio.emit = state['slow_events'].wrap(socketio.emit, 'emit')
+    if CLUSTER_WORKER is None:
+        init_db()  # Initialize the database (the supervisor did it for workers)
+    load_device_registry()  # Authorization and broadcasts read from memory from here on
+    warm_restart = SNAPSHOT_FILE and CLUSTER_WORKER is None
+    if warm_restart:
+        restore_runtime_snapshot()  # Before any device or web client can connect
+    static_assets.max_cached_bytes = STATIC_CACHE_MAX_BYTES
+    static_assets.load()
+    server_log.info("Indexed %d static files.", len(static_assets.assets))
+    if cluster_bus is not None:
+        start_cluster_worker()
 
     start_tcp_server()
 
     # Start the watchdog to clean up stale connections
-
-    # eventlet.spawn(client_timeout_watcher, timeout_seconds=30, interval_seconds=15)
+    eventlet.spawn(liveness_watcher)
+    eventlet.spawn(dashboard_ticker)
+    if HEARTBEAT_ENABLED:
+        eventlet.spawn(heartbeat_sender)
+    eventlet.spawn(suppression_summary_writer)
+    eventlet.spawn(event_journal_writer)
+    eventlet.spawn(traffic_record_writer)
+    if TRAFFIC_RECORDING and CLUSTER_WORKER is None:
+        start_traffic_recording()
+    if warm_restart:
+        eventlet.spawn(snapshot_writer)
+
+    install_shutdown_handlers()
+    socketio.run(app, host=HTTP_HOST, port=HTTP_PORT, debug=False, use_reloader=False)
 
 
-
-    socketio.run(app, host='0.0.0.0', port=5000, debug=False, use_reloader=False)
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Outbound fan-out benchmark.
+
+Connects real TCP devices to the ingest engine over loopback (each device
+binds its own 127.x address so the IP-based authorization tells them apart),
+stalls some of them by never reading, and then broadcasts test messages to
+all devices. With per-device writers, a broadcast should reach every healthy
+device in about the time of a single send, no matter how many devices are
+stalled.
+
+Usage (from the backend directory, Linux only):
+    python benchmarks/fanout.py --devices 200 --stalled 5 --broadcasts 20
+
+Prints one JSON object with the results so runs can be compared between commits.
+"""
+
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import socket
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def device_ip(index):
+    return f'127.1.{index // 250}.{index % 250 + 1}'
+
+
+def setup(devices, engine):
+    """Registers the devices in a temporary database and starts the TCP server."""
+    workdir = tempfile.mkdtemp(prefix='fanout-bench-')
+    app.DATABASE = os.path.join(workdir, 'devices.db')
+    app.init_db()
+    conn = sqlite3.connect(app.DATABASE)
+    conn.executemany(
+        'INSERT INTO devices (name, ip) VALUES (?, ?)',
+        [(f'bench-{i}', device_ip(i)) for i in range(devices)]
+    )
+    conn.commit()
+    conn.close()
+    app.load_device_registry()
+
+    app.INGEST_ENGINE = engine
+    app.TCP_HOST = '127.0.0.1'
+    app.TCP_PORT = 0
+    app.socketio.emit = lambda *args, **kwargs: None
+    app.start_tcp_server()
+    eventlet.sleep(0.1)
+    return app.state['tcp_server_socket'].getsockname()[1]
+
+
+def connect_device(index, port, stalled):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if stalled:
+        # A tiny receive window fills up after a few messages
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024)
+    sock.bind((device_ip(index), 0))
+    sock.connect(('127.0.0.1', port))
+    return sock
+
+
+def run(args):
+    payload_size = args.payload_bytes
+    with contextlib.redirect_stdout(io.StringIO()):
+        port = setup(args.devices, args.engine)
+        sockets = [
+            connect_device(i, port, stalled=i < args.stalled)
+            for i in range(args.devices)
+        ]
+        eventlet.sleep(0.5)
+
+    connected = sum(1 for _, view in app.device_views() if view.connected)
+    healthy = sockets[args.stalled:]
+    message = (json.dumps({'type': 'test', 'pad': 'x' * payload_size}) + '\n').encode()
+
+    enqueue_times, delivery_times = [], []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(args.broadcasts):
+            started = time.perf_counter()
+            app.send_to_devices('all', message)
+            enqueue_times.append(time.perf_counter() - started)
+
+            # Wait until every healthy device has received the whole message
+            pending = {sock: len(message) for sock in healthy}
+            while pending:
+                for sock in list(pending):
+                    pending[sock] -= len(sock.recv(65536))
+                    if pending[sock] <= 0:
+                        del pending[sock]
+            delivery_times.append(time.perf_counter() - started)
+
+    stalled_stats = []
+    for _, view in app.device_views():
+        if view.connected and view.ip in {device_ip(i) for i in range(args.stalled)}:
+            stalled_stats.append(view.outbox.stats())
+
+    enqueue_times.sort()
+    delivery_times.sort()
+    return {
+        'benchmark': 'fanout',
+        'engine': args.engine,
+        'devices': args.devices,
+        'connected': connected,
+        'stalled': args.stalled,
+        'broadcasts': args.broadcasts,
+        'message_bytes': len(message),
+        'policy': app.OUTBOUND_FULL_POLICY,
+        'enqueue_ms': {
+            'p50': round(percentile(enqueue_times, 0.50) * 1000, 3),
+            'max': round(enqueue_times[-1] * 1000, 3),
+        },
+        'delivery_to_all_healthy_ms': {
+            'p50': round(percentile(delivery_times, 0.50) * 1000, 3),
+            'p95': round(percentile(delivery_times, 0.95) * 1000, 3),
+            'max': round(delivery_times[-1] * 1000, 3),
+        },
+        'stalled_devices_dropped': sum(stats['dropped'] for stats in stalled_stats),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--devices', type=int, default=200)
+    parser.add_argument('--stalled', type=int, default=5, help='devices that never read')
+    parser.add_argument('--broadcasts', type=int, default=20)
+    parser.add_argument('--payload-bytes', type=int, default=1024)
+    parser.add_argument('--engine', choices=('greenlet', 'selector'), default='greenlet')
+    print(json.dumps(run(parser.parse_args()), indent=2))
+
+
+if __name__ == '__main__':
+    main()
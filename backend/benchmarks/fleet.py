@@ -0,0 +1,467 @@
+"""
+End-to-end fleet benchmark: button press on a device to play_sound_on_frontend
+arriving in a browser.
+
+Starts the backend in a subprocess on a temporary database with the simulated
+devices registered, then connects thousands of device TCP clients (each binds
+its own 127.x address so the IP-based authorization tells them apart) and a few
+headless Socket.IO observers speaking Engine.IO over a plain WebSocket. Devices
+press at a Poisson rate; every play_sound_on_frontend an observer receives is
+matched to the press that caused it. An optional reconnect storm drops and
+re-opens every device connection at once mid-run, optionally while unregistered
+"intruder" addresses retry connecting as fast as the server closes them.
+
+Usage (from the backend directory, Linux only):
+    python benchmarks/fleet.py --devices 2000 --observers 2 --rate 0.5 --duration 20 --storm-at 10
+    python benchmarks/fleet.py --devices 1000 --storm-at 5 --intruders 50
+
+Prints one JSON object with the results so runs can be compared between commits.
+"""
+
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import json
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import simple_websocket
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import wire  # noqa: E402
+
+HEARTBEAT_SECONDS = 10  # Idle devices re-send their hello to stay within the liveness timeout
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def device_ip(index):
+    return f'127.1.{index // 250}.{index % 250 + 1}'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def process_tree(pid):
+    """Returns pid and the pids of all its descendants, from /proc."""
+    pids = [pid]
+    for task in os.listdir(f'/proc/{pid}/task'):
+        try:
+            with open(f'/proc/{pid}/task/{task}/children') as children:
+                for child in children.read().split():
+                    pids.extend(process_tree(int(child)))
+        except OSError:
+            continue  # Exited meanwhile
+    return pids
+
+
+def read_rss_mb(pid):
+    """
+    Returns (current, peak) resident set size in MB of a process plus its
+    descendants (the workers in multi-process mode), from /proc.
+    """
+    totals = {'VmRSS': 0.0, 'VmHWM': 0.0}
+    for member in process_tree(pid):
+        try:
+            with open(f'/proc/{member}/status') as status:
+                for line in status:
+                    key, _, value = line.partition(':')
+                    if key in totals:
+                        totals[key] += int(value.split()[0]) / 1024.0
+        except OSError:
+            continue
+    return round(totals['VmRSS'], 1), round(totals['VmHWM'], 1)
+
+
+# -----------------------------------------------------------------------------
+# Server side (runs in the subprocess)
+# -----------------------------------------------------------------------------
+
+def serve(args):
+    """Runs the backend the way app.py's __main__ does, on the given ports."""
+    import app
+
+    app.TCP_HOST = '127.0.0.1'
+    app.TCP_PORT = args.tcp_port
+    app.HTTP_HOST = '127.0.0.1'
+    app.HTTP_PORT = args.http_port
+    app.INGEST_ENGINE = args.engine
+    app.METRICS_ENABLED = not args.no_metrics
+    app.WORKERS = args.workers
+    app.BUS_PORT = 0  # Any free port; the supervisor passes it to the workers
+    if not args.press_limit:
+        # Poisson presses often come closer together than the debounce window
+        app.state['press_limiter'].rate = None
+    if args.no_deny:
+        app.state['deny_list'].threshold = None
+
+    if app.CLUSTER_WORKER is None:
+        # Single process, or the supervisor: register the devices once
+        app.init_db()
+        conn = sqlite3.connect(app.DATABASE)
+        conn.executemany(
+            'INSERT INTO devices (name, ip) VALUES (?, ?)',
+            [(f'sim-{i}', device_ip(i)) for i in range(args.devices)]
+        )
+        conn.commit()
+        conn.close()
+    app.main()
+
+
+# -----------------------------------------------------------------------------
+# Load generator
+# -----------------------------------------------------------------------------
+
+class Fleet:
+    """Shared bookkeeping between the simulated devices and the observers."""
+
+    def __init__(self):
+        self.sent = defaultdict(list)  # {client_id: [press send times]}
+        self.pressing = eventlet.event.Event()  # Sent while devices may press
+        self.storm_started = None  # perf_counter() when the storm began
+
+
+class SimDevice:
+    """One simulated ESP32: a TCP connection from its own loopback address."""
+
+    def __init__(self, index, port, binary=False):
+        self.index = index
+        self.client_id = index + 1  # Devices are inserted in order into a fresh table
+        self.port = port
+        self.binary = binary
+        self.seq = 0
+        self.sock = None
+        self.reconnect_ms = None
+
+    def message(self, message_type, **fields):
+        """Encodes one message in the device's wire format."""
+        if not self.binary:
+            return (json.dumps(dict(type=message_type, **fields)) + '\n').encode()
+        self.seq += 1
+        return wire.encode_binary(message_type, self.seq, fields)
+
+    def connect(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind((device_ip(self.index), 0))
+        sock.connect(('127.0.0.1', self.port))
+        hello = self.message('connection', mac='sim')
+        sock.sendall(bytes([wire.MAGIC]) + hello if self.binary else hello)
+        self.sock = sock
+
+    def reconnect(self):
+        started = time.perf_counter()
+        self.sock.close()
+        self.connect()
+        self.reconnect_ms = (time.perf_counter() - started) * 1000
+
+    def run(self, fleet, rate, deadline):
+        """Presses at a Poisson rate until the deadline, pausing while a storm is in progress."""
+        now = last_sent = time.perf_counter()
+        next_press = now + random.expovariate(rate) if rate > 0 else float('inf')
+        while True:
+            eventlet.sleep(max(0.0, min(next_press, last_sent + HEARTBEAT_SECONDS) - now))
+            paused = not fleet.pressing.ready()
+            fleet.pressing.wait()
+            now = time.perf_counter()
+            if now >= deadline:
+                return
+            if paused:
+                # Start a fresh schedule instead of firing every press missed during the storm
+                next_press = now + random.expovariate(rate) if rate > 0 else float('inf')
+                last_sent = now
+                continue
+            try:
+                if now >= next_press:
+                    fleet.sent[self.client_id].append(now)
+                    self.sock.sendall(self.message('button_press'))
+                    next_press = now + random.expovariate(rate)
+                else:
+                    self.sock.sendall(self.message('connection', mac='sim'))
+            except OSError:
+                return
+            last_sent = now
+
+
+class Observer:
+    """A headless web UI: Engine.IO v4 / Socket.IO v5 over a raw WebSocket."""
+
+    def __init__(self, http_port, fleet):
+        self.url = f'ws://127.0.0.1:{http_port}/socket.io/?EIO=4&transport=websocket'
+        self.fleet = fleet
+        self.ws = None
+        self.received = defaultdict(int)  # {client_id: play_sound events seen}
+        self.latencies = []
+        self.unmatched = 0
+        self.connected_since_storm = set()
+        self.ready = eventlet.event.Event()
+
+    def start(self):
+        self.ws = simple_websocket.Client(self.url)
+        self.ws.receive()  # Engine.IO open packet
+        self.ws.send('40')  # Socket.IO connect to the default namespace
+        eventlet.spawn(self._read_loop)
+
+    def _read_loop(self):
+        while True:
+            try:
+                packet = self.ws.receive()
+            except Exception:
+                return
+            if packet is None:
+                return
+            if packet == '2':
+                self.ws.send('3')  # Engine.IO pong
+            elif packet.startswith('40'):
+                self.ready.send(True)
+            elif packet.startswith('42'):
+                self._on_event(*json.loads(packet[2:]))
+
+    def _on_event(self, name, data=None, *_):
+        now = time.perf_counter()
+        if name == 'play_sound_on_frontend':
+            client_id = data['client_id']
+            sent = self.fleet.sent.get(client_id, ())
+            count = self.received[client_id]
+            if count < len(sent):
+                self.latencies.append(now - sent[count])
+                self.received[client_id] = count + 1
+            else:
+                self.unmatched += 1
+        elif name == 'device_changed' and self.fleet.storm_started is not None:
+            for change in data:
+                if change.get('fields', {}).get('led_state') == 'connected':
+                    self.connected_since_storm.add(change['id'])
+
+    def resync(self):
+        """Forgets presses that were never delivered, so later ones still match up."""
+        for client_id, sent in self.fleet.sent.items():
+            self.received[client_id] = len(sent)
+
+    def close(self):
+        try:
+            self.ws.close()
+        except Exception:
+            pass
+
+
+def intrude(index, port, stop, attempts):
+    """An unregistered client that reconnects as soon as the server closes it, until stop is sent."""
+    while not stop.ready():
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+                sock.bind((device_ip(index), 0))
+                sock.connect(('127.0.0.1', port))
+                sock.recv(1)  # Returns once the server has closed the connection
+        except OSError:
+            pass
+        attempts[0] += 1
+        eventlet.sleep(0)
+
+
+def run_storm(fleet, devices, observers, intruders=0):
+    """
+    Pauses presses, reconnects every device at once and waits until the UI shows
+    them all connected. Intruders retry from unregistered addresses meanwhile.
+    """
+    fleet.pressing.reset()
+    eventlet.sleep(1.0)  # Let in-flight presses drain
+    for observer in observers:
+        observer.resync()
+        observer.connected_since_storm.clear()
+
+    stop_intruders = eventlet.event.Event()
+    intruder_attempts = [0]
+    for i in range(intruders):
+        eventlet.spawn(intrude, len(devices) + i, devices[0].port, stop_intruders, intruder_attempts)
+
+    fleet.storm_started = started = time.perf_counter()
+    pool = eventlet.GreenPool(len(devices))
+    for device in devices:
+        pool.spawn(device.reconnect)
+    pool.waitall()
+    connected_s = time.perf_counter() - started
+
+    expected = {device.client_id for device in devices}
+    deadline = started + 60
+    while time.perf_counter() < deadline:
+        if all(expected <= observer.connected_since_storm for observer in observers):
+            break
+        eventlet.sleep(0.01)
+    visible_s = time.perf_counter() - started
+    fleet.storm_started = None
+    stop_intruders.send(True)
+    fleet.pressing.send(True)
+
+    reconnect_ms = sorted(device.reconnect_ms for device in devices)
+    return {
+        'devices': len(devices),
+        'all_tcp_connected_s': round(connected_s, 3),
+        'all_visible_in_ui_s': round(visible_s, 3),
+        'timed_out': visible_s >= 60,
+        'intruders': intruders,
+        'intruder_attempts': intruder_attempts[0],
+        'reconnect_ms': {
+            'p50': round(percentile(reconnect_ms, 0.50), 3),
+            'p95': round(percentile(reconnect_ms, 0.95), 3),
+            'p99': round(percentile(reconnect_ms, 0.99), 3),
+        },
+    }
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='fleet-bench-')
+    tcp_port, http_port = free_port(), free_port()
+    server = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), 'serve', '--devices', str(args.devices),
+         '--tcp-port', str(tcp_port), '--http-port', str(http_port), '--engine', args.engine,
+         '--workers', str(args.workers)]
+        + (['--no-metrics'] if args.no_metrics else [])
+        + (['--press-limit'] if args.press_limit else [])
+        + (['--no-deny'] if args.no_deny else []),
+        cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    observers = []
+    try:
+        deadline = time.time() + 30
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', http_port)).close()
+                break
+            except OSError:
+                if time.time() > deadline or server.poll() is not None:
+                    raise RuntimeError('Backend did not start')
+                eventlet.sleep(0.1)
+        rss_idle = read_rss_mb(server.pid)[0]
+
+        fleet = Fleet()
+        devices = [SimDevice(i, tcp_port, args.binary) for i in range(args.devices)]
+        started = time.perf_counter()
+        pool = eventlet.GreenPool(args.connect_concurrency)
+        for device in devices:
+            pool.spawn(device.connect)
+        pool.waitall()
+        connect_s = time.perf_counter() - started
+
+        for _ in range(args.observers):
+            observer = Observer(http_port, fleet)
+            observer.start()
+            observer.ready.wait()
+            observers.append(observer)
+        eventlet.sleep(1.0)  # Let the initial snapshots settle
+        rss_connected = read_rss_mb(server.pid)[0]
+
+        fleet.pressing.send(True)
+        started = time.perf_counter()
+        deadline = started + args.duration
+        device_pool = eventlet.GreenPool(args.devices + 1)
+        for device in devices:
+            device_pool.spawn(device.run, fleet, args.rate, deadline)
+        storm = None
+        if args.storm_at is not None and args.storm_at < args.duration:
+            eventlet.sleep(args.storm_at)
+            storm = run_storm(fleet, devices, observers, args.intruders)
+        device_pool.waitall()
+        eventlet.sleep(args.drain)  # Deliveries still in flight
+        elapsed = time.perf_counter() - started
+        rss_end, rss_peak = read_rss_mb(server.pid)
+    finally:
+        for observer in observers:
+            observer.close()
+        server.terminate()
+        server.wait()
+
+    presses = sum(len(sent) for sent in fleet.sent.values())
+    latencies = sorted(latency for observer in observers for latency in observer.latencies)
+    delivered = len(observers[0].latencies) if observers else 0
+    return {
+        'benchmark': 'fleet',
+        'engine': args.engine,
+        'wire_format': 'binary' if args.binary else 'json',
+        'metrics': not args.no_metrics,
+        'workers': args.workers,
+        'devices': args.devices,
+        'observers': args.observers,
+        'rate_per_device': args.rate,
+        'duration_s': args.duration,
+        'connect_all_s': round(connect_s, 3),
+        'presses': presses,
+        'delivered_per_observer': delivered,
+        'lost_per_observer': presses - delivered,
+        'unmatched_events': sum(observer.unmatched for observer in observers),
+        'throughput_presses_per_s': round(delivered / elapsed, 1) if elapsed else None,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 0.50) * 1000, 3),
+            'p95': round(percentile(latencies, 0.95) * 1000, 3),
+            'p99': round(percentile(latencies, 0.99) * 1000, 3),
+            'max': round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        },
+        'storm': storm,
+        'server_rss_mb': {
+            'idle': rss_idle,
+            'connected': rss_connected,
+            'end': rss_end,
+            'peak': rss_peak,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    subparsers = parser.add_subparsers(dest='command')
+
+    serve_parser = subparsers.add_parser('serve', help='internal: run the backend under test')
+    serve_parser.add_argument('--devices', type=int, required=True)
+    serve_parser.add_argument('--tcp-port', type=int, required=True)
+    serve_parser.add_argument('--http-port', type=int, required=True)
+    serve_parser.add_argument('--engine', default='greenlet')
+    serve_parser.add_argument('--no-metrics', action='store_true')
+    serve_parser.add_argument('--workers', type=int, default=1)
+    serve_parser.add_argument('--press-limit', action='store_true')
+    serve_parser.add_argument('--no-deny', action='store_true')
+
+    parser.add_argument('--devices', type=int, default=1000)
+    parser.add_argument('--observers', type=int, default=2, help='headless Socket.IO clients')
+    parser.add_argument('--rate', type=float, default=0.2, help='button presses per second per device')
+    parser.add_argument('--duration', type=float, default=15.0, help='seconds of pressing')
+    parser.add_argument('--storm-at', type=float, default=None,
+                        help='seconds into the run at which every device reconnects at once')
+    parser.add_argument('--intruders', type=int, default=0,
+                        help='unregistered addresses that retry connecting throughout the storm')
+    parser.add_argument('--no-deny', action='store_true',
+                        help="disable the backend's deny list for unregistered addresses")
+    parser.add_argument('--drain', type=float, default=2.0, help='seconds to wait for late deliveries')
+    parser.add_argument('--connect-concurrency', type=int, default=200)
+    parser.add_argument('--engine', choices=('greenlet', 'selector'), default='greenlet')
+    parser.add_argument('--no-metrics', action='store_true', help='run the backend with METRICS_ENABLED = False')
+    parser.add_argument('--workers', type=int, default=1, help='backend worker processes (multi-process mode)')
+    parser.add_argument('--binary', action='store_true', help='devices speak the binary wire format')
+    parser.add_argument('--press-limit', action='store_true',
+                        help="keep the backend's per-device press rate limit (suppressed presses count as lost)")
+
+    args = parser.parse_args()
+    if args.command == 'serve':
+        serve(args)
+    else:
+        print(json.dumps(run(args), indent=2))
+
+
+if __name__ == '__main__':
+    main()
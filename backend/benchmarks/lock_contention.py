@@ -0,0 +1,197 @@
+"""
+Lock contention benchmark for the ESP32 message path.
+
+Runs the real process_esp_message() for many devices concurrently while every
+Socket.IO emit is slowed down, simulating a browser on a congested link. Any
+emit (or other I/O) performed inside a critical section then stalls every other
+device, which shows up as lock wait time and message latency.
+
+Usage (from the backend directory):
+    python benchmarks/lock_contention.py --devices 200 --presses 5 --emit-delay-ms 2
+
+Prints one JSON object with the results so runs can be compared between commits.
+"""
+
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+class TimedLock:
+    """Wraps a lock and records how long callers waited for and held it."""
+
+    def __init__(self, lock):
+        self._lock = lock
+        self._owner_depth = 0
+        self._acquired_at = None
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.hold_total = 0.0
+        self.acquisitions = 0
+
+    def acquire(self, *args, **kwargs):
+        start = time.perf_counter()
+        acquired = self._lock.acquire(*args, **kwargs)
+        now = time.perf_counter()
+        if acquired:
+            waited = now - start
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            self.acquisitions += 1
+            if self._owner_depth == 0:
+                self._acquired_at = now
+            self._owner_depth += 1
+        return acquired
+
+    def release(self):
+        self._owner_depth -= 1
+        if self._owner_depth == 0:
+            self.hold_total += time.perf_counter() - self._acquired_at
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class FakeSocket:
+    """Stands in for a device socket; the benchmark never reads or writes it."""
+
+    def fileno(self):
+        return -1
+
+    def shutdown(self, how):
+        pass
+
+    def close(self):
+        pass
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def setup(devices):
+    """Registers the simulated devices in a temporary database and marks them connected."""
+    workdir = tempfile.mkdtemp(prefix='lock-bench-')
+    app.DATABASE = os.path.join(workdir, 'devices.db')
+    app.init_db()
+    conn = sqlite3.connect(app.DATABASE)
+    conn.executemany(
+        'INSERT INTO devices (name, ip) VALUES (?, ?)',
+        [(f'bench-{i}', f'10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}') for i in range(devices)]
+    )
+    conn.commit()
+    conn.close()
+    app.load_device_registry()
+    app.state['press_limiter'].rate = None  # Every press must reach the locks being measured
+
+    for device in app.get_registered_devices():
+        device_id = device['id']
+        device_state = app._device_state(device_id)
+        device_state.update(socket=FakeSocket(), ip=device['ip'], led_state='connected')
+
+
+def run(args):
+    with contextlib.redirect_stdout(io.StringIO()):
+        setup(args.devices)
+
+    # Instrument every lock stored in the shared state
+    timed_locks = {}
+    for key, value in list(app.state.items()):
+        if key.endswith('lock'):
+            timed_locks[key] = app.state[key] = TimedLock(value)
+    # and every device's own lock, reported together
+    device_locks = []
+    for device_state in app.state['device_states'].values():
+        device_state.lock = TimedLock(device_state.lock)
+        device_locks.append(device_state.lock)
+
+    emit_delay = args.emit_delay_ms / 1000.0
+    emit_count = [0]
+
+    def slow_emit(*_args, **_kwargs):
+        emit_count[0] += 1
+        eventlet.sleep(emit_delay)
+
+    app.socketio.emit = slow_emit
+
+    latencies = []
+
+    def device_loop(device_id, ip):
+        for _ in range(args.presses):
+            start = time.perf_counter()
+            app.process_esp_message('{"type": "button_press"}', ip, device_id)
+            latencies.append(time.perf_counter() - start)
+            eventlet.sleep(0)
+
+    pool = eventlet.GreenPool(args.devices)
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for device_id, device in [(device['id'], device) for device in app.get_registered_devices()]:
+            pool.spawn(device_loop, device_id, device['ip'])
+        pool.waitall()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'benchmark': 'lock_contention',
+        'devices': args.devices,
+        'messages': len(latencies),
+        'emit_delay_ms': args.emit_delay_ms,
+        'emits': emit_count[0],
+        'elapsed_s': round(elapsed, 4),
+        'throughput_msg_per_s': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 0.50) * 1000, 3),
+            'p95': round(percentile(latencies, 0.95) * 1000, 3),
+            'p99': round(percentile(latencies, 0.99) * 1000, 3),
+        },
+        'locks': {
+            name: {
+                'acquisitions': lock.acquisitions,
+                'wait_total_ms': round(lock.wait_total * 1000, 3),
+                'wait_max_ms': round(lock.wait_max * 1000, 3),
+                'hold_total_ms': round(lock.hold_total * 1000, 3),
+            }
+            for name, lock in timed_locks.items()
+        },
+        'device_locks': {
+            'locks': len(device_locks),
+            'acquisitions': sum(lock.acquisitions for lock in device_locks),
+            'wait_total_ms': round(sum(lock.wait_total for lock in device_locks) * 1000, 3),
+            'wait_max_ms': round(max((lock.wait_max for lock in device_locks), default=0.0) * 1000, 3),
+            'hold_total_ms': round(sum(lock.hold_total for lock in device_locks) * 1000, 3),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--devices', type=int, default=200)
+    parser.add_argument('--presses', type=int, default=5, help='button presses per device')
+    parser.add_argument('--emit-delay-ms', type=float, default=2.0, help='simulated time spent in each emit')
+    print(json.dumps(run(parser.parse_args()), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Device message parse benchmark: JSON lines vs. the binary wire format.
+
+Encodes the same stream of device messages (mostly button presses, some
+connection hellos) in both formats, then times framing and decoding it into
+DeviceEvents the way the ingest engines do: feed the bytes to a
+NegotiatingFramer in recv-sized chunks, pop the frames and decode each one.
+Only parsing is measured; nothing is dispatched.
+
+Usage (from the backend directory):
+    python benchmarks/parse.py --messages 100000 --press-ratio 0.9
+
+Prints one JSON object with the results so runs can be compared between commits.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import wire  # noqa: E402
+from framing import NegotiatingFramer  # noqa: E402
+
+
+def build_streams(count, press_ratio, seed):
+    """Returns the JSON and binary byte streams of one random message sequence."""
+    rng = random.Random(seed)
+    json_parts, binary_parts = [], [bytes([wire.MAGIC])]
+    for seq in range(count):
+        if rng.random() < press_ratio:
+            message_type, fields = 'button_press', {}
+        else:
+            message_type, fields = 'connection', {'mac': '24:6F:28:%02X:%02X:%02X' % tuple(rng.randrange(256) for _ in range(3))}
+        json_parts.append(json.dumps(dict(type=message_type, **fields)).encode() + b'\n')
+        binary_parts.append(wire.encode_binary(message_type, seq, fields))
+    return b''.join(json_parts), b''.join(binary_parts)
+
+
+def parse_stream(stream, chunk_size):
+    """Frames and decodes a whole stream. Returns the number of events."""
+    framer = NegotiatingFramer(recv_size=chunk_size)
+    events = 0
+    view = memoryview(stream)
+    for offset in range(0, len(stream), chunk_size):
+        framer.feed(view[offset:offset + chunk_size])
+        frames = framer.pop_frames()
+        decode = wire.decode_binary if framer.binary else wire.decode_json
+        for frame in frames:
+            decode(frame)
+            events += 1
+    return events
+
+
+def measure(stream, count, chunk_size, repeats):
+    """Best-of-repeats time for one stream, in nanoseconds per message."""
+    best = float('inf')
+    for _ in range(repeats):
+        started = time.perf_counter()
+        parsed = parse_stream(stream, chunk_size)
+        best = min(best, time.perf_counter() - started)
+        if parsed != count:
+            raise RuntimeError(f"Parsed {parsed} of {count} messages")
+    return best / count * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--press-ratio', type=float, default=0.9, help='share of button presses in the stream')
+    parser.add_argument('--chunk', type=int, default=16384, help='bytes per simulated recv()')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    json_stream, binary_stream = build_streams(args.messages, args.press_ratio, args.seed)
+    json_ns = measure(json_stream, args.messages, args.chunk, args.repeats)
+    binary_ns = measure(binary_stream, args.messages, args.chunk, args.repeats)
+    print(json.dumps({
+        'benchmark': 'parse',
+        'messages': args.messages,
+        'press_ratio': args.press_ratio,
+        'json': {
+            'ns_per_message': round(json_ns, 1),
+            'bytes_per_message': round(len(json_stream) / args.messages, 2),
+        },
+        'binary': {
+            'ns_per_message': round(binary_ns, 1),
+            'bytes_per_message': round(len(binary_stream) / args.messages, 2),
+        },
+        'speedup': round(json_ns / binary_ns, 2),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
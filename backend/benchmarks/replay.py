@@ -0,0 +1,254 @@
+"""
+Replays a recording of device traffic through the real ingest path.
+
+Every event of a recording made with TRAFFIC_RECORDING (see recording.py) goes
+through admit_esp_client(), the framer and process_esp_frames(), and
+release_esp_client(), exactly as on the live server. The differences are that
+the devices are in-memory sockets that keep whatever the backend sends them,
+and that there is no web server: Socket.IO emits are counted and inspected
+instead of delivered. The devices of the recording's header are registered in
+a temporary database with their original ids.
+
+The press rate limiter runs on the recording's clock rather than the wall
+clock, and the heartbeat is off, so the final state depends only on the
+recording: replaying at any speed, or on another commit that handles the same
+traffic the same way, gives the same state digest. When the digests differ,
+--dump-state writes the state they were computed from for a diff.
+
+Usage (from the backend directory):
+    python benchmarks/replay.py traffic.ndjson               # as fast as possible
+    python benchmarks/replay.py traffic.ndjson --speed 1     # in recorded time (2 = twice as fast)
+
+Prints one JSON object with the results so runs can be compared between commits.
+"""
+
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+import recording  # noqa: E402
+from framing import NegotiatingFramer  # noqa: E402
+from ratelimit import PressLimiter  # noqa: E402
+
+
+class ReplaySocket:
+    """Stands in for a device socket: keeps what the backend sends and never blocks."""
+
+    def __init__(self):
+        self.sent = bytearray()
+        self.closed = False
+
+    def setsockopt(self, *args):
+        pass
+
+    def send(self, data):
+        if self.closed:
+            raise BrokenPipeError('replayed connection is closed')
+        self.sent += data
+        return len(data)
+
+    def fileno(self):
+        return -1
+
+    def shutdown(self, how):
+        self.closed = True
+
+    def close(self):
+        self.closed = True
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def latency_ms(values):
+    values = sorted(values)
+    return {
+        'p50': round(percentile(values, 0.50) * 1000, 3),
+        'p95': round(percentile(values, 0.95) * 1000, 3),
+        'p99': round(percentile(values, 0.99) * 1000, 3),
+        'max': round(values[-1] * 1000, 3) if values else 0.0,
+    }
+
+
+def setup(devices, clock):
+    """Registers the recorded devices in a temporary database, under their original ids."""
+    workdir = tempfile.mkdtemp(prefix='replay-')
+    app.DATABASE = os.path.join(workdir, 'devices.db')
+    app.init_db()
+    conn = sqlite3.connect(app.DATABASE)
+    conn.executemany(
+        f"INSERT INTO devices (id, {', '.join(app.DEVICE_COLUMNS)}) "
+        f"VALUES ({', '.join('?' * (len(app.DEVICE_COLUMNS) + 1))})",
+        [(device['id'],) + app._device_row(device) for device in devices]
+    )
+    conn.commit()
+    conn.close()
+    app.load_device_registry()
+    app.HEARTBEAT_ENABLED = False  # Pings depend on wall-clock time
+    app.state['press_limiter'] = PressLimiter(
+        app.PRESS_RATE_PER_SECOND, app.PRESS_BURST, app.PRESS_DEBOUNCE_MS / 1000.0, clock=clock
+    )
+
+
+def final_state(ui_changes, sounds, sent):
+    """The state a replay leaves behind, as plain JSON-compatible data."""
+    devices = {}
+    for device_id, view in sorted(app.device_views()):
+        devices[str(device_id)] = {
+            'connected': view.connected,
+            'led_state': view.effective_led_state,
+            'alarming': view.alarming,
+            'messages': view.messages,
+            'presses': view.presses,
+        }
+    # What a web client watching every device ends up showing
+    ui = {}
+    for change in sorted(ui_changes, key=lambda change: change['version']):
+        if change.get('removed'):
+            ui.pop(str(change['id']), None)
+        else:
+            ui.setdefault(str(change['id']), {}).update(change['fields'])
+    return {
+        'devices': devices,
+        'message_count': app.state['message_count'],
+        'presses_suppressed': app.state['press_limiter'].suppressed_total,
+        'ui': ui,
+        'sounds': {f'{client_id}:{sound}': count for (client_id, sound), count in sorted(sounds.items())},
+        'sent_to_devices': {
+            str(device_id): {'bytes': len(data), 'sha256': hashlib.sha256(data).hexdigest()}
+            for device_id, data in sorted(sent.items()) if data
+        },
+        'journal': dict(sorted(Counter(event[1] for event in app.state['journal'].drain()).items())),
+    }
+
+
+def run(args):
+    header, records = recording.load(args.recording)
+    now = [0.0]  # The recording's clock, at the event being replayed
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        setup(header['devices'], lambda: now[0])
+
+    emits = Counter()
+    ui_changes = []
+    sounds = Counter()
+    emit = app.socketio.emit
+
+    def capturing_emit(event, *emit_args, **kwargs):
+        emits[event] += 1
+        if event == 'device_changed' and kwargs.get('to') == app.ROOM_ALL:
+            ui_changes.extend(emit_args[0])
+        elif event == 'play_sound_on_frontend':
+            sounds[emit_args[0]['client_id'], emit_args[0]['sound']] += 1
+        return emit(event, *emit_args, **kwargs)
+
+    app.socketio.emit = capturing_emit
+
+    connections = {}  # {device_id: (ReplaySocket, NegotiatingFramer, ip)}
+    sent = {}  # {device_id: bytearray of everything sent to it, over all its connections}
+    timings = {recording.CONNECT: [], recording.DATA: [], recording.DISCONNECT: []}
+    lag = []
+    skipped = rejected = 0
+    messages_before = app.state['message_count']
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for record in records:
+            if args.speed > 0:
+                delay = started + record.t / args.speed - time.perf_counter()
+                if delay > 0:
+                    eventlet.sleep(delay)
+                lag.append(max(0.0, -delay))
+            now[0] = record.t
+            begun = time.perf_counter()
+            if record.kind == recording.CONNECT:
+                sock = ReplaySocket()
+                device_id = app.admit_esp_client(sock, record.ip)
+                if device_id is None:
+                    rejected += 1
+                    continue
+                sent[device_id] = sent.get(device_id, bytearray())
+                sock.sent = sent[device_id]
+                connections[device_id] = (
+                    sock, NegotiatingFramer(app.MAX_FRAME_LENGTH, app.TCP_RECV_SIZE), record.ip
+                )
+            elif record.kind == recording.DATA:
+                connection = connections.get(record.device_id)
+                if connection is None:
+                    skipped += 1
+                    continue
+                sock, framer, ip = connection
+                framer.feed(record.data)
+                app.process_esp_frames(framer, ip, record.device_id)
+            elif record.kind == recording.DISCONNECT:
+                connection = connections.pop(record.device_id, None)
+                if connection is None:
+                    skipped += 1
+                    continue
+                app.release_esp_client(connection[0], connection[2], record.device_id)
+            else:
+                skipped += 1
+                continue
+            timings[record.kind].append(time.perf_counter() - begun)
+            eventlet.sleep(0)  # Let the device writers run, as the live event loop would
+        elapsed = time.perf_counter() - started
+        # Connections still open at the end of the recording stay open; wait for
+        # the last coalesced UI batch and the device writers
+        eventlet.sleep(2 * app.UI_UPDATE_COALESCE_MS / 1000.0 + 0.05)
+
+    messages = app.state['message_count'] - messages_before
+    result_state = final_state(ui_changes, sounds, sent)
+    canonical = json.dumps(result_state, sort_keys=True, separators=(',', ':'))
+    if args.dump_state:
+        with open(args.dump_state, 'w', encoding='utf-8') as f:
+            json.dump(result_state, f, indent=2, sort_keys=True)
+
+    result = {
+        'benchmark': 'replay',
+        'recording': os.path.basename(args.recording),
+        'recorded_s': round(records[-1].t, 3) if records else 0.0,
+        'speed': args.speed or None,
+        'devices': len(header['devices']),
+        'records': len(records),
+        'skipped': skipped,
+        'rejected': rejected,
+        'messages': messages,
+        'elapsed_s': round(elapsed, 4),
+        'throughput_msg_per_s': round(messages / elapsed, 1) if elapsed else None,
+        'latency_ms': {kind: latency_ms(values) for kind, values in timings.items()},
+        'emits': dict(sorted(emits.items())),
+        'state_sha256': hashlib.sha256(canonical.encode()).hexdigest(),
+    }
+    if lag:
+        result['lag_ms'] = latency_ms(lag)  # How far behind the recorded timing events were replayed
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('recording', help='file written with TRAFFIC_RECORDING')
+    parser.add_argument('--speed', type=float, default=0, help='multiple of recorded time, 0 for as fast as possible')
+    parser.add_argument('--dump-state', metavar='FILE', help='write the final state to FILE')
+    print(json.dumps(run(parser.parse_args()), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+"""
+Multi-process mode: a local message bus and the pieces built on it.
+
+With WORKERS > 1, app.py runs as a supervisor that starts the broker and the
+worker processes. Every worker is a complete backend that binds the device
+port and the HTTP port with SO_REUSEPORT, so the kernel spreads device and
+browser connections across the workers. Workers talk through the broker, a
+small pub/sub hub on a loopback TCP port: every message a worker publishes is
+forwarded to all workers, the sender included, and all of them receive the
+messages in the same order. DeviceOwnership relies on that order to decide,
+identically on every worker, which connection of a device is the newest.
+
+Socket.IO traffic travels on the same bus through BusManager, a python-socketio
+pub/sub client manager. It plays the role of Flask-SocketIO's message_queue
+option without an external broker, so a browser connected to any worker
+receives the events emitted by every worker.
+
+Messages are JSON objects, one per line: {"channel": ..., "data": ...}.
+"""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+
+import eventlet
+import socketio
+from eventlet.queue import LightQueue
+
+import logpipe
+from outbound import OutboundQueue, DISCONNECT
+
+WORKER_ENV = 'TURBOTECH_WORKER'  # Worker index, set by the supervisor
+BUS_ENV = 'TURBOTECH_BUS'  # Broker address as host:port, set by the supervisor
+BUS_QUEUE_SIZE = 10000  # Messages buffered per bus connection
+
+log = logpipe.get_logger('cluster')
+
+
+def worker_from_environ(environ=os.environ):
+    """Returns (worker index, broker address) for a worker process, or (None, None)."""
+    if WORKER_ENV not in environ:
+        return None, None
+    host, _, port = environ[BUS_ENV].rpartition(':')
+    return int(environ[WORKER_ENV]), (host, int(port))
+
+
+def _encode(channel, data):
+    # json.dumps escapes newlines inside strings, so a message is always one line
+    return (json.dumps({'channel': channel, 'data': data}, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+def _drain(sock, outbox):
+    """Writes the queued lines to sock until the queue is closed or the socket fails."""
+    while True:
+        item = outbox.get()
+        if item is None:
+            return
+        data, enqueued_at = item
+        try:
+            sock.sendall(data)
+        except OSError:
+            return
+        outbox.mark_sent(enqueued_at)
+
+
+class Broker:
+    """
+    Forwards every line received on any connection to all connections in arrival
+    order. A connection whose queue overflows is cut off rather than allowed to
+    stall the others.
+    """
+
+    def __init__(self, queue_size=BUS_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._outboxes = {}  # {socket: OutboundQueue}
+
+    def serve(self, listener):
+        """Accepts worker connections forever."""
+        while True:
+            sock, _ = listener.accept()
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            outbox = OutboundQueue(self.queue_size, DISCONNECT)
+            self._outboxes[sock] = outbox
+            eventlet.spawn(_drain, sock, outbox)
+            eventlet.spawn(self._forward, sock)
+
+    def _forward(self, sock):
+        try:
+            for line in sock.makefile('rb'):
+                # No yield between the puts, so every peer gets the lines in one order
+                for peer, outbox in list(self._outboxes.items()):
+                    if not outbox.put(line):
+                        log.error("Bus connection fell %d messages behind. Disconnecting it.", self.queue_size)
+                        self._drop(peer)
+        except OSError:
+            pass
+        finally:
+            self._drop(sock)
+
+    def _drop(self, sock):
+        outbox = self._outboxes.pop(sock, None)
+        if outbox is not None:
+            outbox.close()
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        sock.close()
+
+
+class Bus:
+    """
+    A worker's connection to the broker. publish() only queues the message; a
+    writer greenlet sends it. Handlers subscribed to a channel run on the reader
+    greenlet in bus order, so they must not block. on_lost is called if the
+    connection to the broker ends, after which the worker cannot stay consistent.
+    """
+
+    def __init__(self, address, queue_size=BUS_QUEUE_SIZE, on_lost=None):
+        self.address = address
+        self.on_lost = on_lost
+        self._outbox = OutboundQueue(queue_size)
+        self._handlers = {}  # {channel: callable(data)}
+
+    def subscribe(self, channel, handler):
+        self._handlers[channel] = handler
+
+    def publish(self, channel, data):
+        self._outbox.put(_encode(channel, data))
+
+    @property
+    def dropped(self):
+        """Messages discarded because the broker did not keep up."""
+        return self._outbox.dropped
+
+    def start(self, attempts=50, retry_delay=0.1):
+        """Connects to the broker, retrying while it starts up, and starts the reader and writer."""
+        for attempt in range(attempts):
+            try:
+                sock = eventlet.connect(self.address)
+                break
+            except OSError:
+                if attempt == attempts - 1:
+                    raise
+                eventlet.sleep(retry_delay)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        eventlet.spawn(_drain, sock, self._outbox)
+        eventlet.spawn(self._read, sock)
+
+    def _read(self, sock):
+        try:
+            for line in sock.makefile('rb'):
+                message = json.loads(line)
+                handler = self._handlers.get(message['channel'])
+                if handler is None:
+                    continue
+                try:
+                    handler(message['data'])
+                except Exception:
+                    log.exception("Error handling a %s message from the bus.", message['channel'])
+        except OSError:
+            pass
+        self._outbox.close()
+        if self.on_lost is not None:
+            self.on_lost()
+
+
+class BusManager(socketio.PubSubManager):
+    """Socket.IO client manager that shares emits, disconnects and rooms between workers over a Bus."""
+
+    name = 'turbotech-bus'
+
+    def __init__(self, bus, channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.bus = bus
+        self._inbox = LightQueue()
+
+    def initialize(self):
+        # Subscribed only now: before the server starts there is nobody to deliver to
+        self.bus.subscribe(self.channel, self._inbox.put)
+        super().initialize()
+
+    def _publish(self, data):
+        self.bus.publish(self.channel, data)
+
+    def _listen(self):
+        while True:
+            yield self._inbox.get()
+
+
+class DeviceOwnership:
+    """
+    The cluster-wide record of which worker holds each device's connection,
+    built from claim/release messages in bus order. Each connection is
+    identified by a token; a later claim for the same device supersedes the
+    earlier one, and the worker holding the superseded connection closes it.
+    Because every worker applies the claims in the same order, two workers
+    admitting the same device at once agree on which connection survives.
+    """
+
+    def __init__(self, worker):
+        self.worker = worker
+        self._owners = {}  # {device_id: (worker, token)}
+
+    def on_claim(self, device_id, worker, token):
+        """Applies a claim. Returns the token of a local connection it supersedes, or None."""
+        previous = self._owners.get(device_id)
+        self._owners[device_id] = (worker, token)
+        if previous is not None and previous[0] == self.worker and previous[1] != token:
+            return previous[1]
+        return None
+
+    def on_announce(self, device_id, worker, token):
+        """Records an existing connection reported to a newly started worker, unless a claim is already known."""
+        self._owners.setdefault(device_id, (worker, token))
+
+    def on_release(self, device_id, worker, token):
+        if self._owners.get(device_id) == (worker, token):
+            del self._owners[device_id]
+
+    def forget_worker(self, worker):
+        """Drops every device owned by a worker that restarted. Returns their ids."""
+        device_ids = [device_id for device_id, (owner, _) in self._owners.items() if owner == worker]
+        for device_id in device_ids:
+            del self._owners[device_id]
+        return device_ids
+
+    def owner(self, device_id):
+        """Returns the worker holding the device's connection, or None."""
+        entry = self._owners.get(device_id)
+        return entry[0] if entry is not None else None
+
+    def __len__(self):
+        return len(self._owners)
+
+
+def run_supervisor(workers, bus_address, restart_delay=1.0):
+    """
+    Starts the broker and `workers` copies of the running program, each with its
+    index and the broker address in the environment, and restarts any worker
+    that exits. Blocks until interrupted, then stops the workers.
+    """
+    listener = eventlet.listen(bus_address)
+    eventlet.spawn(Broker().serve, listener)
+    host, port = listener.getsockname()[:2]
+
+    def start(index):
+        env = dict(os.environ, **{WORKER_ENV: str(index), BUS_ENV: f'{host}:{port}'})
+        return subprocess.Popen([sys.executable] + sys.argv, env=env)
+
+    processes = {index: start(index) for index in range(workers)}
+    log.info("Started %d workers, bus on %s:%s.", workers, host, port)
+    try:
+        while True:
+            eventlet.sleep(restart_delay)
+            for index, process in list(processes.items()):
+                if process.poll() is not None:
+                    log.warning("Worker %d exited with code %s. Restarting it.", index, process.returncode)
+                    processes[index] = start(index)
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.wait()
@@ -0,0 +1,192 @@
+"""
+Framing for the ESP32 device protocol: newline-delimited JSON text or
+length-prefixed binary frames (see wire.py), chosen per connection.
+
+Bytes are received straight into a preallocated buffer with recv_into() and
+complete frames are cut out of it through a memoryview, so a burst of messages
+costs one pass over the data instead of a concatenation and split per message.
+Only complete frames are ever decoded, which means a multi-byte UTF-8 sequence
+split across two reads is reassembled before decoding.
+"""
+
+import abc
+
+from wire import HEADER, MAGIC
+
+DEFAULT_MAX_FRAME_LENGTH = 4096
+DEFAULT_RECV_SIZE = 4096
+
+
+class _BufferedFramer(abc.ABC):
+    """The receive buffer shared by the framers. Subclasses implement pop_frames()."""
+
+    _overhead = 0  # Bytes a partial frame may hold on top of max_frame_length
+
+    def __init__(self, max_frame_length=DEFAULT_MAX_FRAME_LENGTH, recv_size=DEFAULT_RECV_SIZE):
+        self.max_frame_length = max_frame_length
+        self.recv_size = recv_size
+        # A partial frame never exceeds max_frame_length + _overhead, so this is always enough room
+        self._buffer = bytearray(max_frame_length + self._overhead + recv_size)
+        self._view = memoryview(self._buffer)
+        self._start = 0  # First byte of the current (incomplete) frame
+        self._scan = 0  # Bytes before this offset are known not to contain a newline
+        self._end = 0  # End of the received data
+        self.oversized_frames = 0  # Frames dropped for exceeding max_frame_length
+        self._ready = []  # Frames split off early by feed()
+
+    def recv_from(self, sock):
+        """
+        Reads once from sock into the buffer and returns the number of bytes read
+        (0 means the peer closed the connection). Socket exceptions propagate.
+        Call pop_frames() after every read so the buffer never fills up.
+        """
+        if len(self._buffer) - self._end < self.recv_size:
+            self._compact()
+        received = sock.recv_into(self._view[self._end:], self.recv_size)
+        self._end += received
+        return received
+
+    def received(self, count):
+        """Returns a copy of the last `count` bytes read by recv_from(), e.g. to record them."""
+        return bytes(self._view[self._end - count:self._end])
+
+    def feed(self, data):
+        """Appends bytes that were received elsewhere (e.g. replayed traffic)."""
+        data = memoryview(data)
+        while len(data):
+            if len(self._buffer) - self._end < self.recv_size:
+                # Consume the complete frames so far to make room for the rest
+                self._ready = self.pop_frames()
+                self._compact()
+            room = len(self._buffer) - self._end
+            chunk = data[:room]
+            self._view[self._end:self._end + len(chunk)] = chunk
+            self._end += len(chunk)
+            data = data[len(chunk):]
+
+    @abc.abstractmethod
+    def pop_frames(self):
+        """Returns every complete frame received so far and consumes it from the buffer."""
+
+    def _compact(self):
+        """Moves the incomplete frame to the front of the buffer."""
+        remaining = self._end - self._start
+        if self._start:
+            self._buffer[:remaining] = self._view[self._start:self._end]
+            self._scan -= self._start
+            self._start = 0
+            self._end = remaining
+
+
+class LineFramer(_BufferedFramer):
+    """Accumulates bytes from a socket and splits them into newline-terminated text frames."""
+
+    def __init__(self, max_frame_length=DEFAULT_MAX_FRAME_LENGTH, recv_size=DEFAULT_RECV_SIZE):
+        super().__init__(max_frame_length, recv_size)
+        self._discarding = False  # True while skipping the rest of an oversized frame
+
+    def pop_frames(self):
+        """Returns every complete frame received so far, decoded and stripped, skipping blank lines."""
+        frames, self._ready = self._ready, []
+        buffer = self._buffer
+        while True:
+            newline = buffer.find(b'\n', self._scan, self._end)
+            if newline == -1:
+                break
+
+            if self._discarding:
+                self._discarding = False
+            elif newline - self._start > self.max_frame_length:
+                self.oversized_frames += 1
+            else:
+                frame = str(self._view[self._start:newline], 'utf-8', 'replace').strip()
+                if frame:
+                    frames.append(frame)
+            self._start = self._scan = newline + 1
+
+        self._scan = self._end
+        if not self._discarding and self._end - self._start > self.max_frame_length:
+            # No terminator within the limit: drop what we have and skip to the next newline
+            self.oversized_frames += 1
+            self._discarding = True
+        if self._discarding:
+            self._start = self._scan = self._end
+
+        if self._start == self._end:
+            self._start = self._scan = self._end = 0
+        return frames
+
+
+class BinaryFramer(_BufferedFramer):
+    """
+    Accumulates bytes from a socket and splits them into length-prefixed binary
+    frames, returned as (type code, seq, body bytes) tuples for wire.decode_binary().
+    """
+
+    _overhead = HEADER.size
+
+    def __init__(self, max_frame_length=DEFAULT_MAX_FRAME_LENGTH, recv_size=DEFAULT_RECV_SIZE):
+        super().__init__(max_frame_length, recv_size)
+        self._skip = 0  # Body bytes of an oversized frame still to be skipped
+
+    def pop_frames(self):
+        """Returns every complete frame received so far. max_frame_length limits the body."""
+        frames, self._ready = self._ready, []
+        unpack_header = HEADER.unpack_from
+        header_size = HEADER.size
+        buffer, view = self._buffer, self._view
+        start, end = self._start, self._end
+        while True:
+            if self._skip:
+                skipped = min(self._skip, end - start)
+                self._skip -= skipped
+                start += skipped
+                if self._skip:
+                    break
+            if end - start < header_size:
+                break
+            length, type_code, seq = unpack_header(buffer, start)
+            if length > self.max_frame_length:
+                # The length prefix says exactly how much to skip; no need to buffer it
+                self.oversized_frames += 1
+                self._skip = length
+                start += header_size
+                continue
+            body_start = start + header_size
+            if end - body_start < length:
+                break
+            start = body_start + length
+            frames.append((type_code, seq, bytes(view[body_start:start]) if length else b''))
+
+        if start == end:
+            start = end = 0
+        self._start = self._scan = start
+        self._end = end
+        return frames
+
+
+class NegotiatingFramer(LineFramer, BinaryFramer):
+    """
+    Splits frames in whichever format the device chose: a stream starting with
+    wire.MAGIC is binary, anything else is newline-delimited text. The magic byte
+    is a UTF-8 continuation byte, so valid text can never start with it.
+    binary stays None until the first byte has arrived.
+    """
+
+    _overhead = HEADER.size
+
+    def __init__(self, max_frame_length=DEFAULT_MAX_FRAME_LENGTH, recv_size=DEFAULT_RECV_SIZE):
+        super().__init__(max_frame_length, recv_size)
+        self.binary = None
+
+    def pop_frames(self):
+        if self.binary is None:
+            if self._start == self._end:
+                frames, self._ready = self._ready, []
+                return frames
+            self.binary = self._buffer[self._start] == MAGIC
+            if self.binary:
+                self._start = self._scan = self._start + 1
+        if self.binary:
+            return BinaryFramer.pop_frames(self)
+        return LineFramer.pop_frames(self)
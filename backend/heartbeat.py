@@ -0,0 +1,212 @@
+"""
+Application-level heartbeat for device connections: server-driven ping/pong
+with per-device round-trip statistics.
+
+The server sends {"type": "ping", "seq": n} and the device echoes the sequence
+number in a pong. A pong is matched to the outstanding ping by seq, so late or
+duplicated pongs are ignored. Every device keeps its last RTT samples for
+percentiles and two moving averages of the RTT: a slow one that is the link's
+baseline and a fast one that follows the last few pongs. When the fast average
+climbs well above the baseline the link is flagged degraded, which on a failing
+Wi-Fi link usually happens well before the connection drops.
+
+The ping interval adapts per device. It starts at min_interval and doubles
+after every timely pong on a healthy link, up to max_interval. A missed pong or
+a degraded link drops it back to min_interval, so a struggling link is watched
+closely while a healthy fleet costs one small message per device every
+max_interval seconds. Devices that never answered a ping (firmware without
+heartbeat support) are pinged at max_interval and are never flagged.
+
+Scheduling uses a min-heap with lazy invalidation, like liveness.py.
+"""
+
+import heapq
+import threading
+import time
+from collections import deque
+
+OK = 'ok'
+DEGRADED = 'degraded'
+UNRESPONSIVE = 'unresponsive'
+
+_FAST_ALPHA = 0.3  # Weight of a new sample in the fast moving average
+_SLOW_ALPHA = 0.05  # ... and in the baseline
+_WARMUP_SAMPLES = 5  # Pongs needed before a link can be flagged degraded
+_RECOVER_RATIO = 0.8  # Share of the degraded threshold the fast average must drop below to recover
+
+
+def _percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Link:
+    """Heartbeat state of one device connection."""
+    __slots__ = (
+        'seq', 'pending_seq', 'pending_at', 'interval', 'next_ping', 'missed', 'missed_total',
+        'samples', 'fast', 'slow', 'pongs', 'status', 'reported_at',
+    )
+
+    def __init__(self, interval, now, samples):
+        self.seq = 0  # Sequence number of the last ping sent
+        self.pending_seq = None  # Ping waiting for its pong
+        self.pending_at = None
+        self.interval = interval
+        self.next_ping = now
+        self.missed = 0  # Consecutive pings without a pong
+        self.missed_total = 0
+        self.samples = deque(maxlen=samples)  # Recent RTTs in seconds
+        self.fast = None
+        self.slow = None
+        self.pongs = 0
+        self.status = None  # None until the first pong, then OK / DEGRADED / UNRESPONSIVE
+        self.reported_at = None  # When the owner last published this link's stats
+
+    def stats(self):
+        """Returns the link's status and RTT percentiles in milliseconds (None without samples)."""
+        result = {'status': self.status, 'p50': None, 'p95': None, 'p99': None, 'missed': self.missed_total}
+        if self.samples:
+            ordered = sorted(self.samples)
+            for key, fraction in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99)):
+                result[key] = round(_percentile(ordered, fraction) * 1000, 1)
+        return result
+
+
+class HeartbeatMonitor:
+    """Decides when to ping each device and tracks the RTT and health of its link."""
+
+    def __init__(self, min_interval, max_interval, missed_limit, degraded_factor, degraded_min,
+                 samples=64, clock=time.monotonic):
+        self.min_interval = min_interval  # Seconds
+        self.max_interval = max_interval
+        self.missed_limit = missed_limit  # Consecutive missed pongs that make a link unresponsive
+        self.degraded_factor = degraded_factor  # Fast average / baseline ratio that means degraded
+        self.degraded_min = degraded_min  # ... and the least increase in seconds that counts
+        self.sample_count = samples
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._links = {}  # {device_id: Link}
+        self._heap = []  # [(next ping time, device_id)], may contain stale entries
+        self.wakeup = threading.Event()  # Set when a new earliest ping was scheduled
+
+    def add(self, device_id):
+        """Starts pinging a device, right away. A reconnect starts with fresh statistics."""
+        now = self._clock()
+        with self._lock:
+            self._links[device_id] = Link(self.min_interval, now, self.sample_count)
+            self._push(now, device_id)
+
+    def remove(self, device_id):
+        """Stops pinging a device. Its heap entry is discarded when it reaches the top."""
+        with self._lock:
+            self._links.pop(device_id, None)
+
+    def seconds_until_next(self):
+        """Returns the time until the earliest scheduled ping (may be stale, never late), or None."""
+        with self._lock:
+            if not self._heap:
+                return None
+            return max(0.0, self._heap[0][0] - self._clock())
+
+    def pop_due(self):
+        """
+        Returns (pings, changes): the (device_id, seq) pings to send now, and the
+        (device_id, status) of links whose status changed because a pong was missed.
+        """
+        now = self._clock()
+        pings, changes = [], []
+        with self._lock:
+            heap = self._heap
+            while heap and heap[0][0] <= now:
+                scheduled, device_id = heapq.heappop(heap)
+                link = self._links.get(device_id)
+                if link is None or link.next_ping != scheduled:
+                    continue  # Removed or rescheduled
+                if link.pending_seq is not None:
+                    link.missed += 1
+                    link.missed_total += 1
+                    if link.status is None:
+                        link.interval = self.max_interval  # Probably no heartbeat support
+                    else:
+                        link.interval = self.min_interval
+                        if link.missed >= self.missed_limit and link.status != UNRESPONSIVE:
+                            link.status = UNRESPONSIVE
+                            changes.append((device_id, UNRESPONSIVE))
+                link.seq = (link.seq + 1) & 0xFFFF  # Fits the binary format's seq field
+                link.pending_seq = link.seq
+                link.pending_at = now
+                link.next_ping = now + link.interval
+                self._push(link.next_ping, device_id)
+                pings.append((device_id, link.seq))
+        return pings, changes
+
+    def on_pong(self, device_id, seq):
+        """
+        Records a pong. Returns (rtt in seconds, new status or None if unchanged
+        or if this is the link's first pong),
+        or (None, None) if the pong does not answer the outstanding ping.
+        """
+        now = self._clock()
+        with self._lock:
+            link = self._links.get(device_id)
+            if link is None or seq is None or seq != link.pending_seq:
+                return None, None
+            sent_at = link.pending_at
+            rtt = now - sent_at
+            link.pending_seq = link.pending_at = None
+            link.missed = 0
+            link.pongs += 1
+            link.samples.append(rtt)
+            link.fast = rtt if link.fast is None else link.fast + _FAST_ALPHA * (rtt - link.fast)
+
+            previous = link.status
+            threshold = None
+            if link.slow is not None:
+                threshold = max(link.slow * self.degraded_factor, link.slow + self.degraded_min)
+            if threshold is not None and link.pongs > _WARMUP_SAMPLES and link.fast > threshold:
+                link.status = DEGRADED
+            elif link.status != DEGRADED or threshold is None or link.fast < threshold * _RECOVER_RATIO:
+                link.status = OK
+            if link.status != DEGRADED:
+                # The baseline only learns from a healthy link
+                link.slow = rtt if link.slow is None else link.slow + _SLOW_ALPHA * (rtt - link.slow)
+
+            link.interval = min(link.interval * 2, self.max_interval) if link.status == OK else self.min_interval
+            next_ping = sent_at + link.interval
+            if next_ping != link.next_ping:
+                link.next_ping = next_ping  # The old heap entry is now stale
+                self._push(next_ping, device_id)
+        # A link's first pong is not a change worth reporting; report_due covers it
+        return rtt, (link.status if link.status != previous and previous is not None else None)
+
+    def report_due(self, device_id, every):
+        """
+        Returns True, at most once per `every` seconds per device, when the owner
+        should publish the link's stats again even though its status is unchanged.
+        """
+        now = self._clock()
+        with self._lock:
+            link = self._links.get(device_id)
+            if link is None or (link.reported_at is not None and now - link.reported_at < every):
+                return False
+            link.reported_at = now
+            return True
+
+    def stats(self, device_id):
+        """Returns the stats of one device's link (see Link.stats), or None if it is not tracked."""
+        with self._lock:
+            link = self._links.get(device_id)
+            return link.stats() if link is not None else None
+
+    def all_stats(self):
+        """Returns {device_id: stats} for every tracked device."""
+        with self._lock:
+            return {device_id: link.stats() for device_id, link in self._links.items()}
+
+    def _push(self, when, device_id):
+        heapq.heappush(self._heap, (when, device_id))
+        if self._heap[0][1] == device_id:
+            self.wakeup.set()
+
+    def __len__(self):
+        return len(self._links)
@@ -0,0 +1,154 @@
+"""
+Structured event journal backed by the SQLite `events` table.
+
+Recording an event only appends a tuple to an in-memory queue, so the alarm
+path never waits on the disk. Every few hundred milliseconds a background
+writer drains the queue and inserts everything in it in a single transaction. The database runs in WAL mode, so history queries from the API
+read a consistent snapshot while the writer appends.
+"""
+
+import json
+import sqlite3
+import time
+from collections import deque
+
+SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ts REAL NOT NULL,
+        type TEXT NOT NULL,
+        device_id INTEGER,
+        details TEXT
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_events_device_ts ON events (device_id, ts)',
+    'CREATE INDEX IF NOT EXISTS idx_events_type_ts ON events (type, ts)',
+    'CREATE INDEX IF NOT EXISTS idx_events_ts ON events (ts)',
+)
+
+
+def init_schema(conn):
+    """Switches the database to WAL mode and creates the events table and its indexes."""
+    conn.execute('PRAGMA journal_mode=WAL')
+    for statement in SCHEMA:
+        conn.execute(statement)
+
+
+def encode_cursor(event):
+    """Returns the opaque paging cursor that continues after this event."""
+    return f"{event['ts']!r}:{event['id']}"
+
+
+def decode_cursor(cursor):
+    """Returns (ts, id) from a paging cursor. Raises ValueError if it is malformed."""
+    ts, _, event_id = cursor.rpartition(':')
+    return float(ts), int(event_id)
+
+
+def query_events(conn, device_id=None, event_type=None, since=None, until=None, cursor=None, limit=100):
+    """
+    Returns (events, next_cursor) for one page of events, newest first. Filters
+    combine with AND; since is inclusive and until exclusive. next_cursor is None
+    on the last page.
+    """
+    clauses, params = [], []
+    if device_id is not None:
+        clauses.append('device_id = ?')
+        params.append(device_id)
+    if event_type is not None:
+        clauses.append('type = ?')
+        params.append(event_type)
+    if since is not None:
+        clauses.append('ts >= ?')
+        params.append(since)
+    if until is not None:
+        clauses.append('ts < ?')
+        params.append(until)
+    if cursor is not None:
+        # Keyset paging: rows sort by (ts, id), which every index ends with
+        clauses.append('(ts, id) < (?, ?)')
+        params.extend(cursor)
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    rows = conn.execute(
+        f'SELECT id, ts, type, device_id, details FROM events {where} '
+        'ORDER BY ts DESC, id DESC LIMIT ?',
+        params + [limit + 1],
+    ).fetchall()
+
+    events = []
+    for row in rows[:limit]:
+        event = dict(row)
+        event['details'] = json.loads(event['details']) if event['details'] else {}
+        events.append(event)
+    next_cursor = encode_cursor(events[-1]) if len(rows) > limit else None
+    return events, next_cursor
+
+
+class EventJournal:
+    """Queues structured events in memory and writes them to SQLite in batches."""
+
+    def __init__(self, database, max_pending=100000, clock=time.time):
+        self.database = database
+        self.max_pending = max_pending
+        self._clock = clock
+        self._pending = deque()  # [(ts, type, device_id, details_json)]
+        self._conn = None  # Opened by the first write()
+        self.written = 0  # Events committed to the database
+        self.dropped = 0  # Events discarded because the queue was full
+
+    def record(self, event_type, device_id=None, **details):
+        """Queues an event. Never blocks; drops the event if the writer has fallen far behind."""
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        self._pending.append((
+            self._clock(),
+            event_type,
+            device_id,
+            json.dumps(details) if details else None,
+        ))
+
+    def drain(self):
+        """Removes and returns every queued event."""
+        pending = self._pending
+        return [pending.popleft() for _ in range(len(pending))]
+
+    def write(self, batch):
+        """
+        Inserts a drained batch in one transaction. Blocking; meant to run off the
+        event loop, and only from one writer at a time. A failed batch is queued
+        again before the error propagates.
+        """
+        if not batch:
+            return 0
+        if self._conn is None:
+            # Successive writes may run on different worker threads
+            self._conn = sqlite3.connect(self.database, check_same_thread=False)
+            self._conn.execute('PRAGMA synchronous=NORMAL')  # Durable enough under WAL
+        try:
+            with self._conn:
+                self._conn.executemany(
+                    'INSERT INTO events (ts, type, device_id, details) VALUES (?, ?, ?, ?)',
+                    batch,
+                )
+        except sqlite3.Error:
+            self._pending.extendleft(reversed(batch))
+            raise
+        self.written += len(batch)
+        return len(batch)
+
+    def flush(self):
+        """Writes every queued event and returns how many were written."""
+        return self.write(self.drain())
+
+    def close(self):
+        """Flushes what is left and closes the writer connection."""
+        self.flush()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def __len__(self):
+        return len(self._pending)
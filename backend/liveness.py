@@ -0,0 +1,95 @@
+"""
+Deadline-based liveness tracking for device connections.
+
+Every tracked device has a deadline on the time.monotonic() clock. Deadlines
+live in a min-heap with lazy invalidation: touching a device only overwrites
+its deadline in a dict (O(1)), and the stale heap entry is re-pushed with the
+new deadline when it reaches the top. The watcher therefore only wakes up when
+the earliest deadline is due instead of scanning every device on an interval.
+"""
+
+import heapq
+import threading
+import time
+
+
+class LivenessTracker:
+    """Tracks a per-device deadline and reports the devices whose deadline has passed."""
+
+    def __init__(self, default_timeout, clock=time.monotonic):
+        self.default_timeout = default_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._heap = []  # [(deadline, device_id)], may contain stale entries
+        self._queued = {}  # {device_id: deadline of its live heap entry}
+        self._deadlines = {}  # {device_id: current deadline}
+        self._timeouts = {}  # {device_id: timeout in seconds}, overrides default_timeout
+        self.wakeup = threading.Event()  # Set when a new earliest deadline was scheduled
+
+    def set_timeout(self, device_id, timeout):
+        """Sets a device's timeout in seconds; None restores the default."""
+        with self._lock:
+            if timeout is None:
+                self._timeouts.pop(device_id, None)
+            else:
+                self._timeouts[device_id] = timeout
+
+    def timeout_for(self, device_id):
+        """Returns the timeout that applies to a device."""
+        return self._timeouts.get(device_id, self.default_timeout)
+
+    def touch(self, device_id):
+        """Pushes a device's deadline out by its timeout, starting to track it if needed."""
+        timeout = self.timeout_for(device_id)
+        if timeout is None:
+            return
+        deadline = self._clock() + timeout
+        with self._lock:
+            self._deadlines[device_id] = deadline
+            queued = self._queued.get(device_id)
+            if queued is None or deadline < queued:
+                self._push(deadline, device_id)
+
+    def remove(self, device_id):
+        """Stops tracking a device. Its heap entry is discarded when it reaches the top."""
+        with self._lock:
+            self._deadlines.pop(device_id, None)
+
+    def seconds_until_next(self):
+        """Returns the time until the earliest deadline (may be stale, never late), or None."""
+        with self._lock:
+            if not self._heap:
+                return None
+            return max(0.0, self._heap[0][0] - self._clock())
+
+    def pop_expired(self):
+        """Stops tracking and returns the ids of all devices whose deadline has passed."""
+        now = self._clock()
+        expired = []
+        with self._lock:
+            heap = self._heap
+            while heap and heap[0][0] <= now:
+                queued, device_id = heapq.heappop(heap)
+                if self._queued.get(device_id) != queued:
+                    continue  # Superseded by an earlier entry for the same device
+                del self._queued[device_id]
+
+                deadline = self._deadlines.get(device_id)
+                if deadline is None:
+                    continue  # Removed
+                if deadline <= now:
+                    del self._deadlines[device_id]
+                    expired.append(device_id)
+                else:
+                    self._push(deadline, device_id)  # Touched since it was pushed
+        return expired
+
+    def _push(self, deadline, device_id):
+        """Adds a heap entry and wakes the watcher if it is the new earliest deadline."""
+        heapq.heappush(self._heap, (deadline, device_id))
+        self._queued[device_id] = deadline
+        if self._heap[0][1] == device_id:
+            self.wakeup.set()
+
+    def __len__(self):
+        return len(self._deadlines)
@@ -0,0 +1,169 @@
+"""
+Structured, queue-based logging for the backend.
+
+Every subsystem logs through its own stdlib logger (turbotech.tcp,
+turbotech.ingest, ...), so levels can be set per subsystem, and passes context
+such as the device id as extra= fields instead of formatting it into the text.
+The only handler is a LogPipeline: handling a record appends it to an
+in-memory queue and returns. The owner drains the queue from a background
+task and calls write() on a worker thread, so formatting and slow terminal or
+disk writes never run on the event loop.
+
+Records are formatted when they are written, not when they are logged, so
+pass immutable values as message arguments.
+"""
+
+import json
+import logging
+import time
+from collections import deque
+
+ROOT_LOGGER = 'turbotech'
+TEXT = 'text'
+JSON = 'json'
+FORMATS = (TEXT, JSON)
+
+# Attributes every LogRecord has; anything else on a record came from extra=.
+# 'ui_type' is routing information for the web log view, not a structured field.
+_RECORD_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'ui_type'}
+
+
+def get_logger(subsystem):
+    """Returns the logger of one subsystem."""
+    return logging.getLogger(f'{ROOT_LOGGER}.{subsystem}')
+
+
+def level_number(level):
+    """Converts a level name such as 'DEBUG' (or a number) to its number. Raises ValueError."""
+    if isinstance(level, int) and not isinstance(level, bool):
+        return level
+    number = logging.getLevelName(str(level).upper())
+    if not isinstance(number, int):
+        raise ValueError(f"Unknown log level: {level!r}")
+    return number
+
+
+def subsystem_of(record):
+    return record.name.rpartition('.')[2]
+
+
+def record_fields(record):
+    """Returns the structured fields passed to the logging call with extra=."""
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+
+
+class StructuredFormatter(logging.Formatter):
+    """Formats a record as one text line with key=value fields, or as one JSON object."""
+
+    def __init__(self, style=TEXT):
+        super().__init__()
+        if style not in FORMATS:
+            raise ValueError(f"Unknown log format: {style!r}")
+        self.style = style
+
+    def format(self, record):
+        message = record.getMessage()
+        fields = record_fields(record)
+        if self.style == JSON:
+            entry = {
+                'ts': round(record.created, 6),
+                'level': record.levelname,
+                'subsystem': subsystem_of(record),
+                'message': message,
+            }
+            entry.update(fields)
+            if record.exc_info:
+                entry['exc'] = self.formatException(record.exc_info)
+            return json.dumps(entry, default=str)
+
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record.created))
+        line = f'{timestamp}.{int(record.msecs):03d} {record.levelname:<7} [{subsystem_of(record)}] {message}'
+        if fields:
+            line += ' ' + ' '.join(f'{key}={value}' for key, value in fields.items())
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+class LogPipeline(logging.Handler):
+    """
+    Queues records in memory; drain() and write() move them to the output
+    streams. Records beyond max_pending unwritten ones are dropped and counted.
+    """
+
+    def __init__(self, max_pending, streams=(), formatter=None):
+        super().__init__()
+        self.max_pending = max_pending
+        self.streams = list(streams)
+        self.setFormatter(formatter or StructuredFormatter())
+        self._pending = deque()
+        self.written = 0
+        self.dropped = 0
+
+    def handle(self, record):
+        # No handler lock: appending to a deque is atomic and nothing is formatted here
+        if self.filter(record):
+            self.emit(record)
+        return record
+
+    def emit(self, record):
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        self._pending.append(record)
+
+    def drain(self):
+        """Removes and returns every queued record."""
+        pending = self._pending
+        return [pending.popleft() for _ in range(len(pending))]
+
+    def write(self, batch):
+        """
+        Formats a drained batch and writes it to every stream. Blocking; meant to
+        run off the event loop, and only from one writer at a time.
+        """
+        text = ''.join(self.format(record) + '\n' for record in batch)
+        for stream in self.streams:
+            try:
+                stream.write(text)
+                stream.flush()
+            except (OSError, ValueError):
+                pass  # A closed or broken stream must not stop the other outputs
+        self.written += len(batch)
+
+    def __len__(self):
+        return len(self._pending)
+
+
+def configure(pipeline, levels):
+    """
+    Makes pipeline the only handler of every subsystem logger and applies the
+    {subsystem: level} mapping. Raises ValueError for an unknown level.
+    """
+    # Caller file/line, thread and process lookups cost more than the rest of
+    # creating a record and none of them are shown
+    logging._srcfile = None
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.handlers[:] = [pipeline]
+    root.propagate = False
+    root.setLevel(logging.INFO)
+    set_levels(levels)
+
+
+def set_levels(levels):
+    """Applies a {subsystem: level} mapping. Validates every level before changing any."""
+    numbers = {subsystem: level_number(level) for subsystem, level in levels.items()}
+    for subsystem, number in numbers.items():
+        get_logger(subsystem).setLevel(number)
+
+
+def get_levels(subsystems):
+    """Returns the effective level name of each subsystem."""
+    return {
+        subsystem: logging.getLevelName(get_logger(subsystem).getEffectiveLevel())
+        for subsystem in subsystems
+    }
@@ -0,0 +1,230 @@
+"""
+Minimal in-process metrics with Prometheus text exposition.
+
+Counters and histograms are plain Python objects updated in place: an
+observation is a bisect over the bucket bounds plus two additions, cheap
+enough for the per-message path. Values that already live in the application
+state (connected devices, queue depths, ...) are not mirrored; collector
+callbacks read them when /metrics is scraped. The helpers at the bottom wrap
+locks, emit functions and SQLite connections so they record timings without
+changes at every call site.
+"""
+
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; covers sub-millisecond hot-path work up to multi-second stalls
+LATENCY_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A monotonically increasing value per label combination."""
+
+    type_name = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # {label values tuple: value}
+
+    def inc(self, *labelvalues, amount=1):
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def samples(self):
+        for labelvalues, value in self._values.items():
+            yield self.name, _format_labels(self.labelnames, labelvalues), value
+
+
+class Histogram:
+    """Bucketed observations per label combination, exposed with cumulative buckets."""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, buckets=LATENCY_BUCKETS, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self.labelnames = tuple(labelnames)
+        self._series = {}  # {label values tuple: [bucket counts..., +Inf count, sum]}
+
+    def observe(self, value, *labelvalues):
+        series = self._series.get(labelvalues)
+        if series is None:
+            series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self):
+        for labelvalues, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                labels = _format_labels(self.labelnames, labelvalues, f'le="{_format_value(bound)}"')
+                yield f'{self.name}_bucket', labels, cumulative
+            labels = _format_labels(self.labelnames, labelvalues)
+            yield f'{self.name}_sum', labels, series[-1]
+            yield f'{self.name}_count', labels, cumulative
+
+
+class Registry:
+    """Holds metrics and scrape-time collectors and renders them in the text format."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._add(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, buckets=LATENCY_BUCKETS, labelnames=()):
+        return self._add(Histogram(name, documentation, buckets, labelnames))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        """
+        Registers a callable returning [(name, type, documentation, samples)],
+        where samples is [(labels dict, value)]. It runs on every scrape.
+        """
+        self._collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type_name}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {_format_value(value)}')
+        for collect in self._collectors:
+            for name, type_name, documentation, samples in collect():
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} {type_name}')
+                for labels, value in samples:
+                    label_text = _format_labels(labels.keys(), labels.values())
+                    lines.append(f'{name}{label_text} {_format_value(value)}')
+        lines.append('')
+        return '\n'.join(lines)
+
+
+# -----------------------------------------------------------------------------
+# Instrumentation helpers
+# -----------------------------------------------------------------------------
+
+class InstrumentedLock:
+    """Wraps a Lock or RLock and records how long callers waited for and held it."""
+
+    def __init__(self, lock, name, wait_histogram, hold_histogram):
+        self._lock = lock
+        self._name = name
+        self._wait = wait_histogram
+        self._hold = hold_histogram
+        self._depth = 0  # Re-entrant acquisitions by the current owner
+        self._acquired_at = 0.0
+
+    def acquire(self, blocking=True, timeout=-1):
+        started = time.perf_counter()
+        acquired = self._lock.acquire(blocking, timeout)
+        if acquired:
+            now = time.perf_counter()
+            if self._depth == 0:
+                self._wait.observe(now - started, self._name)
+                self._acquired_at = now
+            self._depth += 1
+        return acquired
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            self._hold.observe(time.perf_counter() - self._acquired_at, self._name)
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class EmitTracker:
+    """
+    Wraps an emit function, counting calls per event name overall and per
+    thread (greenlet, once eventlet has patched threading) so a caller can tell
+    how many emits a unit of work produced.
+    """
+
+    def __init__(self, counter):
+        self._counter = counter
+        self._local = threading.local()
+
+    def wrap(self, emit):
+        def counted_emit(event, *args, **kwargs):
+            self._counter.inc(event)
+            self._local.count = getattr(self._local, 'count', 0) + 1
+            return emit(event, *args, **kwargs)
+        return counted_emit
+
+    def count(self):
+        """Returns the number of emits made so far by the calling thread."""
+        return getattr(self._local, 'count', 0)
+
+
+def timed_connection_class(histogram):
+    """Returns a sqlite3.Connection subclass that records every statement's duration by SQL verb."""
+
+    def observe(sql, started):
+        histogram.observe(time.perf_counter() - started, sql.split(None, 1)[0].upper())
+
+    class TimedCursor(sqlite3.Cursor):
+        def execute(self, sql, parameters=()):
+            started = time.perf_counter()
+            try:
+                return super().execute(sql, parameters)
+            finally:
+                observe(sql, started)
+
+        def executemany(self, sql, seq_of_parameters):
+            started = time.perf_counter()
+            try:
+                return super().executemany(sql, seq_of_parameters)
+            finally:
+                observe(sql, started)
+
+    class TimedConnection(sqlite3.Connection):
+        def cursor(self, factory=TimedCursor):
+            return super().cursor(factory)
+
+        def execute(self, sql, parameters=()):
+            return self.cursor().execute(sql, parameters)
+
+        def executemany(self, sql, seq_of_parameters):
+            return self.cursor().executemany(sql, seq_of_parameters)
+
+    return TimedConnection
@@ -0,0 +1,100 @@
+"""
+Bounded per-connection outbound queues for device sockets.
+
+Every device connection owns an OutboundQueue that a dedicated writer drains,
+so sending to a device is an O(1) enqueue and a device with a full TCP window
+only ever delays its own messages. When a queue is full the configured policy
+applies: 'drop_oldest' discards the oldest queued message to make room, while
+'disconnect' reports the device as a slow consumer so the caller can cut it off.
+"""
+
+import threading
+import time
+from collections import deque
+
+DROP_OLDEST = 'drop_oldest'
+DISCONNECT = 'disconnect'
+POLICIES = (DROP_OLDEST, DISCONNECT)
+
+LATENCY_SAMPLES = 256  # Recent send latencies kept per device for percentiles
+
+
+def _percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class OutboundQueue:
+    """A bounded FIFO of encoded messages for one connection, plus its send metrics."""
+
+    def __init__(self, max_messages, policy=DROP_OLDEST, clock=time.monotonic):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown outbound queue policy: {policy!r}")
+        self.max_messages = max_messages
+        self.policy = policy
+        self._clock = clock
+        self._items = deque()  # [(data, enqueued_at)]
+        self._ready = threading.Event()  # Set while there is something for the writer
+        self.closed = False
+        self.sent = 0
+        self.dropped = 0  # Messages discarded by the drop_oldest policy or on close
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)  # Seconds from enqueue to sent
+
+    def put(self, data):
+        """
+        Queues bytes for the writer. Returns False if the message was not queued
+        because the queue is closed, or full under the 'disconnect' policy.
+        """
+        if self.closed:
+            return False
+        if len(self._items) >= self.max_messages:
+            if self.policy == DISCONNECT:
+                return False
+            self._items.popleft()
+            self.dropped += 1
+        self._items.append((data, self._clock()))
+        self._ready.set()
+        return True
+
+    def get(self):
+        """Blocks until a message is queued and returns (data, enqueued_at), or None once closed."""
+        while not self._items:
+            if self.closed:
+                return None
+            self._ready.clear()
+            if self._items or self.closed:
+                continue
+            self._ready.wait()
+        return self._items.popleft()
+
+    def mark_sent(self, enqueued_at):
+        """Records that a message taken with get() has been written to the socket."""
+        self.sent += 1
+        self._latencies.append(self._clock() - enqueued_at)
+
+    def close(self):
+        """Discards anything still queued and wakes the writer so it can exit."""
+        self.closed = True
+        self.dropped += len(self._items)
+        self._items.clear()
+        self._ready.set()
+
+    def stats(self):
+        """Returns queue depth, counters and send latency percentiles in milliseconds."""
+        latencies = sorted(self._latencies)
+        result = {
+            'queued': len(self._items),
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'latency_ms': None,
+        }
+        if latencies:
+            result['latency_ms'] = {
+                'p50': round(_percentile(latencies, 0.50) * 1000, 3),
+                'p95': round(_percentile(latencies, 0.95) * 1000, 3),
+                'max': round(latencies[-1] * 1000, 3),
+            }
+        return result
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,252 @@
+"""
+On-demand profiling of the running backend and a tracer for slow device events.
+
+SamplingProfiler asks the kernel for a SIGPROF every few milliseconds of CPU
+time the process uses, and its signal handler records the stack it interrupted.
+Python runs signal handlers in the main thread, which is the thread that runs
+the eventlet hub and every greenlet. Only the greenlet that currently runs has
+a live frame there, so each sample belongs to the greenlet that was using the
+CPU, and the stack ends at its entry point (a device handler, a Socket.IO
+handler, a background writer, ...). Greenlets that wait for I/O cost nothing
+and do not show up, and neither does idle time. Sampling from another thread
+would be biased towards the places where the loop releases the GIL, which are
+mostly its socket calls.
+
+The result can be exported as collapsed stacks (for flamegraph.pl, speedscope,
+...), as a pstats file built from the sample counts, or as a top-N summary by
+function. SIGPROF and setitimer() are POSIX only.
+
+SlowEventTracer times the handling of one device event in named spans and keeps
+the events that took longer than a threshold, with the time each span took.
+"""
+
+import marshal
+import os
+import signal
+import threading
+import time
+from collections import Counter, deque
+
+try:
+    from greenlet import getcurrent as _current
+except ImportError:  # Plain threads
+    _current = threading.get_ident
+
+
+def _label(code):
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class Profile:
+    """The stacks recorded by a SamplingProfiler, with how often each was seen."""
+
+    def __init__(self, stacks, interval, duration):
+        self.stacks = stacks  # Counter({(code, ...) outermost first: samples})
+        self.interval = interval  # Seconds of CPU time per sample
+        self.duration = duration  # Wall-clock seconds
+
+    @property
+    def samples(self):
+        return sum(self.stacks.values())
+
+    def collapsed(self):
+        """Returns the samples in collapsed-stack format, one 'frame;frame;... count' line per stack."""
+        lines = Counter()
+        for stack, count in self.stacks.items():
+            lines[';'.join(_label(code) for code in stack)] += count
+        return ''.join(f'{line} {count}\n' for line, count in sorted(lines.items()))
+
+    def functions(self):
+        """Returns {code: [self samples, total samples]}; total counts each function once per sample."""
+        result = {}
+        for stack, count in self.stacks.items():
+            for code in set(stack):
+                result.setdefault(code, [0, 0])[1] += count
+            result[stack[-1]][0] += count
+        return result
+
+    def top(self, limit=25):
+        """Returns the functions with the most samples of their own, busiest first."""
+        samples = self.samples or 1
+        rows = sorted(self.functions().items(), key=lambda item: (-item[1][0], -item[1][1]))
+        return [
+            {
+                'function': _label(code),
+                'self_samples': own, 'total_samples': total,
+                'self_pct': round(100.0 * own / samples, 1), 'total_pct': round(100.0 * total / samples, 1),
+            }
+            for code, (own, total) in rows[:limit]
+        ]
+
+    def pstats(self):
+        """
+        Returns the profile as the bytes of a pstats file (pstats.Stats, snakeviz).
+        Times are samples times the interval, and call counts are sample counts.
+        """
+        functions = self.functions()
+        callers = {}
+        for stack, count in self.stacks.items():
+            for caller, callee in set(zip(stack, stack[1:])):
+                edges = callers.setdefault(callee, {})
+                edges[caller] = edges.get(caller, 0) + count
+
+        def key(code):
+            return (code.co_filename, code.co_firstlineno, code.co_name)
+
+        stats = {}
+        for code, (own, total) in functions.items():
+            edges = {
+                key(caller): (n, n, 0.0, n * self.interval)
+                for caller, n in callers.get(code, {}).items()
+            }
+            stats[key(code)] = (total, total, own * self.interval, total * self.interval, edges)
+        return marshal.dumps(stats)
+
+    def summary(self, limit=25):
+        cpu = self.samples * self.interval
+        return {
+            'duration_s': round(self.duration, 3),
+            'interval_ms': self.interval * 1000,
+            'samples': self.samples,
+            'cpu_s': round(cpu, 3),
+            'cpu_pct': round(100.0 * cpu / self.duration, 1) if self.duration else 0.0,
+            'top': self.top(limit),
+        }
+
+
+class SamplingProfiler:
+    """
+    Samples the main thread's stack every `interval` seconds of process CPU time
+    until stopped. start() and stop() must be called from the main thread, and
+    only one profiler can run at a time since it owns SIGPROF.
+    """
+
+    def __init__(self, interval=0.005, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self._stacks = Counter()
+        self._started = None
+        self._previous_handler = None
+
+    def start(self):
+        self._started = time.monotonic()
+        self._previous_handler = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        """Stops sampling and returns the Profile."""
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self._previous_handler or signal.SIG_DFL)
+        return Profile(self._stacks, self.interval, time.monotonic() - self._started)
+
+    def _sample(self, signum, frame):
+        stack = []
+        while frame is not None and len(stack) < self.max_depth:
+            stack.append(frame.f_code)
+            frame = frame.f_back
+        stack.reverse()
+        self._stacks[tuple(stack)] += 1
+
+
+class _Span:
+    __slots__ = ('_trace', '_category')
+
+    def __init__(self, trace, category):
+        self._trace = trace
+        self._category = category
+
+    def __enter__(self):
+        now = time.perf_counter()
+        spans, stack = self._trace.spans, self._trace.stack
+        if stack:
+            # Pause the enclosing span
+            parent = stack[-1]
+            spans[parent[0]] = spans.get(parent[0], 0.0) + now - parent[1]
+        stack.append([self._category, now])
+        return self
+
+    def __exit__(self, *exc):
+        now = time.perf_counter()
+        spans, stack = self._trace.spans, self._trace.stack
+        category, started = stack.pop()
+        spans[category] = spans.get(category, 0.0) + now - started
+        if stack:
+            stack[-1][1] = now  # Resume the enclosing span
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+class _Trace:
+    __slots__ = ('started', 'spans', 'stack')
+
+    def __init__(self, started):
+        self.started = started
+        self.spans = {}  # {category: seconds}
+        self.stack = []  # [[category, started or resumed at]] of the open spans
+
+
+class SlowEventTracer:
+    """
+    Times units of work (begin() ... end()) split into named spans, and keeps the
+    ones that took at least `threshold` seconds. Spans may nest; each span is
+    charged its own time only, and time outside any span is reported as 'other'.
+    A unit of work belongs to the greenlet (or thread) that began it. Traces are
+    keyed by greenlet in a plain dict: eventlet's patched threading.local is slow
+    enough to show up in profiles of the message path.
+    """
+
+    def __init__(self, threshold=None, capacity=200, wall_clock=time.time):
+        self.threshold = threshold  # Seconds; None disables tracing
+        self.events = deque(maxlen=capacity)  # Most recent slow events, oldest first
+        self.slow_total = 0
+        self._wall_clock = wall_clock
+        self._traces = {}  # {greenlet: _Trace}
+
+    def begin(self):
+        """Starts timing a unit of work in the calling greenlet, unless tracing is off."""
+        if self.threshold is None:
+            self._traces.pop(_current(), None)
+            return
+        self._traces[_current()] = _Trace(time.perf_counter())
+
+    def span(self, category):
+        """Returns a context manager that charges its block to category."""
+        trace = self._traces.get(_current())
+        if trace is None:
+            return _NO_SPAN
+        return _Span(trace, category)
+
+    def wrap(self, function, category):
+        """Wraps function so that calls made during a traced unit of work count as category."""
+        def traced(*args, **kwargs):
+            with self.span(category):
+                return function(*args, **kwargs)
+        return traced
+
+    def end(self, **info):
+        """Finishes the unit of work. Returns its record, with info merged in, if it was slow."""
+        trace = self._traces.pop(_current(), None)
+        if trace is None:
+            return None
+        total = time.perf_counter() - trace.started
+        if self.threshold is None or total < self.threshold:
+            return None
+        record = dict(info)
+        record['at'] = self._wall_clock()
+        record['total_ms'] = round(total * 1000, 2)
+        record['spans_ms'] = {category: round(seconds * 1000, 2) for category, seconds in trace.spans.items()}
+        record['spans_ms']['other'] = round((total - sum(trace.spans.values())) * 1000, 2)
+        self.events.append(record)
+        self.slow_total += 1
+        return record
@@ -0,0 +1,134 @@
+"""
+Per-device debouncing and rate limiting of button presses, and a deny list for
+addresses that keep failing authorization.
+
+Every device gets a token bucket holding up to `burst` presses that refills at
+`rate` presses per second, plus a debounce window: a press arriving less than
+`debounce` seconds after the last accepted one is dropped whatever the bucket
+holds. A device's first press always finds a full bucket, so it goes through
+at once; only a stuck button or a flapping device runs out of tokens.
+
+Suppressed presses are only counted here. The owner pops the counts
+periodically and reports one summary line per device instead of one per press.
+The deny list works the same way for refused connection attempts.
+"""
+
+import threading
+import time
+
+
+class PressLimiter:
+    """
+    Decides per device whether a button press is acted on, and counts the ones
+    that are not. A rate of None disables limiting.
+    """
+
+    def __init__(self, rate, burst, debounce, clock=time.monotonic):
+        self.rate = rate  # Tokens added per second, None for no limit
+        self.burst = burst  # Bucket capacity
+        self.debounce = debounce  # Seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._buckets = {}  # {device_id: [tokens, time of last refill, time of last accepted press]}
+        self._suppressed = {}  # {device_id: presses suppressed since the last pop_suppressed()}
+        self.suppressed_total = 0
+
+    def allow(self, device_id):
+        """Returns True if the press should be acted on; otherwise counts it as suppressed."""
+        if self.rate is None:
+            return True
+        now = self._clock()
+        with self._lock:
+            bucket = self._buckets.get(device_id)
+            if bucket is None:
+                self._buckets[device_id] = [self.burst - 1, now, now]
+                return True
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if now - bucket[2] >= self.debounce and tokens >= 1:
+                bucket[0] = tokens - 1
+                bucket[2] = now
+                return True
+            bucket[0] = tokens
+            self._suppressed[device_id] = self._suppressed.get(device_id, 0) + 1
+            self.suppressed_total += 1
+            return False
+
+    def forget(self, device_id):
+        """Drops a device's bucket, e.g. when it is deleted. Its next press goes through."""
+        with self._lock:
+            self._buckets.pop(device_id, None)
+
+    def pop_suppressed(self):
+        """Returns {device_id: count} of the presses suppressed since the previous call."""
+        with self._lock:
+            suppressed, self._suppressed = self._suppressed, {}
+        return suppressed
+
+
+class DenyList:
+    """
+    Temporarily refuses addresses that keep failing authorization: after
+    `threshold` rejections within `window` seconds an address is denied for
+    `duration` seconds. Denied attempts are only counted, so a misconfigured
+    device retrying in a loop costs an accept() and a close() instead of a log
+    line and a journal write per attempt. A threshold of None disables it.
+    """
+
+    def __init__(self, threshold, window, duration, max_entries=10000, clock=time.monotonic):
+        self.threshold = threshold
+        self.window = window  # Seconds
+        self.duration = duration  # Seconds
+        self.max_entries = max_entries  # Addresses tracked before stale ones are pruned
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._rejections = {}  # {address: [rejections in the window, window start]}
+        self._denied_until = {}  # {address: monotonic time the denial ends}
+        self._denied = {}  # {address: attempts denied since the last pop_denied()}
+        self.denied_total = 0
+
+    def is_denied(self, address):
+        """Returns True, and counts the attempt, if the address is currently denied."""
+        if not self._denied_until:
+            return False
+        now = self._clock()
+        with self._lock:
+            until = self._denied_until.get(address)
+            if until is None:
+                return False
+            if now >= until:
+                del self._denied_until[address]
+                return False
+            self._denied[address] = self._denied.get(address, 0) + 1
+            self.denied_total += 1
+            return True
+
+    def record_rejection(self, address):
+        """Counts a failed authorization. Returns True if the address is denied from now on."""
+        if self.threshold is None:
+            return False
+        now = self._clock()
+        with self._lock:
+            entry = self._rejections.get(address)
+            if entry is None or now - entry[1] >= self.window:
+                if len(self._rejections) >= self.max_entries:
+                    self._prune(now)
+                entry = self._rejections[address] = [0, now]
+            entry[0] += 1
+            if entry[0] < self.threshold:
+                return False
+            del self._rejections[address]
+            self._denied_until[address] = now + self.duration
+            return True
+
+    def pop_denied(self):
+        """Returns {address: count} of the attempts denied since the previous call."""
+        with self._lock:
+            denied, self._denied = self._denied, {}
+        return denied
+
+    def _prune(self, now):
+        self._rejections = {
+            address: entry for address, entry in self._rejections.items() if now - entry[1] < self.window
+        }
+        self._denied_until = {address: until for address, until in self._denied_until.items() if until > now}
@@ -0,0 +1,141 @@
+"""
+Recording of device traffic for offline replay (see benchmarks/replay.py).
+
+A recording is an NDJSON file. The first line is a header with the format
+version and the device registry at the time the recording started, so a
+replay can recreate the same devices. Every following line is one event of
+one device connection, with its time in seconds since the recording started:
+
+    {"t": 0.512, "e": "connect", "d": 3, "ip": "192.168.1.23"}
+    {"t": 0.530, "e": "data", "d": 3, "b": "<base64 of the bytes received>"}
+    {"t": 9.104, "e": "disconnect", "d": 3}
+
+Data events hold the bytes exactly as one recv() returned them, before any
+framing, so a replay goes through the same framing and decoding as the live
+server, partial frames and binary negotiation included.
+
+Events are queued in memory and written in batches by the owner, like the
+event journal, so recording never blocks the event loop on disk I/O.
+Flushing and closing hold a lock, so a recording can be closed (e.g. on
+shutdown) while a flush is still running on another thread.
+"""
+
+import base64
+import json
+import threading
+import time
+from collections import deque
+
+FORMAT = 'turbotech-traffic'
+FORMAT_VERSION = 1
+
+CONNECT = 'connect'
+DATA = 'data'
+DISCONNECT = 'disconnect'
+
+
+class Record:
+    """One event of a recording."""
+    __slots__ = ('t', 'kind', 'device_id', 'ip', 'data')
+
+    def __init__(self, t, kind, device_id, ip=None, data=None):
+        self.t = t  # Seconds since the recording started
+        self.kind = kind  # CONNECT, DATA or DISCONNECT
+        self.device_id = device_id
+        self.ip = ip  # CONNECT only
+        self.data = data  # DATA only: the bytes received
+
+    def __repr__(self):
+        return f'Record({self.t!r}, {self.kind!r}, {self.device_id!r})'
+
+
+class TrafficRecorder:
+    """Queues traffic events and appends them to a recording file in batches."""
+
+    def __init__(self, path, devices, max_pending=100000, clock=time.monotonic, wall_clock=time.time):
+        self.path = path
+        self.max_pending = max_pending
+        self._clock = clock
+        self._started = clock()
+        self._header = {
+            'format': FORMAT, 'version': FORMAT_VERSION, 'started_at': wall_clock(), 'devices': devices,
+        }
+        self._pending = deque()  # [Record]
+        self._lock = threading.Lock()  # Serializes flush() and close()
+        self._file = None  # Opened by the first flush()
+        self.closed = False
+        self.written = 0  # Events written to the file
+        self.dropped = 0  # Events discarded because the writer had fallen behind
+
+    def record(self, kind, device_id, ip=None, data=None):
+        """Queues an event. Never blocks; drops the event if the writer has fallen far behind."""
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        self._pending.append(Record(self._clock() - self._started, kind, device_id, ip, data))
+
+    def flush(self):
+        """
+        Appends the queued events to the file, creating it with the header on the
+        first call. Returns the number of events written. Blocking; meant to run
+        off the event loop. Does nothing once the recording is closed.
+        """
+        with self._lock:
+            if self.closed:
+                return 0
+            return self._write()
+
+    def close(self):
+        """Writes what is still queued and closes the file. Blocking."""
+        with self._lock:
+            if self.closed:
+                return
+            self._write()
+            self._file.close()
+            self.closed = True
+
+    def _write(self):
+        pending = self._pending
+        batch = [pending.popleft() for _ in range(len(pending))]
+        if self._file is None:
+            self._file = open(self.path, 'w', encoding='utf-8')
+            self._file.write(json.dumps(self._header, separators=(',', ':')) + '\n')
+        lines = []
+        for record in batch:
+            line = {'t': round(record.t, 6), 'e': record.kind, 'd': record.device_id}
+            if record.ip is not None:
+                line['ip'] = record.ip
+            if record.data is not None:
+                line['b'] = base64.b64encode(record.data).decode('ascii')
+            lines.append(json.dumps(line, separators=(',', ':')) + '\n')
+        self._file.writelines(lines)
+        self._file.flush()
+        self.written += len(batch)
+        return len(batch)
+
+    def __len__(self):
+        return len(self._pending)
+
+
+def load(path):
+    """Reads a recording. Returns (header, [Record]). Raises ValueError if it is not a valid recording."""
+    with open(path, encoding='utf-8') as f:
+        try:
+            header = json.loads(f.readline())
+        except ValueError:
+            raise ValueError(f'{path} is not a traffic recording') from None
+        if not isinstance(header, dict) or header.get('format') != FORMAT:
+            raise ValueError(f'{path} is not a traffic recording')
+        if header.get('version') != FORMAT_VERSION:
+            raise ValueError(f'unsupported recording version {header.get("version")!r}')
+        records = []
+        for number, line in enumerate(f, 2):
+            if not line.endswith('\n'):
+                break  # Torn last line of a recording whose writer was killed
+            try:
+                event = json.loads(line)
+                data = base64.b64decode(event['b']) if 'b' in event else None
+                records.append(Record(event['t'], event['e'], event['d'], event.get('ip'), data))
+            except (ValueError, KeyError, TypeError):
+                raise ValueError(f'{path}:{number}: invalid event') from None
+    return header, records
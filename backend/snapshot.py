@@ -0,0 +1,57 @@
+"""
+Warm-restart snapshots of the backend's runtime state.
+
+A snapshot is one compact JSON document. It is written to a temporary file in
+the same directory, fsynced and renamed over the previous snapshot, so a crash
+or power cut mid-write leaves either the old or the new snapshot on disk, never
+a torn one.
+"""
+
+import json
+import os
+import time
+
+FORMAT_VERSION = 1
+
+
+def save(path, data, clock=time.time):
+    """Atomically replaces the snapshot at path with data (a JSON-serializable dict). Blocking."""
+    document = dict(data, version=FORMAT_VERSION, saved_at=clock())
+    encoded = json.dumps(document, separators=(',', ':')).encode('utf-8')
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(encoded)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+    try:
+        # Make the rename itself durable
+        directory = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return len(encoded)  # Not supported on this platform (e.g. Windows)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+    return len(encoded)
+
+
+def load(path, max_age=None, clock=time.time):
+    """
+    Returns the snapshot stored at path, or None if there is none. Raises
+    ValueError if it is unreadable, from another format version, or older than
+    max_age seconds.
+    """
+    try:
+        with open(path, 'rb') as f:
+            document = json.loads(f.read())
+    except FileNotFoundError:
+        return None
+    except (OSError, UnicodeDecodeError) as e:
+        raise ValueError(f'cannot read snapshot: {e}') from None
+    if not isinstance(document, dict) or document.get('version') != FORMAT_VERSION:
+        raise ValueError('unknown snapshot format')
+    age = clock() - document.get('saved_at', 0)
+    if max_age is not None and age > max_age:
+        raise ValueError(f'snapshot is {age:.0f}s old')
+    return document
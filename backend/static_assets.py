@@ -0,0 +1,146 @@
+"""
+In-memory serving of the built frontend (frontend/dist).
+
+The directory is indexed once at startup into a manifest of Asset records. Each
+record holds the file's bytes, an ETag derived from its contents and, for
+compressible types, gzip and brotli variants. A variant comes from a .gz or .br
+file the build placed next to the original; otherwise the file is compressed
+once here and the result is kept. Requests are then answered without touching
+the disk or compressing anything.
+
+Vite puts a content hash into the names of everything under assets/, so those
+files never change under the same URL and are sent with an immutable, one year
+Cache-Control. Everything else (index.html, files copied from public/) must be
+revalidated, which costs a 304 when it has not changed.
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+from werkzeug.wsgi import wrap_file
+from flask import Response
+
+try:
+    import brotli
+except ImportError:  # Optional: without it only .br files shipped by the build are served as brotli
+    brotli = None
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# Vite's hashed file names under assets/: name-<8+ chars of hash>.ext. A file
+# copied from public/ can look the same without being hashed, so only assets/ counts
+_HASHED_NAME = re.compile(r'-[A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$')
+_COMPRESSIBLE = ('text/', 'application/javascript', 'application/json', 'image/svg+xml', 'application/xml')
+_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))  # In order of preference
+_MIN_COMPRESS_SIZE = 256  # Smaller files are not worth a Content-Encoding
+
+
+class Asset:
+    """One file of the manifest and its compressed variants."""
+    __slots__ = ('path', 'size', 'mtime', 'etag', 'mimetype', 'immutable', 'data', 'variants')
+
+    def __init__(self, path, size, mtime, etag, mimetype, immutable, data):
+        self.path = path  # Absolute path on disk
+        self.size = size
+        self.mtime = mtime
+        self.etag = etag
+        self.mimetype = mimetype
+        self.immutable = immutable  # Hashed name: cacheable forever
+        self.data = data  # File contents, None if the file is too big to keep in memory
+        self.variants = {}  # {content coding: compressed bytes}
+
+
+class StaticAssets:
+    """
+    The manifest of a static directory. load() (re)builds it; response() answers
+    a GET for one of its files, or returns None for a path it does not know.
+    """
+
+    def __init__(self, root, max_cached_bytes=1 << 20):
+        self.root = os.path.abspath(root)
+        self.max_cached_bytes = max_cached_bytes
+        self.assets = {}  # {URL path relative to the root: Asset}
+
+    def load(self):
+        """Indexes every file under the root. A missing root gives an empty manifest."""
+        assets = {}
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(directory, name)
+                relative = os.path.relpath(path, self.root).replace(os.sep, '/')
+                if any(relative.endswith(suffix) for _, suffix in _ENCODINGS) and \
+                        os.path.exists(path[:-len(os.path.splitext(path)[1])]):
+                    continue  # A precompressed variant, attached to its original below
+                assets[relative] = self._load_asset(path, relative)
+        self.assets = assets
+        return assets
+
+    def _load_asset(self, path, relative):
+        stat = os.stat(path)
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        data = None
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            if stat.st_size <= self.max_cached_bytes:
+                data = f.read()
+                digest.update(data)
+            else:
+                for chunk in iter(lambda: f.read(1 << 16), b''):
+                    digest.update(chunk)
+        asset = Asset(
+            path, stat.st_size, int(stat.st_mtime), digest.hexdigest()[:20], mimetype,
+            relative.startswith('assets/') and bool(_HASHED_NAME.search(relative)), data,
+        )
+        if data is not None and len(data) >= _MIN_COMPRESS_SIZE and mimetype.startswith(_COMPRESSIBLE):
+            for coding, suffix in _ENCODINGS:
+                if os.path.exists(path + suffix):
+                    with open(path + suffix, 'rb') as f:
+                        asset.variants[coding] = f.read()
+                elif coding == 'gzip':
+                    asset.variants[coding] = gzip.compress(data, 9, mtime=0)
+                elif brotli is not None:
+                    asset.variants[coding] = brotli.compress(data)
+            # Drop variants that do not actually save anything
+            asset.variants = {coding: body for coding, body in asset.variants.items() if len(body) < len(data)}
+        return asset
+
+    def response(self, path, request):
+        """Builds the response to a GET or HEAD of path, honouring ETags and Range requests."""
+        asset = self.assets.get(path)
+        if asset is None:
+            return None
+
+        coding = None
+        if asset.variants and not request.range:  # Ranges always refer to the uncompressed file
+            accepted = request.accept_encodings
+            coding = next((coding for coding, _ in _ENCODINGS if coding in asset.variants and accepted[coding]), None)
+
+        if coding is not None:
+            body = asset.variants[coding]
+            response = Response(body, mimetype=asset.mimetype)
+            response.content_encoding = coding
+            response.set_etag(f'{asset.etag}-{coding}')
+        elif asset.data is not None:
+            body = asset.data
+            response = Response(body, mimetype=asset.mimetype)
+            response.set_etag(asset.etag)
+        else:
+            response = Response(wrap_file(request.environ, open(asset.path, 'rb')),
+                                mimetype=asset.mimetype, direct_passthrough=True)
+            response.content_length = asset.size
+            response.set_etag(asset.etag)
+        if asset.variants:
+            response.vary.add('Accept-Encoding')
+        response.last_modified = asset.mtime
+        if asset.immutable:
+            response.cache_control.public = True
+            response.cache_control.max_age = IMMUTABLE_MAX_AGE
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.no_cache = True
+        return response.make_conditional(
+            request, accept_ranges=coding is None,
+            complete_length=asset.size if coding is None else None,
+        )
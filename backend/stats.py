@@ -0,0 +1,140 @@
+"""
+Sliding-window statistics for the dashboard.
+
+A WindowCounter splits its window into a fixed ring of buckets and keeps a
+running total, so counting an event and reading the total are O(1); buckets
+that fell out of the window are cleared as time moves on, each at most once.
+The window covers the current, partially filled bucket and the buckets before
+it, so a rate read from it can be off by up to one bucket's share.
+
+StatsEngine keeps one counter for all device messages, one per device for its
+button presses, and one each for connects and disconnects. Recording an event
+never looks at other devices; the per-device counters are only ranked when a
+snapshot is taken, which the owner does at a fixed tick.
+"""
+
+import heapq
+import threading
+import time
+
+
+class WindowCounter:
+    """Events counted over the last `window` seconds, in `buckets` buckets."""
+    __slots__ = ('width', 'counts', 'total', 'newest')
+
+    def __init__(self, window, buckets):
+        self.width = window / buckets  # Seconds per bucket
+        self.counts = [0] * buckets
+        self.total = 0
+        self.newest = None  # Absolute index of the newest bucket
+
+    def add(self, now, amount=1):
+        index = int(now // self.width)
+        self._advance(index)
+        self.counts[index % len(self.counts)] += amount
+        self.total += amount
+
+    def value(self, now):
+        """Returns the number of events in the window ending at now."""
+        self._advance(int(now // self.width))
+        return self.total
+
+    def _advance(self, index):
+        if self.newest is None:
+            self.newest = index
+            return
+        steps = index - self.newest
+        if steps <= 0:
+            return
+        counts = self.counts
+        if steps >= len(counts):
+            counts[:] = [0] * len(counts)
+            self.total = 0
+        else:
+            for step in range(1, steps + 1):
+                slot = (self.newest + step) % len(counts)
+                self.total -= counts[slot]
+                counts[slot] = 0
+        self.newest = index
+
+
+class StatsEngine:
+    """Windowed message, press and connection rates, and the noisiest devices."""
+
+    def __init__(self, message_window=10, press_window=60, churn_window=60, buckets=10, clock=time.monotonic):
+        self.message_window = message_window  # Seconds
+        self.press_window = press_window
+        self.churn_window = churn_window
+        self.buckets = buckets
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._messages = WindowCounter(message_window, buckets)
+        self._presses = WindowCounter(press_window, buckets)
+        self._device_presses = {}  # {device_id: WindowCounter}, dropped once empty
+        self._connects = WindowCounter(churn_window, buckets)
+        self._disconnects = WindowCounter(churn_window, buckets)
+
+    def record_message(self):
+        with self._lock:
+            self._messages.add(self._clock())
+
+    def record_press(self, device_id):
+        now = self._clock()
+        with self._lock:
+            self._presses.add(now)
+            counter = self._device_presses.get(device_id)
+            if counter is None:
+                counter = self._device_presses[device_id] = WindowCounter(self.press_window, self.buckets)
+            counter.add(now)
+
+    def record_connect(self):
+        with self._lock:
+            self._connects.add(self._clock())
+
+    def record_disconnect(self):
+        with self._lock:
+            self._disconnects.add(self._clock())
+
+    def forget(self, device_id):
+        """Drops a device's press counter, e.g. when the device is deleted."""
+        with self._lock:
+            self._device_presses.pop(device_id, None)
+
+    def snapshot(self, top=5):
+        """
+        Returns the current rates, per minute except messages_per_s, and the `top`
+        devices with the most presses in the window as [[device_id, presses per minute]].
+        """
+        now = self._clock()
+        with self._lock:
+            device_presses = []
+            for device_id, counter in list(self._device_presses.items()):
+                presses = counter.value(now)
+                if presses:
+                    device_presses.append((presses, device_id))
+                else:
+                    del self._device_presses[device_id]
+            per_minute = 60.0 / self.press_window
+            churn_per_minute = 60.0 / self.churn_window
+            return {
+                'messages_per_s': round(self._messages.value(now) / self.message_window, 1),
+                'presses_per_min': round(self._presses.value(now) * per_minute, 1),
+                'connects_per_min': round(self._connects.value(now) * churn_per_minute, 1),
+                'disconnects_per_min': round(self._disconnects.value(now) * churn_per_minute, 1),
+                'noisiest': [
+                    [device_id, round(presses * per_minute, 1)]
+                    for presses, device_id in heapq.nlargest(top, device_presses)
+                ],
+            }
+
+
+def merge_snapshots(snapshots, top=5):
+    """Combines the snapshots of several processes: rates add up, the noisiest devices are re-ranked."""
+    merged = {'messages_per_s': 0.0, 'presses_per_min': 0.0, 'connects_per_min': 0.0, 'disconnects_per_min': 0.0}
+    noisiest = []
+    for snapshot in snapshots:
+        for key in merged:
+            merged[key] = round(merged[key] + snapshot[key], 1)
+        noisiest.extend(snapshot['noisiest'])
+    merged['noisiest'] = heapq.nlargest(top, noisiest, key=lambda entry: entry[1])
+    return merged
@@ -0,0 +1,136 @@
+"""Tests for the device protocol framers in framing.py."""
+
+import json
+
+import pytest
+
+import wire
+from framing import DEFAULT_MAX_FRAME_LENGTH, BinaryFramer, LineFramer, NegotiatingFramer
+
+
+class ChunkSocket:
+    """Returns the given chunks from successive recv_into() calls, then b'' (peer closed)."""
+
+    def __init__(self, chunks):
+        self._chunks = list(chunks)
+
+    def recv_into(self, buffer, nbytes):
+        if not self._chunks:
+            return 0
+        chunk = self._chunks.pop(0)
+        assert len(chunk) <= nbytes, 'test chunk larger than recv_size'
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+
+def recv_all(framer, chunks):
+    """Reads every chunk through recv_from(), popping frames after each read like the ingest loop."""
+    sock = ChunkSocket(chunks)
+    frames = []
+    while framer.recv_from(sock):
+        frames.extend(framer.pop_frames())
+    return frames
+
+
+def feed_all(framer, chunks):
+    frames = []
+    for chunk in chunks:
+        framer.feed(chunk)
+        frames.extend(framer.pop_frames())
+    return frames
+
+
+@pytest.fixture(params=[recv_all, feed_all], ids=['recv_from', 'feed'])
+def read(request):
+    return request.param
+
+
+@pytest.fixture(params=[LineFramer, NegotiatingFramer])
+def line_framer(request):
+    return request.param
+
+
+def test_frame_split_across_reads(read, line_framer):
+    framer = line_framer(64, 16)
+    frames = read(framer, [b'{"type":"butt', b'on_press"}', b'\n'])
+    assert frames == ['{"type":"button_press"}']
+
+
+def test_code_point_split_across_reads(read, line_framer):
+    message = '{"type":"log","text":"café ☃"}\n'.encode('utf-8')
+    split = message.index('☃'.encode('utf-8')) + 1  # Inside the three-byte snowman
+    framer = line_framer(64, 64)
+    frames = read(framer, [message[:split], message[split:]])
+    assert frames == ['{"type":"log","text":"café ☃"}']
+    assert json.loads(frames[0])['text'] == 'café ☃'
+
+
+def test_several_frames_in_one_chunk(read, line_framer):
+    framer = line_framer(64, 128)
+    frames = read(framer, [b'{"a":1}\n{"b":2}\r\n\n{"c":3}\n{"d"'])
+    assert frames == ['{"a":1}', '{"b":2}', '{"c":3}']
+    assert read(framer, [b':4}\n']) == ['{"d":4}']
+
+
+def test_oversized_frame_is_dropped_and_counted(read, line_framer):
+    framer = line_framer(32, 16)
+    oversized = b'{"x":"' + b'y' * 60 + b'"}\n'
+    chunks = [oversized[i:i + 16] for i in range(0, len(oversized), 16)] + [b'{"ok":1}\n']
+    assert read(framer, chunks) == ['{"ok":1}']
+    assert framer.oversized_frames == 1
+
+
+def test_oversized_frame_at_default_limit(read):
+    framer = LineFramer()
+    oversized = b'x' * (DEFAULT_MAX_FRAME_LENGTH + 1) + b'\n'
+    chunks = [oversized[i:i + 4096] for i in range(0, len(oversized), 4096)]
+    assert read(framer, chunks + [b'{"ok":1}\n']) == ['{"ok":1}']
+    assert framer.oversized_frames == 1
+
+
+def test_frame_at_limit_is_kept(read):
+    framer = LineFramer(32, 64)
+    frame = b'z' * 32
+    assert read(framer, [frame + b'\n']) == [frame.decode()]
+    assert framer.oversized_frames == 0
+
+
+def test_feed_larger_than_buffer():
+    framer = LineFramer(16, 16)
+    data = b''.join(b'{"n":%d}\n' % i for i in range(50))
+    framer.feed(data)
+    assert framer.pop_frames() == ['{"n":%d}' % i for i in range(50)]
+
+
+def binary_stream(*frames):
+    return bytes([wire.MAGIC]) + b''.join(frames)
+
+
+def test_binary_frame_split_across_reads(read):
+    stream = binary_stream(wire.encode_binary('button_press', 7, {'count': 3}))
+    framer = NegotiatingFramer(64, 16)
+    frames = read(framer, [stream[:1], stream[1:3], stream[3:]])
+    assert framer.binary is True
+    assert len(frames) == 1
+    event = wire.decode_binary(frames[0])
+    assert (event.type, event.seq, event.fields) == ('button_press', 7, {'count': 3})
+
+
+def test_binary_several_frames_and_oversized(read):
+    stream = binary_stream(
+        wire.encode_binary('connection', 1, {'mac': 'AA'}),
+        wire.encode_binary('connection', 2, {'mac': 'x' * 100}),
+        wire.encode_binary('button_press', 3),
+    )
+    framer = NegotiatingFramer(64, 256)
+    frames = read(framer, [stream])
+    assert [(wire.TYPE_NAMES[code], seq) for code, seq, _ in frames] == [('connection', 1), ('button_press', 3)]
+    assert framer.oversized_frames == 1
+
+
+def test_binary_oversized_frame_skipped_across_reads(read):
+    stream = wire.encode_binary('connection', 1, {'mac': 'x' * 100}) + wire.encode_binary('button_press', 2)
+    framer = BinaryFramer(64, 16)
+    chunks = [stream[i:i + 16] for i in range(0, len(stream), 16)]
+    assert [seq for _, seq, _ in read(framer, chunks)] == [2]
+    assert framer.oversized_frames == 1
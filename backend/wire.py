@@ -0,0 +1,258 @@
+"""
+Device message formats and the event objects both of them decode into.
+
+Devices speak one of two formats, chosen per connection (see framing.py):
+
+- JSON: one object per line, e.g. {"type": "button_press"}.
+- Binary: a stream that starts with the MAGIC byte, followed by frames made of
+  a fixed HEADER (body length, type code, sequence number; network byte
+  order) and an optional body. The body is a MessagePack map holding the
+  fields that JSON carries next to "type"; an empty body means no fields, so
+  a button press is 5 bytes instead of 24.
+
+Only the subset of MessagePack a device needs is supported: nil, booleans,
+integers, floats, strings, binary, arrays and maps.
+"""
+
+import json
+import struct
+
+MAGIC = 0xB7  # First byte of a binary stream; a JSON stream starts with '{' or whitespace
+HEADER = struct.Struct('!HBH')  # Body length, type code, sequence number
+
+# Type codes of the binary format. JSON uses the names.
+TYPE_CODES = {
+    'connection': 1,
+    'button_press': 2,
+    'pong': 3,  # Answer to the server's {"type": "ping", "seq": n}; seq goes in the header
+}
+TYPE_NAMES = {code: name for name, code in TYPE_CODES.items()}
+
+
+class DeviceEvent:
+    """One decoded device message, whichever format it arrived in."""
+    __slots__ = ('type', 'seq', 'fields')
+
+    def __init__(self, type, seq=None, fields=None):
+        self.type = type
+        self.seq = seq  # Sender's sequence number, None if the message had none
+        self.fields = fields if fields is not None else {}
+
+    def get(self, key, default=None):
+        return self.fields.get(key, default)
+
+    def __repr__(self):
+        return f'DeviceEvent({self.type!r}, seq={self.seq!r}, fields={self.fields!r})'
+
+
+def decode_json(text):
+    """Decodes one JSON frame. Raises ValueError if it is not a JSON object."""
+    data = json.loads(text)
+    if not isinstance(data, dict):
+        raise ValueError("Device message is not a JSON object")
+    message_type = data.pop('type', 'unknown')
+    seq = data.pop('seq', None)
+    return DeviceEvent(message_type, seq, data)
+
+
+def decode_binary(frame):
+    """
+    Decodes one binary frame, given as (type code, seq, body bytes). Raises
+    ValueError if the body is not a valid MessagePack map.
+    """
+    type_code, seq, body = frame
+    message_type = TYPE_NAMES.get(type_code, f'unknown:{type_code}')
+    if not body:
+        return DeviceEvent(message_type, seq)
+    fields, end = _unpack(body, 0)
+    if end != len(body) or not isinstance(fields, dict):
+        raise ValueError("Binary message body is not a single MessagePack map")
+    return DeviceEvent(message_type, seq, fields)
+
+
+def encode_binary(message_type, seq=0, fields=None):
+    """Encodes one binary frame, the way a device sends it. Used by simulators and benchmarks."""
+    body = packb(fields) if fields else b''
+    return HEADER.pack(len(body), TYPE_CODES[message_type], seq & 0xFFFF) + body
+
+
+# -----------------------------------------------------------------------------
+# MessagePack subset
+# -----------------------------------------------------------------------------
+
+_FIXED = {
+    0xC0: None,
+    0xC2: False,
+    0xC3: True,
+}
+# Type byte: layout of a fixed-width number
+_NUMBERS = {
+    0xCA: struct.Struct('!f'), 0xCB: struct.Struct('!d'),
+    0xCC: struct.Struct('!B'), 0xCD: struct.Struct('!H'), 0xCE: struct.Struct('!I'), 0xCF: struct.Struct('!Q'),
+    0xD0: struct.Struct('!b'), 0xD1: struct.Struct('!h'), 0xD2: struct.Struct('!i'), 0xD3: struct.Struct('!q'),
+}
+# Type byte: width of the length prefix of strings, binary data, arrays and maps
+_LENGTHS = {
+    0xD9: struct.Struct('!B'), 0xDA: struct.Struct('!H'), 0xDB: struct.Struct('!I'),  # str
+    0xC4: struct.Struct('!B'), 0xC5: struct.Struct('!H'), 0xC6: struct.Struct('!I'),  # bin
+    0xDC: struct.Struct('!H'), 0xDD: struct.Struct('!I'),  # array
+    0xDE: struct.Struct('!H'), 0xDF: struct.Struct('!I'),  # map
+}
+_STR, _BIN, _ARRAY, _MAP = range(4)
+_LENGTH_KINDS = {
+    0xD9: _STR, 0xDA: _STR, 0xDB: _STR,
+    0xC4: _BIN, 0xC5: _BIN, 0xC6: _BIN,
+    0xDC: _ARRAY, 0xDD: _ARRAY,
+    0xDE: _MAP, 0xDF: _MAP,
+}
+
+
+def unpackb(data):
+    """Decodes a single MessagePack value. Raises ValueError."""
+    value, end = _unpack(data, 0)
+    if end != len(data):
+        raise ValueError("Trailing bytes after MessagePack value")
+    return value
+
+
+def _unpack(data, offset):
+    try:
+        byte = data[offset]
+    except IndexError:
+        raise ValueError("Truncated MessagePack value") from None
+    offset += 1
+    if byte <= 0x7F:
+        return byte, offset
+    if byte >= 0xE0:
+        return byte - 0x100, offset
+    if 0xA0 <= byte <= 0xBF:
+        return _unpack_str(data, offset, byte & 0x1F)
+    if 0x90 <= byte <= 0x9F:
+        return _unpack_array(data, offset, byte & 0x0F)
+    if 0x80 <= byte <= 0x8F:
+        return _unpack_map(data, offset, byte & 0x0F)
+    if byte in _FIXED:
+        return _FIXED[byte], offset
+    try:
+        if byte in _NUMBERS:
+            number = _NUMBERS[byte]
+            return number.unpack_from(data, offset)[0], offset + number.size
+        if byte in _LENGTHS:
+            prefix = _LENGTHS[byte]
+            length = prefix.unpack_from(data, offset)[0]
+            offset += prefix.size
+            kind = _LENGTH_KINDS[byte]
+            if kind == _STR:
+                return _unpack_str(data, offset, length)
+            if kind == _BIN:
+                return bytes(_take(data, offset, length)), offset + length
+            if kind == _ARRAY:
+                return _unpack_array(data, offset, length)
+            return _unpack_map(data, offset, length)
+    except struct.error:
+        raise ValueError("Truncated MessagePack value") from None
+    raise ValueError(f"Unsupported MessagePack type byte 0x{byte:02x}")
+
+
+def _take(data, offset, length):
+    if offset + length > len(data):
+        raise ValueError("Truncated MessagePack value")
+    return data[offset:offset + length]
+
+
+def _unpack_str(data, offset, length):
+    try:
+        return str(_take(data, offset, length), 'utf-8'), offset + length
+    except UnicodeDecodeError:
+        raise ValueError("Invalid UTF-8 in MessagePack string") from None
+
+
+def _unpack_array(data, offset, length):
+    items = []
+    for _ in range(length):
+        item, offset = _unpack(data, offset)
+        items.append(item)
+    return items, offset
+
+
+def _unpack_map(data, offset, length):
+    result = {}
+    for _ in range(length):
+        key, offset = _unpack(data, offset)
+        value, offset = _unpack(data, offset)
+        try:
+            result[key] = value
+        except TypeError:
+            raise ValueError("Unhashable MessagePack map key") from None
+    return result, offset
+
+
+def packb(value):
+    """Encodes a value with the MessagePack subset above."""
+    out = bytearray()
+    _pack(value, out)
+    return bytes(out)
+
+
+def _pack(value, out):
+    if value is None or isinstance(value, bool):
+        out.append(0xC0 if value is None else 0xC3 if value else 0xC2)
+    elif isinstance(value, int):
+        _pack_int(value, out)
+    elif isinstance(value, float):
+        out.append(0xCB)
+        out += struct.pack('!d', value)
+    elif isinstance(value, str):
+        encoded = value.encode('utf-8')
+        _pack_length(len(encoded), out, 0xA0, 31, (0xD9, 0xDA, 0xDB))
+        out += encoded
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        _pack_length(len(value), out, None, 0, (0xC4, 0xC5, 0xC6))
+        out += value
+    elif isinstance(value, (list, tuple)):
+        _pack_length(len(value), out, 0x90, 15, (None, 0xDC, 0xDD))
+        for item in value:
+            _pack(item, out)
+    elif isinstance(value, dict):
+        _pack_length(len(value), out, 0x80, 15, (None, 0xDE, 0xDF))
+        for key, item in value.items():
+            _pack(key, out)
+            _pack(item, out)
+    else:
+        raise TypeError(f"Cannot encode {type(value).__name__} as MessagePack")
+
+
+def _pack_int(value, out):
+    if 0 <= value <= 0x7F:
+        out.append(value)
+    elif -32 <= value < 0:
+        out.append(value + 0x100)
+    elif value >= 0:
+        for type_byte in (0xCC, 0xCD, 0xCE, 0xCF):
+            number = _NUMBERS[type_byte]
+            if value < 1 << (8 * number.size):
+                out.append(type_byte)
+                out += number.pack(value)
+                return
+        raise OverflowError("Integer too large for MessagePack")
+    else:
+        for type_byte in (0xD0, 0xD1, 0xD2, 0xD3):
+            number = _NUMBERS[type_byte]
+            if value >= -(1 << (8 * number.size - 1)):
+                out.append(type_byte)
+                out += number.pack(value)
+                return
+        raise OverflowError("Integer too small for MessagePack")
+
+
+def _pack_length(length, out, fix_base, fix_max, type_bytes):
+    """Writes the type byte and length of a string, binary value, array or map."""
+    if fix_base is not None and length <= fix_max:
+        out.append(fix_base | length)
+        return
+    for type_byte, limit in zip(type_bytes, (0xFF, 0xFFFF, 0xFFFFFFFF)):
+        if type_byte is not None and length <= limit:
+            out.append(type_byte)
+            out += _LENGTHS[type_byte].pack(length)
+            return
+    raise OverflowError("Value too long for MessagePack")
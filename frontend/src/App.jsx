@@ -21,15 +21,37 @@ const soundMap = Object.fromEntries(
 const soundFiles = Object.keys(soundMap);
 
 
-// Establish a single socket connection
-const socket = io();
+// Sequence number of the newest log entry received. Sent on (re)connect so
+// the server only replays the log entries this page has missed.
+let lastLogSeq = 0;
+
+// A control-room screen watches only some devices: open the page as
+// /?zones=north,east&tags=icu to subscribe to those zones and tags.
+const pageParams = new URLSearchParams(window.location.search);
+const subscription = {
+  zones: (pageParams.get('zones') || '').split(',').filter(Boolean),
+  tags: (pageParams.get('tags') || '').split(',').filter(Boolean),
+};
+
+// Establish a single socket connection. WebSocket only: with several backend
+// workers sharing the port, the long-polling requests of one session could
+// each land on a different worker.
+const socket = io({
+  transports: ['websocket'],
+  auth: (cb) => cb(lastLogSeq > 0 ? { ...subscription, log_since: lastLogSeq } : subscription),
+});
 
 function App() {
   const [dashboardStatus, setDashboardStatus] = useState({
     server_running: false,
     client_count: 0,
     message_count: 0,
-    last_activity: "N/A"
+    last_activity: "N/A",
+    messages_per_s: 0,
+    presses_per_min: 0,
+    connects_per_min: 0,
+    disconnects_per_min: 0,
+    noisiest: []
   });
   const [clients, setClients] = useState([]);
   const [leds, setLeds] = useState({});
@@ -45,6 +67,9 @@ function App() {
   });
 
   const audioRef = useRef(null);
+  // Latest client list and per-device change versions, used to apply 'device_changed' deltas
+  const clientsRef = useRef([]);
+  const versionsRef = useRef({});
 
   const stopSound = () => {
     if (audioRef.current) {
@@ -59,8 +84,8 @@ function App() {
   }, [globalSound]);
   
   useEffect(() => {
-    const handleUpdateClients = (clientList) => {
-     console.log("Received updated client list:", clientList);
+    const applyClientList = (clientList) => {
+      clientsRef.current = clientList;
       setClients(clientList);
       
       setAlarmingClientId((prevAlarming) => {
@@ -74,6 +99,49 @@ function App() {
         return isStillAlarming ? prevAlarming : null;
       });
     };
+
+    const handleUpdateClients = (clientList) => {
+     console.log("Received updated client list:", clientList);
+      versionsRef.current = Object.fromEntries(clientList.map(c => [c.id, c.version || 0]));
+      applyClientList(clientList);
+    };
+
+    const handleDeviceChanged = (changes) => {
+      let nextClients = clientsRef.current;
+      const ledUpdates = {};
+      const removedIds = [];
+
+      changes.forEach((change) => {
+        // Skip deltas already contained in the last snapshot
+        if (change.version <= (versionsRef.current[change.id] || 0)) return;
+        versionsRef.current[change.id] = change.version;
+
+        if (change.removed) {
+          nextClients = nextClients.filter(c => c.id !== change.id);
+          removedIds.push(change.id);
+          return;
+        }
+
+        const index = nextClients.findIndex(c => c.id === change.id);
+        if (index === -1) {
+          nextClients = [...nextClients, { id: change.id, ...change.fields }];
+        } else {
+          nextClients = nextClients.slice();
+          nextClients[index] = { ...nextClients[index], ...change.fields };
+        }
+        if (change.fields.led_state) {
+          ledUpdates[change.id] = change.fields.led_state;
+        }
+      });
+
+      if (nextClients === clientsRef.current) return;
+      applyClientList(nextClients);
+      setLeds((prev) => {
+        const next = { ...prev, ...ledUpdates };
+        removedIds.forEach(id => delete next[id]);
+        return next;
+      });
+    };
   
     const handleUpdateDashboard = (status) => {
       setDashboardStatus(status);
@@ -98,8 +166,21 @@ function App() {
         setAlarmingClientId(null);
     };
 
-    const handleNewLog = (log) => setLogs(prev => [...prev, log]);
-    const handleAllLogs = (allLogs) => setLogs(allLogs);
+    const handleNewLog = (log) => {
+      if (log.seq <= lastLogSeq) return;
+      lastLogSeq = log.seq;
+      setLogs(prev => [...prev, log]);
+    };
+    const handleAllLogs = (allLogs) => {
+      lastLogSeq = allLogs.length ? allLogs[allLogs.length - 1].seq : 0;
+      setLogs(allLogs);
+    };
+    const handleMissedLogs = (missedLogs) => {
+      const fresh = missedLogs.filter(log => log.seq > lastLogSeq);
+      if (!fresh.length) return;
+      lastLogSeq = fresh[fresh.length - 1].seq;
+      setLogs(prev => [...prev, ...fresh]);
+    };
 
     const handleDisconnect = () => {
       console.log('Socket disconnected from server.');
@@ -108,9 +189,11 @@ function App() {
   
     socket.on('all_logs', handleAllLogs);
     socket.on('new_log', handleNewLog);
+    socket.on('missed_logs', handleMissedLogs);
     socket.on('update_dashboard', handleUpdateDashboard);    
     socket.on('update_clients', handleUpdateClients);
     socket.on('update_leds', handleUpdateLeds);
+    socket.on('device_changed', handleDeviceChanged);
     socket.on('play_sound_on_frontend', handlePlaySoundOnFrontend);
     socket.on('stop_all_sounds_on_frontend', handleStopAllSounds);
     socket.on('disconnect', handleDisconnect);
@@ -118,9 +201,11 @@ function App() {
     return () => {
       socket.off('all_logs', handleAllLogs);
       socket.off('new_log', handleNewLog);
+      socket.off('missed_logs', handleMissedLogs);
       socket.off('update_dashboard', handleUpdateDashboard);
       socket.off('update_clients', handleUpdateClients);
       socket.off('update_leds', handleUpdateLeds);
+      socket.off('device_changed', handleDeviceChanged);
       socket.off('play_sound_on_frontend', handlePlaySoundOnFrontend);
       socket.off('stop_all_sounds_on_frontend', handleStopAllSounds);
       socket.off('disconnect', handleDisconnect);
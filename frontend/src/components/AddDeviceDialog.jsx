@@ -6,6 +6,8 @@ const AddDeviceDialog = ({ onClose, onDeviceAdded, device }) => {
     const [name, setName] = useState('');
     const [ip, setIp] = useState('');
     const [mac, setMac] = useState('');
+    const [zone, setZone] = useState('');
+    const [tags, setTags] = useState('');
 
     const isEditMode = device != null;
 
@@ -14,6 +16,8 @@ const AddDeviceDialog = ({ onClose, onDeviceAdded, device }) => {
             setName(device.name);
             setIp(device.ip);
             setMac(device.mac || '');
+            setZone(device.zone || '');
+            setTags((device.tags || []).join(', '));
         }
     }, [device, isEditMode]);
 
@@ -36,7 +40,7 @@ const AddDeviceDialog = ({ onClose, onDeviceAdded, device }) => {
                 headers: {
                     'Content-Type': 'application/json',
                 },
-                body: JSON.stringify({ name, ip, mac }),
+                body: JSON.stringify({ name, ip, mac, zone, tags }),
             });
 
             if (response.ok) {
@@ -87,6 +91,24 @@ const AddDeviceDialog = ({ onClose, onDeviceAdded, device }) => {
                             onChange={(e) => setMac(e.target.value)}
                         />
                     </div>
+                    <div className="form-group">
+                        <label htmlFor="zone">Zone (Optional)</label>
+                        <input
+                            type="text"
+                            id="zone"
+                            value={zone}
+                            onChange={(e) => setZone(e.target.value)}
+                        />
+                    </div>
+                    <div className="form-group">
+                        <label htmlFor="tags">Tags (Optional, comma-separated)</label>
+                        <input
+                            type="text"
+                            id="tags"
+                            value={tags}
+                            onChange={(e) => setTags(e.target.value)}
+                        />
+                    </div>
                     <div className="form-actions">
                         <button type="submit" className="btn-primary">
                             {isEditMode ? 'update' : 'Save'}
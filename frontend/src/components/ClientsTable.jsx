@@ -22,7 +22,9 @@ const ClientsTable = ({ clients, activeClientId, onClientSelect, alarmingClientI
               <th>Name</th>
               <th>IP Address</th>
               <th>MAC Address</th>
+              <th>Zone</th>
               <th>Status</th>
+              <th>Link</th>
             </tr>
           </thead>
           <tbody>
@@ -37,14 +39,19 @@ const ClientsTable = ({ clients, activeClientId, onClientSelect, alarmingClientI
                   <td>{client.name}</td>
                   <td>{client.ip}</td>
                   <td>{client.mac || 'N/A'}</td>
+                  <td>{client.zone || '-'}{client.tags && client.tags.length > 0 ? ` (${client.tags.join(', ')})` : ''}</td>
                   <td className={`status-${client.led_state}`}>
                     {client.led_state}
                   </td>
+                  <td className={client.link ? `link-${client.link}` : ''} title="Heartbeat round-trip time, p50 / p95">
+                    {client.rtt_p50_ms != null ? `${client.rtt_p50_ms} / ${client.rtt_p95_ms} ms` : '-'}
+                    {client.link && client.link !== 'ok' ? ` (${client.link})` : ''}
+                  </td>
                 </tr>
               ))
             ) : (
               <tr>
-                <td colSpan="5" className="no-clients-message">No devices registered.</td>
+                <td colSpan="7" className="no-clients-message">No devices registered.</td>
               </tr>
             )}
           </tbody>
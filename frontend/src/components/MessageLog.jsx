@@ -17,8 +17,8 @@ const MessageLog = ({ logs }) => {
       <h3>Message Log</h3>
       <div ref={logContainerRef} className="log-container">
         {/* Render logs in reverse to show newest first at the bottom */}
-        {[...logs].reverse().map((log, index) => (
-          <div key={index} className="log-entry">
+        {[...logs].reverse().map((log) => (
+          <div key={log.seq} className="log-entry">
             <span className="log-meta">[{log.timestamp}]</span>
             <span className={`log-message type-${log.type}`}>
               {log.message}
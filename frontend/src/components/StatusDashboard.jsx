@@ -24,6 +24,28 @@ const StatusDashboard = ({ status }) => {
 
         <span className="status-label">Last Activity:</span>
         <span className="status-value">{status.last_activity}</span>
+
+        <span className="status-label">Messages / s:</span>
+        <span className="status-value">{status.messages_per_s}</span>
+
+        <span className="status-label">Presses / min:</span>
+        <span className="status-value">{status.presses_per_min}</span>
+
+        <span className="status-label">Connects / min:</span>
+        <span className="status-value">
+          {status.connects_per_min} in, {status.disconnects_per_min} out
+        </span>
+
+        <span className="status-label">Noisiest Devices:</span>
+        <span className="status-value">
+          {status.noisiest && status.noisiest.length > 0 ? (
+            <ul className="noisiest-list">
+              {status.noisiest.map((device) => (
+                <li key={device.id}>{device.name || `#${device.id}`}: {device.presses_per_min}/min</li>
+              ))}
+            </ul>
+          ) : '-'}
+        </span>
       </div>
     </div>
   );